@@ -0,0 +1,266 @@
+import json
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import knowledge_base
+from cohort_engine import group_by_sample
+from confidence import compute_confidence
+from diplotype_engine import resolve_diplotype
+from drug_risk_engine import assess_drug_risk
+from knowledge_base import KnowledgeBase
+from phenotype_engine import infer_phenotype
+from vcf_parser import VCFStreamParser
+
+# ── Offline batch ─────────────────────────────────────────────────────────────
+# Reprocess an archive of VCFs without the HTTP layer: every file is parsed
+# once, every sample × drug becomes one JSONL line, files run in parallel
+# worker processes. Output is written in input order; after each file a
+# checkpoint line records the output size, so an interrupted run resumes
+# exactly where it stopped (partial output past the checkpoint is truncated).
+# Files that produced an error record are checkpointed as failed and tried
+# again on resume — a read error may be transient (a file still being copied);
+# their error lines are dropped from the output first.
+
+VCF_SUFFIXES = (".vcf", ".vcf.gz", ".vcf.bgz")
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def find_inputs(sources: List[str], manifest: Optional[str] = None) -> List[str]:
+    """VCF paths from files/directories (searched recursively) and a manifest, deduplicated."""
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                paths.extend(os.path.join(root, f) for f in sorted(files) if f.endswith(VCF_SUFFIXES))
+        else:
+            paths.append(source)
+
+    if manifest:
+        # One path per line, relative to the manifest; blank lines and # comments ignored
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    paths.append(os.path.join(base, line))
+
+    seen = set()
+    return [p for p in paths if not (p in seen or seen.add(p))]
+
+
+def analyze_file(path: str, drugs: List[str], kb: Optional[KnowledgeBase] = None) -> List[Dict]:
+    """
+    One result per sample × drug of a VCF on disk, or a single error record.
+    Any failure is reported per file, so one bad archive member cannot end
+    the run.
+    """
+    kb = kb or knowledge_base.current()
+    try:
+        return _analyze_file(path, drugs, kb)
+    except (OSError, ValueError) as e:
+        return [{"file": path, "error": str(e)}]
+    except Exception as e:
+        return [{"file": path, "error": f"{type(e).__name__}: {e}"}]
+
+
+def _analyze_file(path: str, drugs: List[str], kb: KnowledgeBase) -> List[Dict]:
+    parser = VCFStreamParser(kb=kb)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+            parser.feed(chunk)
+    variants = parser.close()
+
+    by_sample = group_by_sample(variants)
+    results = []
+    for sample in variants.samples:
+        sample_variants = by_sample.get(sample, [])
+        for drug in drugs:
+            results.append(_result(path, sample, drug, sample_variants, kb))
+    return results
+
+
+def run(
+    inputs: List[str],
+    drugs: List[str],
+    out_path: str,
+    checkpoint: Optional[str] = None,
+    workers: int = 1,
+    kb: Optional[KnowledgeBase] = None,
+    resume: bool = False,
+) -> Tuple[int, int]:
+    """
+    Analyze `inputs` into the JSONL file `out_path`. With `resume`, files
+    recorded in `checkpoint` as finished are skipped and output is appended;
+    otherwise the output and checkpoint start empty. Returns (files
+    processed, lines written). The whole run uses one knowledge-base version
+    (`kb`, default the active one).
+    """
+    kb = kb or knowledge_base.current()
+    done: Set[str] = set()
+    if resume and checkpoint:
+        done = _resume(out_path, checkpoint)
+    elif checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    todo = [p for p in inputs if p not in done]
+
+    out = open(out_path, "a" if resume else "w", encoding="utf-8")
+    ckpt = open(checkpoint, "a", encoding="utf-8") if checkpoint else None
+
+    files = lines = 0
+    try:
+        for path, results in _map(todo, drugs, workers, kb):
+            for r in results:
+                out.write(json.dumps(r) + "\n")
+            out.flush()
+            if ckpt is not None:
+                entry = {"file": path, "offset": out.tell()}
+                if _failed(results):
+                    entry["error"] = True
+                ckpt.write(json.dumps(entry) + "\n")
+                ckpt.flush()
+            files += 1
+            lines += len(results)
+    finally:
+        out.close()
+        if ckpt is not None:
+            ckpt.close()
+    return files, lines
+
+
+def _map(
+    paths: List[str],
+    drugs: List[str],
+    workers: int,
+    kb: KnowledgeBase,
+) -> Iterator[Tuple[str, List[Dict]]]:
+    """(path, results) in input order, keeping at most a few files per worker in flight."""
+    if workers <= 1:
+        for path in paths:
+            yield path, analyze_file(path, drugs, kb)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = deque()
+        remaining = iter(paths)
+        for path in remaining:
+            pending.append((path, pool.submit(analyze_file, path, drugs, kb)))
+            if len(pending) >= workers * 4:
+                break
+        while pending:
+            path, future = pending.popleft()
+            yield path, future.result()
+            nxt = next(remaining, None)
+            if nxt is not None:
+                pending.append((nxt, pool.submit(analyze_file, nxt, drugs, kb)))
+
+
+def _failed(results: List[Dict]) -> bool:
+    return len(results) == 1 and "error" in results[0]
+
+
+def _resume(out_path: str, checkpoint: str) -> Set[str]:
+    """
+    Files finished without error in a previous run (a later entry for the
+    same file wins). Output past the last checkpoint is discarded, and so
+    are the error lines of files that will be tried again.
+    """
+    failed: Dict[str, bool] = {}
+    offset = 0
+    if os.path.exists(checkpoint):
+        with open(checkpoint, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # torn final write
+                failed[entry["file"]] = bool(entry.get("error"))
+                offset = entry["offset"]
+
+    size = os.path.getsize(out_path) if os.path.exists(out_path) else 0
+    if offset > size:
+        # Truncating would pad with NULs, and checkpointed results are missing
+        raise ValueError(
+            f"Checkpoint {checkpoint} records {offset} bytes but {out_path} has {size}; "
+            "rerun without --resume"
+        )
+
+    done = {path for path, error in failed.items() if not error}
+    retry = {path for path, error in failed.items() if error}
+    if retry:
+        _drop_error_lines(out_path, checkpoint, offset, retry, done)
+    elif os.path.exists(out_path):
+        with open(out_path, "r+b") as f:
+            f.truncate(offset)
+    return done
+
+
+def _drop_error_lines(out_path: str, checkpoint: str, offset: int, retry: Set[str], done: Set[str]) -> None:
+    """
+    Rewrite the first `offset` bytes of the output without the error lines
+    of `retry`, then the checkpoint to match. Both are replaced atomically;
+    if only the output is, the next resume finds it shorter than the
+    checkpoint offset and refuses rather than losing lines.
+    """
+    tmp = out_path + ".tmp"
+    with open(out_path, "rb") as src, open(tmp, "wb") as dst:
+        remaining = offset
+        for line in src:
+            if remaining <= 0:
+                break
+            line = line[:remaining]
+            remaining -= len(line)
+            if b'"error"' in line and _error_file(line) in retry:
+                continue
+            dst.write(line)
+        size = dst.tell()
+    os.replace(tmp, out_path)
+
+    tmp = checkpoint + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for path in sorted(done):
+            f.write(json.dumps({"file": path, "offset": size}) + "\n")
+    os.replace(tmp, checkpoint)
+
+
+def _error_file(line: bytes) -> Optional[str]:
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    return record.get("file") if "error" in record else None
+
+
+def _result(path: str, sample: str, drug: str, variants: List[Dict], kb: KnowledgeBase) -> Dict:
+    gene = kb.drug_genes[drug]
+    base = {"file": path, "sample": sample, "drug": drug, "gene": gene, "knowledge_base_version": kb.version}
+
+    diplotype_result = resolve_diplotype(variants, gene, kb)
+    if diplotype_result is None:
+        return {
+            **base,
+            "diplotype":        "Unknown",
+            "phenotype":        "Unknown",
+            "risk_label":       "Unknown",
+            "severity":         "none",
+            "confidence_score": 0.0,
+            "action":           None,
+            "variants":         [],
+        }
+
+    phenotype = infer_phenotype(gene, diplotype_result["star_alleles"], kb)
+    confidence = compute_confidence(diplotype_result["matched_variants"])
+    risk = assess_drug_risk(drug, phenotype["phenotype_code"], confidence, kb)
+    return {
+        **base,
+        "diplotype":        diplotype_result["diplotype"],
+        "phenotype":        phenotype["phenotype_code"],
+        "risk_label":       risk["risk_label"],
+        "severity":         risk["severity"],
+        "confidence_score": risk["confidence_score"],
+        "action":           risk["action"],
+        "variants":         [v["rsid"] for v in diplotype_result["matched_variants"]],
+    }
@@ -0,0 +1,182 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import knowledge_base
+import synthetic_vcf
+from cohort_engine import group_by_sample
+from confidence import compute_confidence
+from diplotype_engine import resolve_diplotype
+from phenotype_engine import infer_phenotype
+from vcf_parser import VCFStreamParser, parse_vcf, validate_vcf_content
+
+# ── Benchmarks ────────────────────────────────────────────────────────────────
+# Times each pipeline stage on a synthetic VCF and writes the results as JSON
+# with enough context (commit, Python, CPU count, input parameters) to compare
+# runs across commits. Medians are compared; min is kept as the noise floor.
+
+FEED_CHUNK_SIZE = 64 * 1024
+# A stage more than this much slower than the baseline is flagged
+REGRESSION_THRESHOLD = 1.10
+
+
+def measure(fn: Callable[[], object], repeat: int = 5, warmup: int = 1, units: int = 1) -> Dict:
+    """Wall time of fn() over `repeat` runs after `warmup` untimed ones."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    return {
+        "runs":        repeat,
+        "min_s":       round(min(times), 6),
+        "median_s":    round(median, 6),
+        "mean_s":      round(statistics.fmean(times), 6),
+        "units":       units,
+        "units_per_s": round(units / median, 1) if median else None,
+    }
+
+
+def run(
+    records: int = 100_000,
+    pgx_fraction: float = 0.01,
+    samples: int = 1,
+    phased: bool = False,
+    repeat: int = 5,
+    api: bool = True,
+    seed: int = 0,
+    log: Callable[[str], None] = lambda msg: None,
+) -> Dict:
+    """Run every benchmark; returns the results document."""
+    kb = knowledge_base.current()
+    params = dict(records=records, pgx_fraction=pgx_fraction, samples=samples, phased=phased, seed=seed)
+    plain = synthetic_vcf.generate_bytes("none", kb=kb, **params)
+    text = plain.decode()
+    results: Dict[str, Dict] = {}
+
+    def bench(name: str, fn: Callable[[], object], units: int = 1) -> None:
+        log(f"{name} …")
+        results[name] = measure(fn, repeat=repeat, units=units)
+
+    # ── Ingest ───────────────────────────────────────────────────────
+    bench("validate_vcf_content", lambda: validate_vcf_content(text))
+    bench("parse_vcf", lambda: parse_vcf(text), units=records)
+    for compression in synthetic_vcf.COMPRESSIONS:
+        data = synthetic_vcf.compress(plain, compression)
+        bench(f"stream_parse[{compression}]", lambda data=data: _stream_parse(data, kb), units=records)
+
+    # ── Deterministic stages: every gene of every sample ────────────
+    by_sample = list(group_by_sample(_stream_parse(plain, kb)).values())
+    genes = sorted(set(kb.drug_genes.values()))
+    calls = [(g, resolve_diplotype(v, g, kb)) for v in by_sample for g in genes]
+    calls = [(g, c) for g, c in calls if c is not None]
+
+    bench(
+        "resolve_diplotype",
+        lambda: [resolve_diplotype(v, g, kb) for v in by_sample for g in genes],
+        units=len(by_sample) * len(genes),
+    )
+    bench("infer_phenotype", lambda: [infer_phenotype(g, c["star_alleles"], kb) for g, c in calls], units=len(calls))
+    bench("compute_confidence", lambda: [compute_confidence(c["matched_variants"]) for _, c in calls], units=len(calls))
+
+    # ── End to end through the ASGI app ──────────────────────────────
+    if api:
+        results.update(_api_benchmarks(plain, repeat, log))
+
+    return {
+        "meta": {
+            "timestamp":              datetime.utcnow().isoformat() + "Z",
+            "commit":                 _git_commit(),
+            "python":                 platform.python_version(),
+            "platform":               platform.platform(),
+            "cpu_count":              os.cpu_count(),
+            "knowledge_base_version": kb.version,
+            "params":                 {**params, "repeat": repeat, "bytes": len(plain)},
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: Dict, current: Dict) -> List[str]:
+    """One line per benchmark present in both: medians and their ratio; '!' marks regressions."""
+    lines = []
+    if baseline["meta"].get("params") != current["meta"].get("params"):
+        lines.append("warning: baseline was run with different parameters")
+    for name, new in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None or not old["median_s"]:
+            continue
+        ratio = new["median_s"] / old["median_s"]
+        flag = "!" if ratio > REGRESSION_THRESHOLD else " "
+        lines.append(f"{flag} {name:<28} {old['median_s'] * 1000:10.2f} ms → {new['median_s'] * 1000:10.2f} ms  ×{ratio:.2f}")
+    return lines
+
+
+def _stream_parse(data: bytes, kb) -> list:
+    parser = VCFStreamParser(kb=kb)
+    for i in range(0, len(data), FEED_CHUNK_SIZE):
+        parser.feed(data[i:i + FEED_CHUNK_SIZE])
+    return parser.close()
+
+
+def _api_benchmarks(vcf: bytes, repeat: int, log: Callable[[str], None]) -> Dict[str, Dict]:
+    """
+    POST /analyze through the in-process test client. Explanations are
+    deferred so the numbers do not depend on the LLM; "cold" uploads differ
+    by a header line each run, so they miss the parsed-VCF cache.
+    """
+    try:
+        from fastapi.testclient import TestClient
+    except ImportError as e:  # httpx is a test-client-only dependency
+        log(f"skipping /analyze benchmarks: {e}")
+        return {}
+    import main
+
+    form = {"drug": "WARFARIN", "defer_explanation": "true"}
+    runs = iter(range(10 ** 9))
+
+    def cold():
+        data = vcf.replace(b"\n", f"\n##benchmark_run={next(runs)}\n".encode(), 1)
+        post(data)
+
+    def post(data: bytes):
+        r = client.post("/analyze", files={"file": ("bench.vcf", data)}, data=form)
+        if r.status_code != 200:
+            raise RuntimeError(f"/analyze returned {r.status_code}: {r.text[:200]}")
+
+    results = {}
+    with TestClient(main.app) as client:
+        log("analyze[cold] …")
+        results["analyze[cold]"] = measure(cold, repeat=repeat)
+        log("analyze[cached] …")
+        results["analyze[cached]"] = measure(lambda: post(vcf), repeat=repeat)
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=5,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def save(results: Dict, path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+
+def load(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+import pathlib
+import sys
+
+from dotenv import load_dotenv
+
+# Same .env as the API server
+load_dotenv(dotenv_path=pathlib.Path(__file__).parent / ".env")
+
+import batch_runner
+import benchmark
+import cohort_parallel
+import explanation_bundle
+import knowledge_base
+import llm_explainer
+import loadtest
+import synthetic_vcf
+
+
+def cmd_precompute_explanations(args: argparse.Namespace) -> int:
+    if args.stub:
+        def explain(**kw):
+            return llm_explainer._fallback_explanation(
+                kw["drug"], kw["gene"], kw["diplotype"], kw["phenotype"], kw["variants"],
+                "precomputed offline stub",
+            )
+        generator = "stub"
+    else:
+        explain = llm_explainer.explain_with_llm
+        generator = "llm"
+
+    try:
+        bundle = explanation_bundle.build(explain, version=args.version, generator=generator)
+    except Exception as e:
+        print(f"error: explanation generation failed: {e}", file=sys.stderr)
+        return 1
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(bundle, f, indent=2, ensure_ascii=False)
+
+    print(f"Wrote {len(bundle['entries'])} explanations (version {bundle['version']}) to {args.out}")
+    return 0
+
+
+def _parse_drugs(value) -> list:
+    drug_genes = knowledge_base.current().drug_genes
+    drugs = [d.strip().upper() for d in value.split(",") if d.strip()]
+    unsupported = [d for d in drugs if d not in drug_genes]
+    if unsupported:
+        raise argparse.ArgumentTypeError(f"unsupported drug(s) {unsupported}; supported: {list(drug_genes)}")
+    return drugs
+
+
+def cmd_cohort(args: argparse.Namespace) -> int:
+    drugs = args.drugs or list(knowledge_base.current().drug_genes)
+
+    try:
+        result = cohort_parallel.analyze_vcf_parallel(args.vcf, drugs, workers=args.workers)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        print(f"Wrote {len(result['samples'])} samples × {len(drugs)} drugs to {args.out}")
+    else:
+        json.dump(result, sys.stdout)
+        sys.stdout.write("\n")
+    return 0
+
+
+def cmd_batch(args: argparse.Namespace) -> int:
+    inputs = batch_runner.find_inputs(args.inputs, args.manifest)
+    if not inputs:
+        print("error: no VCF files found", file=sys.stderr)
+        return 1
+
+    checkpoint = args.checkpoint or args.out + ".checkpoint"
+    # Without --resume a previous run's output and checkpoint are discarded
+    try:
+        files, lines = batch_runner.run(
+            inputs, args.drugs or list(knowledge_base.current().drug_genes), args.out,
+            checkpoint=checkpoint, workers=args.workers, resume=args.resume,
+        )
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Processed {files} of {len(inputs)} files ({len(inputs) - files} already done), wrote {lines} lines to {args.out}")
+    return 0
+
+
+def cmd_synthetic_vcf(args: argparse.Namespace) -> int:
+    size = synthetic_vcf.write(
+        args.out, args.compression, records=args.records, pgx_fraction=args.pgx_fraction,
+        samples=args.samples, phased=args.phased, build=args.build, seed=args.seed,
+    )
+    print(f"Wrote {args.records} records × {args.samples} samples ({size} bytes, {args.compression}) to {args.out}")
+    return 0
+
+
+def cmd_benchmark(args: argparse.Namespace) -> int:
+    results = benchmark.run(
+        records=args.records, pgx_fraction=args.pgx_fraction, samples=args.samples, phased=args.phased,
+        repeat=args.repeat, api=not args.skip_api, seed=args.seed,
+        log=lambda msg: print(msg, file=sys.stderr),
+    )
+    benchmark.save(results, args.out)
+
+    for name, r in results["results"].items():
+        print(f"{name:<28} median {r['median_s'] * 1000:10.2f} ms   min {r['min_s'] * 1000:10.2f} ms")
+    print(f"Wrote {len(results['results'])} results to {args.out}")
+
+    if args.compare:
+        lines = benchmark.compare(benchmark.load(args.compare), results)
+        print(f"\nvs {args.compare}:")
+        print("\n".join(lines))
+    return 0
+
+
+def cmd_loadtest(args: argparse.Namespace) -> int:
+    if args.vcf:
+        vcfs = [pathlib.Path(p).read_bytes() for p in args.vcf]
+    else:
+        vcfs = loadtest.synthetic_vcfs(args.distinct_vcfs, args.records, args.samples, args.seed)
+
+    try:
+        result = loadtest.run(
+            url=args.url, concurrency=args.concurrency, duration=args.duration, requests=args.requests,
+            mix=args.mix, vcfs=vcfs, llm_latency=args.llm_latency, llm_jitter=args.llm_jitter,
+            llm_error_rate=args.llm_error_rate, llm_error_status=args.llm_error_status,
+            llm_cache=args.llm_cache, server_workers=args.server_workers, seed=args.seed,
+            log=lambda msg: print(msg, file=sys.stderr),
+        )
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    print(f"{result['requests']} requests in {result['elapsed_s']:.1f}s, "
+          f"{result['throughput_rps']} req/s, status {result['status']}")
+    for section in ("latency_ms", "stages_ms"):
+        print(f"\n{section:<20} {'count':>7} {'p50':>10} {'p95':>10} {'p99':>10}")
+        for name, r in result[section].items():
+            print(f"{name:<20} {r['count']:>7} {r['p50']:>10.2f} {r['p95']:>10.2f} {r['p99']:>10.2f}")
+    if result["llm_stub"]:
+        print(f"\nLLM stub: {result['llm_stub']['calls']} calls, {result['llm_stub']['errors']} failed (the Groq client retries failures)")
+    if result["server_metrics"]:
+        print()
+        for name, delta in result["server_metrics"].items():
+            print(f"{name} +{delta:g}")
+    return 0
+
+
+def _add_vcf_shape_args(p: argparse.ArgumentParser, records: int) -> None:
+    p.add_argument("--records", type=int, default=records, help=f"Data rows (default: {records})")
+    p.add_argument("--pgx-fraction", type=float, default=0.01, help="Fraction of rows on pharmacogenes (default: 0.01)")
+    p.add_argument("--samples", type=int, default=1, help="Sample columns (default: 1)")
+    p.add_argument("--phased", action="store_true", help="Phased (|) genotypes")
+    p.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="pharmaguard", description="PharmaGuard offline tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser(
+        "precompute-explanations",
+        help="Generate an explanation bundle for every rule combination",
+    )
+    p.add_argument("--out", required=True, help="Bundle JSON path (serve it via EXPLANATION_BUNDLE)")
+    p.add_argument("--version", help="Bundle version label (default: rules fingerprint)")
+    p.add_argument("--stub", action="store_true", help="Use the rule-based template instead of the LLM")
+    p.set_defaults(func=cmd_precompute_explanations)
+
+    p = sub.add_parser(
+        "cohort",
+        help="Whole-panel results for every sample of a multi-sample VCF, across worker processes",
+    )
+    p.add_argument("vcf", help="VCF path (.vcf, .vcf.gz or bgzip)")
+    p.add_argument("--drugs", type=_parse_drugs, help="Comma-separated drugs (default: all supported)")
+    p.add_argument("--workers", type=int, help="Worker processes (default: COHORT_WORKERS or one per CPU)")
+    p.add_argument("--out", help="Write the result JSON here instead of stdout")
+    p.set_defaults(func=cmd_cohort)
+
+    p = sub.add_parser(
+        "batch",
+        help="Analyze directories/manifests of VCFs into JSONL, one line per sample × drug",
+    )
+    p.add_argument("inputs", nargs="*", help="VCF files and/or directories (searched recursively)")
+    p.add_argument("--manifest", help="File listing one VCF path per line (relative to the manifest)")
+    p.add_argument("--out", required=True, help="JSONL output path")
+    p.add_argument("--drugs", type=_parse_drugs, help="Comma-separated drugs (default: all supported)")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (default: one per CPU)")
+    p.add_argument("--checkpoint", help="Checkpoint path (default: <out>.checkpoint)")
+    p.add_argument("--resume", action="store_true", help="Skip files finished by a previous run")
+    p.set_defaults(func=cmd_batch)
+
+    p = sub.add_parser(
+        "synthetic-vcf",
+        help="Write a reproducible synthetic VCF for benchmarks and load tests",
+    )
+    p.add_argument("out", help="Output path")
+    _add_vcf_shape_args(p, records=100_000)
+    p.add_argument("--compression", choices=synthetic_vcf.COMPRESSIONS, default="none", help="Output encoding (default: none)")
+    p.add_argument("--build", choices=sorted(synthetic_vcf.CHR1_LENGTH), default="GRCh38", help="Reference build (default: GRCh38)")
+    p.set_defaults(func=cmd_synthetic_vcf)
+
+    p = sub.add_parser(
+        "benchmark",
+        help="Time each pipeline stage on a synthetic VCF and save the results as JSON",
+    )
+    p.add_argument("--out", required=True, help="Results JSON path")
+    _add_vcf_shape_args(p, records=100_000)
+    p.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark (default: 5)")
+    p.add_argument("--skip-api", action="store_true", help="Skip the end-to-end /analyze benchmarks")
+    p.add_argument("--compare", help="Baseline results JSON to compare against")
+    p.set_defaults(func=cmd_benchmark)
+
+    p = sub.add_parser(
+        "loadtest",
+        help="Drive /analyze at a fixed concurrency against a local stub LLM; report p50/p95/p99 per stage",
+    )
+    p.add_argument("--url", help="Existing API server to target (default: start one wired to the stub LLM)")
+    p.add_argument("--concurrency", type=int, default=50, help="Concurrent clients (default: 50)")
+    p.add_argument("--duration", type=float, default=30.0, help="Seconds to run (default: 30)")
+    p.add_argument("--requests", type=int, help="Stop after this many requests instead")
+    p.add_argument("--mix", default=loadtest.DEFAULT_MIX,
+                   help=f"Weighted request kinds from {', '.join(loadtest.REQUEST_KINDS)} (default: {loadtest.DEFAULT_MIX})")
+    p.add_argument("--vcf", action="append", help="VCF to upload (repeatable; default: synthetic files)")
+    p.add_argument("--distinct-vcfs", type=int, default=8, help="Synthetic files to rotate through (default: 8)")
+    p.add_argument("--records", type=int, default=20_000, help="Rows per synthetic file (default: 20000)")
+    p.add_argument("--samples", type=int, default=1, help="Samples per synthetic file (default: 1)")
+    p.add_argument("--llm-latency", type=float, default=0.5, help="Stub LLM mean latency, seconds (default: 0.5)")
+    p.add_argument("--llm-jitter", type=float, default=0.2, help="Stub LLM latency ± jitter, seconds (default: 0.2)")
+    p.add_argument("--llm-error-rate", type=float, default=0.0, help="Fraction of stub LLM calls that fail (default: 0)")
+    p.add_argument("--llm-error-status", type=int, default=500, help="HTTP status of failed stub calls (default: 500)")
+    p.add_argument("--llm-cache", action="store_true", help="Keep the explanation cache on (default: every analysis calls the LLM)")
+    p.add_argument("--server-workers", type=int, default=1, help="uvicorn worker processes (default: 1)")
+    p.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    p.add_argument("--out", help="Write the full report JSON here")
+    p.set_defaults(func=cmd_loadtest)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import knowledge_base
+from confidence import compute_confidence, variant_score
+from diplotype_engine import resolve_diplotype, resolve_haplotypes
+from drug_risk_engine import assess_drug_risk
+from genotype_matrix import NO_CALL, GenotypeMatrix
+from knowledge_base import KnowledgeBase
+from phenotype_engine import infer_phenotype
+from vcf_parser import VariantList
+
+# ── Cohort mode ───────────────────────────────────────────────────────────────
+# Multi-sample VCFs: variants are grouped by sample once, then diplotype,
+# phenotype and risk are resolved per sample so different patients' genotypes
+# never mix. Deterministic stages only — no LLM.
+
+# Per-cell fields, in the order they appear in the compact matrix rows
+PANEL_FIELDS = ["diplotype", "phenotype", "risk_label", "severity", "confidence_score"]
+UNKNOWN_CELL = ["Unknown", "Unknown", "Unknown", "none", 0.0]
+# Genes with more allele sites than fit one packed int64 key (3 bits per site)
+PACKED_SITES_MAX = 21
+
+
+def group_by_sample(variants: List[Dict]) -> Dict[str, VariantList]:
+    grouped: Dict[str, VariantList] = {}
+    for v in variants:
+        sample = grouped.get(v["sample"])
+        if sample is None:
+            sample = grouped[v["sample"]] = VariantList()
+        sample.add((v,))
+    return grouped
+
+
+def analyze_cohort(
+    variants: List[Dict],
+    drugs: List[str],
+    samples: Optional[List[str]] = None,
+    kb: Optional[KnowledgeBase] = None,
+) -> Dict:
+    """
+    Whole-panel results for every sample × drug.
+
+    `samples` fixes the row order and includes samples with no called
+    pharmacogene variants; defaults to the samples seen in `variants`.
+    """
+    kb = kb or knowledge_base.current()
+    by_sample = group_by_sample(variants)
+    if samples is None:
+        samples = getattr(variants, "samples", None) or list(by_sample)
+
+    genes = {drug: kb.drug_genes[drug] for drug in drugs}
+    matrix = []
+    for sample in samples:
+        sample_variants = by_sample.get(sample, [])
+        # Drugs sharing a gene share one diplotype/phenotype call
+        calls = {gene: _gene_call(sample_variants, gene, kb) for gene in set(genes.values())}
+        matrix.append([_drug_cell(drug, calls[genes[drug]], kb) for drug in drugs])
+
+    return _panel(samples, drugs, matrix, kb)
+
+
+def _panel(samples: List[str], drugs: List[str], matrix: List[List], kb: KnowledgeBase) -> Dict:
+    return {
+        "samples":                list(samples),
+        "drugs":                  list(drugs),
+        "fields":                 PANEL_FIELDS,
+        "matrix":                 matrix,
+        "knowledge_base_version": kb.version,
+    }
+
+
+def _gene_call(sample_variants: List[Dict], gene: str, kb: KnowledgeBase) -> Optional[Dict]:
+    diplotype_result = resolve_diplotype(sample_variants, gene, kb)
+    if diplotype_result is None:
+        return None
+    phenotype = infer_phenotype(gene, diplotype_result["star_alleles"], kb)
+    return {
+        "diplotype":  diplotype_result["diplotype"],
+        "phenotype":  phenotype["phenotype_code"],
+        "confidence": compute_confidence(diplotype_result["matched_variants"]),
+    }
+
+
+def _drug_cell(drug: str, call: Optional[Dict], kb: KnowledgeBase) -> List:
+    if call is None:
+        return list(UNKNOWN_CELL)
+    risk = assess_drug_risk(drug, call["phenotype"], call["confidence"], kb)
+    return [call["diplotype"], call["phenotype"], risk["risk_label"], risk["severity"], risk["confidence_score"]]
+
+
+# ── Vectorized cohort mode ────────────────────────────────────────────────────
+# Same results as analyze_cohort, computed from a GenotypeMatrix: confidence is
+# an array operation over all samples at once, haplotypes are resolved once per
+# distinct genotype pattern and phenotype/risk lookups once per distinct
+# diplotype, rather than per sample.
+
+def analyze_genotype_matrix(matrix: GenotypeMatrix, drugs: List[str], kb: Optional[KnowledgeBase] = None) -> Dict:
+    """Whole-panel results for every sample × drug of a GenotypeMatrix."""
+    kb = kb or knowledge_base.current()
+    genes = {drug: kb.drug_genes[drug] for drug in drugs}
+    calls = {gene: _gene_calls(matrix, gene, kb) for gene in set(genes.values())}
+
+    n = len(matrix.samples)
+    columns = [_drug_column(drug, calls[genes[drug]], n, kb) for drug in drugs]
+    cells = [list(row) for row in zip(*columns)] if columns else [[] for _ in range(n)]
+    return _panel(matrix.samples, drugs, cells, kb)
+
+
+def _gene_calls(matrix: GenotypeMatrix, gene: str, kb: KnowledgeBase) -> Optional[Dict]:
+    """Per-sample diplotype codes and confidence for one gene, as resolve_diplotype."""
+    rows = matrix.gene_rows(gene)
+    if not rows:
+        return None
+
+    codes = matrix.codes[rows]
+    called = codes != NO_CALL
+    # resolve_diplotype returns None for a sample with no called gene rows
+    has_call = called.any(axis=0)
+
+    index = kb.haplotype_index.get(gene)
+    sites = index.bits if index is not None else {}
+    star_rows = [k for k, i in enumerate(rows) if matrix.rows[i]["rsid"] in sites]
+    rsids = [matrix.rows[rows[k]]["rsid"] for k in star_rows]
+
+    n = codes.shape[1]
+    if star_rows:
+        # Sequential sum over rows, matching compute_confidence's float order
+        star_called = called[star_rows]
+        total = np.zeros(n)
+        for k, j in enumerate(star_rows):
+            total += np.where(star_called[k], variant_score(matrix.rows[rows[j]]), 0.0)
+        matched = star_called.sum(axis=0)
+        avg = np.divide(total, matched, out=np.zeros(n), where=matched > 0)
+        confidence = [
+            round(min(0.95, max(0.05, a)), 2) if m else 0.0
+            for a, m in zip(avg.tolist(), matched.tolist())
+        ]
+        # A cohort has few distinct genotype patterns over a gene's allele sites
+        patterns, inverse = _distinct_columns(codes[star_rows])
+    else:
+        confidence = [0.0] * n
+        patterns, inverse = [[]], np.zeros(n, dtype=np.int64)
+
+    # One phenotype lookup per distinct diplotype
+    diplotypes = []
+    phenotypes: Dict[str, str] = {}
+    for pattern in patterns:
+        pair = resolve_haplotypes(gene, zip(rsids, pattern), kb)
+        diplotype = f"{pair[0]}/{pair[1]}"
+        if diplotype not in phenotypes:
+            phenotypes[diplotype] = infer_phenotype(gene, pair, kb)["phenotype_code"]
+        diplotypes.append((diplotype, phenotypes[diplotype]))
+
+    return {
+        "has_call":   has_call.tolist(),
+        "distinct":   diplotypes,
+        "inverse":    inverse.tolist(),
+        "confidence": confidence,
+    }
+
+
+def _distinct_columns(codes: np.ndarray):
+    """(distinct columns as lists, column → distinct index) of a small-code matrix."""
+    if len(codes) > PACKED_SITES_MAX:
+        distinct, inverse = np.unique(codes, axis=1, return_inverse=True)
+        return distinct.T.tolist(), inverse.reshape(-1)
+    # Pack each column into one integer: one base-8 digit per site
+    keys = np.zeros(codes.shape[1], dtype=np.int64)
+    for row in codes:
+        keys = keys * 8 + (row.astype(np.int64) - NO_CALL)
+    distinct, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return codes[:, first].T.tolist(), inverse.reshape(-1)
+
+
+def _drug_column(drug: str, call: Optional[Dict], n: int, kb: KnowledgeBase) -> List[List]:
+    if call is None:
+        return [list(UNKNOWN_CELL) for _ in range(n)]
+
+    # Risk label/severity depend only on the phenotype; the score on confidence
+    risks = [assess_drug_risk(drug, code, 0.0, kb) for _, code in call["distinct"]]
+    column = []
+    for has_call, d, conf in zip(call["has_call"], call["inverse"], call["confidence"]):
+        if not has_call:
+            column.append(list(UNKNOWN_CELL))
+            continue
+        diplotype, code = call["distinct"][d]
+        risk = risks[d]
+        score = round(conf, 2) if (drug, code) in kb.risk_rules else risk["confidence_score"]
+        column.append([diplotype, code, risk["risk_label"], risk["severity"], score])
+    return column
@@ -0,0 +1,288 @@
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import knowledge_base
+from cohort_engine import analyze_genotype_matrix
+from genotype_matrix import GenotypeMatrix, GenotypeMatrixParser
+from knowledge_base import KnowledgeBase
+from vcf_index import BGZF_HEADER_SIZE, BGZFReader, _bgzf_block_size
+from vcf_parser import GZIP_MAGIC, VCFSizeError, VCFStreamParser
+
+# ── Parallel cohort mode ──────────────────────────────────────────────────────
+# Parsing is CPU-bound pure Python, so large cohort VCFs are split into record
+# ranges (byte ranges of plain text, block ranges of BGZF) that worker
+# processes parse independently. Each line belongs to the range its first byte
+# falls in. Partial matrices are merged in range order, then resolution is
+# fanned out again by sample columns and merged in column order — the result
+# is identical to the single-process engine.
+
+# Worker processes; 0 = one per CPU
+COHORT_WORKERS = int(os.getenv("COHORT_WORKERS", "0")) or os.cpu_count() or 1
+# Files are not split finer than this many (compressed) bytes per range
+MIN_RANGE_BYTES = 4 * 1024 * 1024
+# Resolution is not split finer than this many samples per task
+MIN_SAMPLES_PER_TASK = 500
+READ_CHUNK_SIZE = 1024 * 1024
+
+# (kind, start, end, prev) — kind is "text", "bgzf" or "gzip" (not splittable);
+# prev is the offset of the BGZF block before `start`
+Range = Tuple[str, int, int, Optional[int]]
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the API process also runs LLM threads
+        _pool = ProcessPoolExecutor(
+            max_workers=COHORT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def analyze_vcf_parallel(
+    path: str,
+    drugs: List[str],
+    workers: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    kb: Optional[KnowledgeBase] = None,
+) -> Dict:
+    """
+    Whole-panel results for a VCF on disk, parsed and resolved across
+    processes. Workers receive `kb` (default the active knowledge base), so
+    every range and slice uses the same version.
+    """
+    workers = workers or COHORT_WORKERS
+    kb = kb or knowledge_base.current()
+    matrix = parse_matrix_parallel(path, workers, max_bytes, kb)
+
+    n = len(matrix.samples)
+    tasks = max(1, min(workers, n // MIN_SAMPLES_PER_TASK))
+    if tasks == 1:
+        return analyze_genotype_matrix(matrix, drugs, kb)
+
+    bounds = np.linspace(0, n, tasks + 1).astype(int).tolist()
+    slices = [
+        GenotypeMatrix(matrix.samples[a:b], matrix.build, matrix.rows, matrix.codes[:, a:b])
+        for a, b in zip(bounds, bounds[1:])
+    ]
+    parts = list(_get_pool().map(analyze_genotype_matrix, slices, [drugs] * len(slices), [kb] * len(slices)))
+    return {
+        **parts[0],
+        "samples": [s for p in parts for s in p["samples"]],
+        "matrix":  [row for p in parts for row in p["matrix"]],
+    }
+
+
+def parse_matrix_parallel(
+    path: str,
+    workers: int,
+    max_bytes: Optional[int] = None,
+    kb: Optional[KnowledgeBase] = None,
+) -> GenotypeMatrix:
+    kb = kb or knowledge_base.current()
+    header, ranges = plan_ranges(path, workers)
+    if ranges[0][0] != "gzip":
+        # Fail fast (and with the usual messages) on a bad header
+        head = VCFStreamParser(kb=kb)
+        head.feed(header or _preview(path, ranges[0][0]))
+        head.close()
+
+    # Each range stops inflating once past its share of the limit, so a
+    # decompression bomb fails early rather than after every range is read
+    limits = _range_limits(ranges, max_bytes)
+    if len(ranges) == 1:
+        parts = [_parse_range(path, header, ranges[0], kb, limits[0])]
+    else:
+        n = len(ranges)
+        parts = list(_get_pool().map(_parse_range, [path] * n, [header] * n, ranges, [kb] * n, limits))
+
+    bytes_read = sum(p[1] for p in parts)
+    if max_bytes is not None and bytes_read > max_bytes:
+        raise VCFSizeError(f"VCF exceeds {max_bytes} byte limit")
+
+    matrices = [p[0] for p in parts]
+    rows = [row for m in matrices for row in m.rows]
+    codes = np.vstack([m.codes for m in matrices])
+    return GenotypeMatrix(matrices[0].samples, matrices[0].build, rows, codes)
+
+
+def plan_ranges(path: str, workers: int) -> Tuple[bytes, List[Range]]:
+    """Header bytes plus up to `workers` contiguous record ranges covering the file."""
+    size = os.path.getsize(path)
+    n = max(1, min(workers, size // MIN_RANGE_BYTES))
+
+    with open(path, "rb") as f:
+        magic = f.read(BGZF_HEADER_SIZE)
+        f.seek(0)
+        if not magic.startswith(GZIP_MAGIC):
+            header = _text_header(f)
+            bounds = np.linspace(0, size, n + 1).astype(int).tolist()
+            return header, [("text", a, b, None) for a, b in zip(bounds, bounds[1:])]
+
+        if len(magic) < BGZF_HEADER_SIZE or not magic[3] & 4:
+            # Plain gzip has no block boundaries to split on
+            return b"", [("gzip", 0, size, None)]
+
+        header = BGZFReader(f).read_header()
+        blocks = _block_offsets(f, size)
+
+    # Contiguous groups of blocks of roughly equal compressed size
+    ranges = []
+    bounds = np.linspace(0, size, n + 1).tolist()
+    i = 0
+    for target in bounds[1:]:
+        j = i
+        while j < len(blocks) and (blocks[j] < target or j == i):
+            j += 1
+        if j > i:
+            end = blocks[j] if j < len(blocks) else size
+            ranges.append(("bgzf", blocks[i], end, blocks[i - 1] if i else None))
+        i = j
+    return header, ranges
+
+
+def _range_limits(ranges: List[Range], max_bytes: Optional[int]) -> List[Optional[int]]:
+    """Decompressed-byte limit of each range: the whole limit for one, else a share by compressed size."""
+    if max_bytes is None:
+        return [None] * len(ranges)
+    if len(ranges) == 1:
+        return [max_bytes]
+    total = sum(end - start for _, start, end, _ in ranges)
+    return [math.ceil(max_bytes * (end - start) / total) for _, start, end, _ in ranges]
+
+
+def _parse_range(
+    path: str,
+    header: bytes,
+    rng: Range,
+    kb: KnowledgeBase,
+    max_bytes: Optional[int] = None,
+) -> Tuple[GenotypeMatrix, int]:
+    """
+    Worker: parse the lines owned by one range, reading at most `max_bytes`
+    of its text. Returns (matrix, decompressed bytes).
+    """
+    kind, start, end, prev = rng
+    # The repeated header does not count against the range's share
+    limit = max_bytes + len(header) if max_bytes is not None else None
+    parser = GenotypeMatrixParser(validate=kind == "gzip", max_bytes=limit, kb=kb)
+
+    with open(path, "rb") as f:
+        if kind == "gzip":
+            for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+                parser.feed(chunk)
+            return parser.close(), parser.bytes_read
+
+        parser.feed(header)
+        if kind == "text":
+            skip_partial = start > 0 and _byte_before(f, start) != b"\n"
+            pieces = _text_pieces(f, start, end)
+        else:
+            reader = BGZFReader(f)
+            skip_partial = prev is not None and not reader.read_block(prev)[0].endswith(b"\n")
+            pieces = _bgzf_pieces(reader, start, end)
+
+        # Header lines repeated inside a range are harmless to the parser
+        for text in _owned_text(pieces, skip_partial):
+            parser.feed(text)
+
+    return parser.close(), parser.bytes_read - len(header)
+
+
+def _owned_text(pieces: Iterator[Tuple[bytes, bool]], skip_partial: bool) -> Iterator[bytes]:
+    """
+    Text of the lines that start inside the range. `pieces` are (data, owned)
+    in file order; data past the range is read only to finish the last line.
+    """
+    skipping = skip_partial
+    line_open = False
+    for data, owned in pieces:
+        if skipping:
+            if not owned:
+                return
+            nl = data.find(b"\n")
+            if nl == -1:
+                continue
+            data = data[nl + 1:]
+            skipping = False
+
+        if not owned:
+            if not line_open:
+                return
+            nl = data.find(b"\n")
+            if nl == -1:
+                yield data
+                continue
+            yield data[:nl + 1]
+            return
+
+        if data:
+            yield data
+            line_open = not data.endswith(b"\n")
+
+
+def _text_pieces(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, bool]]:
+    f.seek(start)
+    offset = start
+    while True:
+        owned = offset < end
+        data = f.read(min(READ_CHUNK_SIZE, end - offset) if owned else READ_CHUNK_SIZE)
+        if not data:
+            return
+        yield data, owned
+        offset += len(data)
+
+
+def _bgzf_pieces(reader: BGZFReader, start: int, end: int) -> Iterator[Tuple[bytes, bool]]:
+    coffset = start
+    while True:
+        data, next_offset = reader.read_block(coffset)
+        if next_offset == coffset:
+            return
+        yield data, coffset < end
+        coffset = next_offset
+
+
+def _preview(path: str, kind: str) -> bytes:
+    """Leading text of a file with no `#` lines, for the validation message."""
+    with open(path, "rb") as f:
+        if kind == "bgzf":
+            return BGZFReader(f).read_block(0)[0]
+        return f.read(READ_CHUNK_SIZE)
+
+
+def _byte_before(f: BinaryIO, offset: int) -> bytes:
+    f.seek(offset - 1)
+    return f.read(1)
+
+
+def _text_header(f: BinaryIO) -> bytes:
+    """Leading `#` lines of a plain-text VCF."""
+    lines = []
+    for line in f:
+        if not line.startswith(b"#"):
+            break
+        lines.append(line)
+    return b"".join(lines)
+
+
+def _block_offsets(f: BinaryIO, size: int) -> List[int]:
+    """Compressed offset of every BGZF block, from the block headers alone."""
+    offsets = []
+    coffset = 0
+    while coffset < size:
+        f.seek(coffset)
+        header = f.read(BGZF_HEADER_SIZE)
+        if len(header) < BGZF_HEADER_SIZE:
+            break
+        offsets.append(coffset)
+        coffset += _bgzf_block_size(header)
+    return offsets
@@ -0,0 +1,61 @@
+# ── Confidence Calculator ──────────────────────────────────────────────────────
+
+CLINSIG_SCORES = {
+    "pathogenic":              1.00,
+    "likely_pathogenic":       0.85,
+    "risk_factor":             0.65,
+    "uncertain_significance":  0.40,
+    "likely_benign":           0.20,
+    "benign":                  0.10,
+}
+
+def compute_confidence(variants: list) -> float:
+    """
+    Dynamically compute confidence score (0.0–0.95) from VCF variant signals.
+    Replaces the hardcoded 0.90 value.
+
+    Weights:
+      QUAL score          25%
+      Read depth (DP)     25%
+      Genotype quality    20%  (falls back to QUAL if GQ absent)
+      FILTER = PASS       15%
+      Clinical sig tier   10%
+      AF penalty           soft penalty if AF < 0.10
+    """
+    if not variants:
+        return 0.0
+
+    scores = [variant_score(v) for v in variants]
+
+    # Average across all matched variants, cap at 0.95
+    avg = sum(scores) / len(scores)
+    return round(min(0.95, max(0.05, avg)), 2)
+
+
+def variant_score(v: dict) -> float:
+    """Evidence score of a single variant call (the per-variant term of compute_confidence)."""
+    qual  = float(v.get("qual") or 0)
+    depth = int(v.get("depth") or 0)
+    filt  = str(v.get("filter") or "UNKNOWN").split(",")[0].strip().upper()
+    clinsig = str(v.get("clinical_significance") or "").lower().replace(" ", "_")
+    af    = v.get("allele_freq")
+
+    qual_score   = min(qual, 99) / 99
+    depth_score  = min(depth, 200) / 200
+    gq_score     = qual_score          # GQ not stored by vcf_parser; fall back to QUAL
+    filter_score = 1.0 if filt == "PASS" else 0.0
+    clinsig_score = CLINSIG_SCORES.get(clinsig, 0.30)
+
+    raw = (
+        qual_score    * 0.25 +
+        depth_score   * 0.25 +
+        gq_score      * 0.20 +
+        filter_score  * 0.15 +
+        clinsig_score * 0.10
+    )  # max possible = 0.95 (evidence weight removed since not in VCF parser output)
+
+    # Soft penalty: very low AF calls are less reliable
+    if af is not None and af < 0.10:
+        raw -= (0.10 - af) * 0.5
+
+    return max(0.0, raw)
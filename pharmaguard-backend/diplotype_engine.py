@@ -1,84 +1,154 @@
-from typing import List, Dict, Optional
-
-# CPIC-defined star allele rsID mappings per gene
-STAR_ALLELE_MAP = {
-    "CYP2C9": {
-        "rs1799853":  "*2",
-        "rs1057910":  "*3",
-        "rs28371686": "*5",
-        "rs9332131":  "*6",
-    },
-    "CYP2D6": {
-        "rs3892097":  "*4",
-        "rs35742686": "*3",
-        "rs5030655":  "*6",
-        "rs16947":    "*2",
-        "rs1135840":  "*10",
-    },
-    "CYP2C19": {
-        "rs4244285":  "*2",
-        "rs4986893":  "*3",
-        "rs28399504": "*4",
-        "rs12248560": "*17",
-    },
-    "SLCO1B1": {
-        "rs4149056":  "*5",
-        "rs2306283":  "*1b",
-    },
-    "TPMT": {
-        "rs1800462":  "*2",
-        "rs1800460":  "*3B",
-        "rs1142345":  "*3C",
-        "rs1800584":  "*4",
-    },
-    "DPYD": {
-        "rs3918290":  "*2A",
-        "rs55886062": "*13",
-        "rs67376798": "c.2846A>T",
-        "rs75017182": "HapB3",
-    },
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import knowledge_base
+from knowledge_base import KnowledgeBase
+
+# Star-allele definitions, allele sites and gene regions are knowledge-base
+# data (see knowledge_base.json); this module resolves diplotypes against them.
+
+# ── Genotype codes ────────────────────────────────────────────────────────────
+# What the haplotype matcher needs from one sample's GT at one site: how many
+# copies carry the allele-defining ALT and, for a phased het, which copy.
+# That ALT is GT allele "1" except on multi-allelic rows, where it is
+# whichever ALT matched the site (the variant's "alt_index").
+
+GT_REF = 0
+GT_HET = 1          # one alt copy, phase unknown
+GT_HOM_ALT = 2
+GT_ALT_FIRST = 3    # "1|0"
+GT_ALT_SECOND = 4   # "0|1"
+
+
+def _genotype_code(gt: str, allele: str = "1") -> int:
+    alleles = gt.replace("|", "/").split("/")
+    alt = [i for i, a in enumerate(alleles) if a == allele]
+    if not alt:
+        return GT_REF
+    if len(alt) >= 2:
+        return GT_HOM_ALT
+    if "|" in gt and len(alleles) == 2:
+        return GT_ALT_FIRST if alt[0] == 0 else GT_ALT_SECOND
+    return GT_HET
+
+
+# Codes of the GT strings real VCFs use; others are decoded on first sight
+# and remembered, up to a cap
+GENOTYPE_CODES = {
+    f"{a}{sep}{b}": _genotype_code(f"{a}{sep}{b}")
+    for a in ("0", "1", "2", "3", ".")
+    for b in ("0", "1", "2", "3", ".")
+    for sep in ("/", "|")
 }
+GENOTYPE_CODES.update({"0": GT_REF, "1": GT_HET})
+GENOTYPE_CODES_MAX = 4096
+
+
+def genotype_code(gt: str, alt_index: int = 1) -> int:
+    if alt_index != 1:
+        return _genotype_code(gt, str(alt_index))
+    code = GENOTYPE_CODES.get(gt)
+    if code is None:
+        code = _genotype_code(gt)
+        if len(GENOTYPE_CODES) < GENOTYPE_CODES_MAX:
+            GENOTYPE_CODES[gt] = code
+    return code
+
 
+# ── Haplotype resolution ──────────────────────────────────────────────────────
+# Each chromosome copy gets the most specific allele whose sites it fully
+# carries (matched against the knowledge base's bitmask HaplotypeIndex); a
+# diplotype is scored by the alt sites neither allele explains, then by sites
+# matched, then by how few copies are non-reference (unphased *1/*3A beats
+# *3B/*3C, as CPIC reports).
 
-def resolve_diplotype(variants: List[Dict], gene: str) -> Optional[Dict]:
+# Unphased hets beyond this many per gene stay on the first copy rather than
+# doubling the phasings tried
+MAX_UNPHASED_SITES = 12
+
+def resolve_haplotypes(
+    gene: str,
+    calls: Iterable[Tuple[str, int]],
+    kb: Optional[KnowledgeBase] = None,
+) -> List[str]:
     """
-    Deterministically resolve diplotype from detected variants.
-    Returns None if no variants found for this gene — never fabricates.
+    Best-scoring star pair for (rsid, genotype code) calls in row order.
+    Phased hets are placed on their copy; unphased hets are tried on both.
+    The pair is ordered *1 first, then by the row its allele's sites appear.
     """
-    gene_variants = [v for v in variants if v["gene"] == gene]
+    index = (kb or knowledge_base.current()).haplotype_index.get(gene)
+    if index is None:
+        return ["*1", "*1"]
 
-    if not gene_variants:
-        return None  # CRITICAL: honest return, no hallucination
+    first = second = 0
+    unphased: List[int] = []
+    row_of: Dict[int, int] = {}
+    for row, (rsid, code) in enumerate(calls):
+        bit = index.bits.get(rsid)
+        if bit is None or code <= GT_REF:
+            continue
+        row_of.setdefault(bit, row)
+        if code == GT_HOM_ALT:
+            first |= bit
+            second |= bit
+        elif code == GT_ALT_FIRST:
+            first |= bit
+        elif code == GT_ALT_SECOND:
+            second |= bit
+        else:
+            unphased.append(bit)
 
-    allele_map = STAR_ALLELE_MAP.get(gene, {})
-    star_alleles = []
-    matched_variants = []
+    # While both copies look alike, the first unphased het may as well go on the first
+    if unphased and first == second:
+        first |= unphased.pop(0)
+    for bit in unphased[MAX_UNPHASED_SITES:]:
+        first |= bit
+    unphased = unphased[:MAX_UNPHASED_SITES]
 
-    for v in gene_variants:
-        rsid = v["rsid"]
-        gt = v["genotype"]  # e.g., "0/1", "1/1", "0|1"
+    best = None
+    for phasing in range(1 << len(unphased)):
+        a, b = first, second
+        for i, bit in enumerate(unphased):
+            if phasing >> i & 1:
+                b |= bit
+            else:
+                a |= bit
+        star_a, missed_a, matched_a = index.best_allele(a)
+        star_b, missed_b, matched_b = index.best_allele(b)
+        score = (missed_a + missed_b, -(matched_a + matched_b), (star_a != "*1") + (star_b != "*1"))
+        if best is None or score < best[0]:
+            best = (score, star_a, star_b)
 
-        # Normalize phased/unphased
-        gt_normalized = gt.replace("|", "/")
-        alleles = gt_normalized.split("/")
+    def position(star: str) -> int:
+        if star == "*1":
+            return -1
+        mask = index.masks[star]
+        return min(row for bit, row in row_of.items() if bit & mask)
 
-        if rsid in allele_map:
-            star = allele_map[rsid]
-            alt_count = alleles.count("1")
+    return sorted(best[1:], key=position)
 
-            if alt_count == 2:   # homozygous alt
-                star_alleles.extend([star, star])
-            elif alt_count == 1:  # heterozygous
-                star_alleles.append(star)
 
-            matched_variants.append(v)
+def resolve_diplotype(variants: List[Dict], gene: str, kb: Optional[KnowledgeBase] = None) -> Optional[Dict]:
+    """
+    Deterministically resolve diplotype from detected variants.
+    Returns None if no variants found for this gene — never fabricates.
+    """
+    # Parsed VariantLists come bucketed by gene; plain lists are filtered
+    by_gene = getattr(variants, "by_gene", None)
+    if by_gene is not None:
+        gene_variants = by_gene.get(gene, [])
+    else:
+        gene_variants = [v for v in variants if v["gene"] == gene]
 
-    # Fill remaining with *1 (wild-type reference)
-    while len(star_alleles) < 2:
-        star_alleles.insert(0, "*1")
+    if not gene_variants:
+        return None  # CRITICAL: honest return, no hallucination
 
-    # Cap at 2 alleles (diploid)
-    star_alleles = star_alleles[:2]
+    kb = kb or knowledge_base.current()
+    index = kb.haplotype_index.get(gene)
+    sites = index.bits if index is not None else {}
+    matched_variants = [v for v in gene_variants if v["rsid"] in sites]
+    star_alleles = resolve_haplotypes(
+        gene, ((v["rsid"], genotype_code(v["genotype"], v.get("alt_index", 1))) for v in matched_variants), kb,
+    )
 
     diplotype = f"{star_alleles[0]}/{star_alleles[1]}"
 
@@ -0,0 +1,164 @@
+import json
+import os
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import knowledge_base
+from drug_risk_engine import assess_drug_risk
+from knowledge_base import KnowledgeBase
+from phenotype_engine import infer_phenotype
+
+# ── Precomputed explanation bundle ────────────────────────────────────────────
+# Every reachable (drug, gene, diplotype, phenotype, risk) combination is
+# enumerable from the knowledge base's phenotype tables and risk rules, so
+# explanations can be
+# generated offline (`python cli.py precompute-explanations`) and served as a
+# static lookup. Only unseen variant combinations fall through to live
+# generation.
+
+BUNDLE_FORMAT = 1
+# Path of the bundle JSON loaded at startup; unset = no bundle
+EXPLANATION_BUNDLE = os.getenv("EXPLANATION_BUNDLE")
+
+BundleKey = Tuple[str, str, Tuple[str, ...], str, str, Tuple[str, ...]]
+
+_entries: Dict[BundleKey, Dict] = {}
+_meta: Dict = {}
+
+
+def rules_hash(kb: Optional[KnowledgeBase] = None) -> str:
+    """Fingerprint of the knowledge base a bundle was generated from."""
+    return (kb or knowledge_base.current()).fingerprint
+
+
+def enumerate_combinations(kb: Optional[KnowledgeBase] = None) -> Iterator[Dict]:
+    """Every (drug, diplotype) the deterministic engines can map to a phenotype."""
+    kb = kb or knowledge_base.current()
+    for drug, gene in kb.drug_genes.items():
+        definitions = kb.allele_definitions.get(gene, {})
+        for alleles in _allele_pairs(gene, kb):
+            code = infer_phenotype(gene, list(alleles), kb)["phenotype_code"]
+            if code == "Unknown":
+                continue
+            risk = assess_drug_risk(drug, code, 0.0, kb)
+            carried = sorted({rsid for a in alleles for rsid in definitions.get(a, ())})
+            yield {
+                "drug":       drug,
+                "gene":       gene,
+                "diplotype":  "/".join(alleles),
+                "phenotype":  kb.phenotype_labels.get(code, "Unknown"),
+                "risk_label": risk["risk_label"],
+                "variants":   carried,
+            }
+
+
+def _allele_pairs(gene: str, kb: KnowledgeBase) -> List[Tuple[str, str]]:
+    """Listed pairs first (in table order), then every other pair of scored alleles."""
+    pairs = list(kb.phenotype_pairs.get(gene, ()))
+    seen = {tuple(sorted(p)) for p in pairs}
+    alleles = list(kb.allele_activity.get(gene, {}))
+    for i, a in enumerate(alleles):
+        for b in alleles[i:]:
+            if tuple(sorted((a, b))) not in seen:
+                seen.add(tuple(sorted((a, b))))
+                pairs.append((a, b))
+    return pairs
+
+
+def build(
+    explain: Callable[..., Dict],
+    version: Optional[str] = None,
+    generator: str = "llm",
+    kb: Optional[KnowledgeBase] = None,
+) -> Dict:
+    """Generate a bundle by calling `explain` (generate_explanation signature) per combination."""
+    kb = kb or knowledge_base.current()
+    fingerprint = rules_hash(kb)
+    entries = []
+    for combo in enumerate_combinations(kb):
+        explanation = explain(
+            drug=combo["drug"],
+            gene=combo["gene"],
+            diplotype=combo["diplotype"],
+            phenotype=combo["phenotype"],
+            risk_label=combo["risk_label"],
+            variants=[{"rsid": r} for r in combo["variants"]],
+        )
+        entries.append({**combo, "summary": explanation["summary"], "mechanism": explanation["mechanism"]})
+
+    return {
+        "format":                 BUNDLE_FORMAT,
+        "version":                version or fingerprint[:12],
+        "rules_hash":             fingerprint,
+        "knowledge_base_version": kb.version,
+        "generator":              generator,
+        "generated_at":           datetime.utcnow().isoformat() + "Z",
+        "entries":                entries,
+    }
+
+
+def load(path: str) -> None:
+    """Load a bundle file, replacing any previously loaded one."""
+    global _entries, _meta
+    with open(path, encoding="utf-8") as f:
+        bundle = json.load(f)
+
+    if bundle.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"Unsupported explanation bundle format: {bundle.get('format')}")
+
+    entries = {}
+    for e in bundle["entries"]:
+        key = _key(e["drug"], e["gene"], e["diplotype"], e["phenotype"], e["risk_label"], e["variants"])
+        entries[key] = {"summary": e["summary"], "mechanism": e["mechanism"]}
+
+    _entries = entries
+    _meta = {
+        k: bundle.get(k)
+        for k in ("version", "rules_hash", "knowledge_base_version", "generator", "generated_at")
+    }
+
+
+def lookup(
+    drug: str,
+    gene: str,
+    diplotype: str,
+    phenotype: str,
+    risk_label: str,
+    variants: List[Dict],
+) -> Optional[Dict]:
+    """
+    Precomputed explanation for this result, or None if not in the bundle —
+    or if the bundle is stale, since its entries may no longer match the rules.
+    """
+    if not _entries or _meta["rules_hash"] != rules_hash():
+        return None
+    return _entries.get(_key(drug, gene, diplotype, phenotype, risk_label, _carried_rsids(variants)))
+
+
+def info() -> Dict:
+    if not _entries:
+        return {"entries": 0}
+    # Stale once the knowledge base has been reloaded with different rules
+    return {**_meta, "stale": _meta["rules_hash"] != rules_hash(), "entries": len(_entries)}
+
+
+def _key(drug: str, gene: str, diplotype: str, phenotype: str, risk_label: str, rsids: List[str]) -> BundleKey:
+    # Allele order in a diplotype string depends on VCF row order — normalize
+    return (drug, gene, tuple(sorted(diplotype.split("/"))), phenotype, risk_label, tuple(sorted(set(rsids))))
+
+
+def _carried_rsids(variants: List[Dict]) -> List[str]:
+    """
+    rsIDs whose genotype carries the allele-defining ALT — GT allele
+    `alt_index`, "1" unless the row is multi-allelic (0/0 sites are not cited).
+    """
+    carried = []
+    for v in variants:
+        alleles = v.get("genotype", "").replace("|", "/").split("/")
+        if str(v.get("alt_index", 1)) in alleles:
+            carried.append(v["rsid"])
+    return carried
+
+
+if EXPLANATION_BUNDLE:
+    load(EXPLANATION_BUNDLE)
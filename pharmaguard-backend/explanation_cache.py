@@ -0,0 +1,34 @@
+import os
+from typing import Dict, List, Tuple
+
+from ttl_cache import TTLCache
+
+# ── Explanation cache ─────────────────────────────────────────────────────────
+# The LLM prompt depends only on a small deterministic tuple, so successful
+# explanations are cached by it: an in-memory LRU with TTL, optionally backed
+# by SQLite so entries survive restarts. Fallback text is never cached.
+
+EXPLANATION_CACHE_SIZE = int(os.getenv("EXPLANATION_CACHE_SIZE", "1024"))
+EXPLANATION_CACHE_TTL_SECONDS = float(os.getenv("EXPLANATION_CACHE_TTL_SECONDS", "86400"))
+# Path of an SQLite file for the persistent tier; unset = memory only
+EXPLANATION_CACHE_DB = os.getenv("EXPLANATION_CACHE_DB")
+
+CacheKey = Tuple[str, str, str, str, str, Tuple[str, ...]]
+
+
+def make_key(
+    drug: str,
+    gene: str,
+    diplotype: str,
+    phenotype: str,
+    risk_label: str,
+    variants: List[Dict],
+) -> CacheKey:
+    return (drug, gene, diplotype, phenotype, risk_label, tuple(sorted({v["rsid"] for v in variants})))
+
+
+class ExplanationCache(TTLCache):
+    TABLE = "explanations"
+
+
+cache = ExplanationCache(EXPLANATION_CACHE_SIZE, EXPLANATION_CACHE_TTL_SECONDS, EXPLANATION_CACHE_DB)
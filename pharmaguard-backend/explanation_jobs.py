@@ -0,0 +1,80 @@
+import asyncio
+import os
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from llm_explainer import generate_explanation_async
+
+# ── Deferred explanations ─────────────────────────────────────────────────────
+# /analyze can return the deterministic result immediately and hand back a job
+# ID; the LLM text is generated in the background and fetched separately.
+# Jobs live in-process only and expire after a TTL.
+
+EXPLANATION_JOB_TTL_SECONDS = float(os.getenv("EXPLANATION_JOB_TTL_SECONDS", "600"))
+EXPLANATION_JOB_MAX = int(os.getenv("EXPLANATION_JOB_MAX", "10000"))
+
+_jobs: Dict[str, Dict] = {}
+
+
+def submit(
+    drug: str,
+    gene: str,
+    diplotype: str,
+    phenotype: str,
+    risk_label: str,
+    variants: List[Dict],
+) -> str:
+    """Start generating an explanation in the background; returns its job ID."""
+    _evict()
+
+    job_id = uuid.uuid4().hex
+    task = asyncio.get_running_loop().create_task(
+        generate_explanation_async(drug, gene, diplotype, phenotype, risk_label, variants)
+    )
+    _jobs[job_id] = {"created": time.monotonic(), "task": task}
+    return job_id
+
+
+def pending_explanation(job_id: str, variants: List[Dict]) -> Dict:
+    """Placeholder for llm_generated_explanation while the job runs."""
+    return {
+        "status":            "pending",
+        "explanation_id":    job_id,
+        "summary":           "",
+        "mechanism":         "",
+        "variant_citations": [v["rsid"] for v in variants],
+    }
+
+
+def get(job_id: str) -> Optional[Dict]:
+    """Job status and, once finished, its explanation. None if unknown/expired."""
+    _evict()
+    job = _jobs.get(job_id)
+    if job is None:
+        return None
+
+    task = job["task"]
+    if not task.done():
+        return {"explanation_id": job_id, "status": "pending", "llm_generated_explanation": None}
+    return {"explanation_id": job_id, "status": "ready", "llm_generated_explanation": task.result()}
+
+
+async def wait(job_id: str) -> Optional[Dict]:
+    """Like get(), but waits for a pending job to finish."""
+    job = _jobs.get(job_id)
+    if job is None:
+        return None
+    await asyncio.shield(job["task"])
+    return get(job_id)
+
+
+def _evict() -> None:
+    now = time.monotonic()
+    expired = [jid for jid, job in _jobs.items() if now - job["created"] > EXPLANATION_JOB_TTL_SECONDS]
+    for jid in expired:
+        del _jobs[jid]
+
+    # Oldest first (dicts keep insertion order) once over the cap
+    while len(_jobs) >= EXPLANATION_JOB_MAX:
+        del _jobs[next(iter(_jobs))]
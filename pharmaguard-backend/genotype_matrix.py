@@ -0,0 +1,93 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from diplotype_engine import genotype_code
+from vcf_parser import MISSING_GENOTYPES, VCFStreamParser, _gt_index, _row_record
+
+# ── Genotype matrix ───────────────────────────────────────────────────────────
+# Cohort-scale representation of the kept pharmacogene rows: one int8 row of
+# genotype codes per site, one column per sample, instead of a variant dict
+# per (row, sample). Codes are diplotype_engine's: copies of the row's
+# allele-defining ALT plus phase.
+
+NO_CALL = -1
+
+
+class GenotypeMatrix:
+    """
+    `codes[i, j]` is the genotype code of site `rows[i]` in sample
+    `samples[j]`, or NO_CALL. `rows` holds the site-level fields of each row
+    (the variant dict minus genotype/sample).
+    """
+
+    def __init__(self, samples: List[str], build: Optional[str], rows: List[Dict], codes: np.ndarray):
+        self.samples = samples
+        self.build = build
+        self.rows = rows
+        self.codes = codes
+
+    def gene_rows(self, gene: str) -> List[int]:
+        return [i for i, row in enumerate(self.rows) if row["gene"] == gene]
+
+
+class GenotypeMatrixParser(VCFStreamParser):
+    """
+    VCFStreamParser that stores kept rows as a GenotypeMatrix. Same
+    filtering, validation, compression and build handling; close() returns
+    the matrix instead of a variant list.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._rows: List[Dict] = []
+        self._codes: List[np.ndarray] = []
+
+    def _add_record(self, fields: List[str], info: str, gene: str, rsid: Optional[str], alt_index: int = 1) -> None:
+        if len(fields) < 9:
+            return
+        format_and_samples = fields[8].split("\t")
+        gt_index = _gt_index(format_and_samples[0])
+        if gt_index is None:
+            return
+
+        self._rows.append(_row_record(fields, info, gene, rsid, self.kb, alt_index))
+        self._codes.append(_genotype_codes(format_and_samples[1:], gt_index, len(self.samples), alt_index))
+
+    def close(self) -> GenotypeMatrix:
+        variants = super().close()
+        if self._codes:
+            codes = np.vstack(self._codes)
+        else:
+            codes = np.empty((0, len(variants.samples)), dtype=np.int8)
+        return GenotypeMatrix(variants.samples, variants.build, self._rows, codes)
+
+
+def _genotype_codes(sample_fields: List[str], gt_index: int, n_samples: int, alt_index: int = 1) -> np.ndarray:
+    """Genotype code per sample for one row; NO_CALL for missing/absent GTs."""
+    codes = np.full(n_samples, NO_CALL, dtype=np.int8)
+    sample_fields = sample_fields[:n_samples]
+    if not sample_fields:
+        return codes
+
+    if gt_index == 0:
+        gts = [f.split(":", 1)[0] for f in sample_fields]
+    else:
+        gts = [_nth(f, gt_index) for f in sample_fields]
+
+    # A cohort row has a handful of distinct GT strings — decode each once
+    distinct, inverse = np.unique(np.array(gts), return_inverse=True)
+    table = np.array([_gt_code(gt, alt_index) for gt in distinct.tolist()], dtype=np.int8)
+    codes[:len(gts)] = table[inverse]
+    return codes
+
+
+def _nth(sample_field: str, gt_index: int) -> str:
+    parts = sample_field.split(":")
+    return parts[gt_index] if gt_index < len(parts) else ""
+
+
+def _gt_code(gt: str, alt_index: int = 1) -> int:
+    if not gt or gt == "." or gt in MISSING_GENOTYPES:
+        return NO_CALL
+    return genotype_code(gt, alt_index)
@@ -0,0 +1,293 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import threading
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+
+# ── Knowledge base ────────────────────────────────────────────────────────────
+# Guideline data — drug → gene, risk rules, star-allele definitions and sites,
+# phenotype tables, activity scoring — lives in a versioned JSON file rather
+# than in code. A load compiles it into a read-only KnowledgeBase; reloads
+# build a complete new one and swap it in with a single assignment, so a
+# request that takes current() once sees exactly one version throughout.
+# A failed reload leaves the active version in place.
+
+KB_FORMAT = 1
+# Knowledge-base JSON file; the bundled one by default
+KB_PATH = os.getenv("KNOWLEDGE_BASE", str(pathlib.Path(__file__).parent / "knowledge_base.json"))
+# How often the file is checked for changes; 0 disables watching
+KB_WATCH_SECONDS = float(os.getenv("KNOWLEDGE_BASE_WATCH_SECONDS", "5"))
+
+REQUIRED_KEYS = (
+    "version", "drugs", "risk_rules", "star_alleles", "allele_sites", "gene_regions",
+    "phenotype_labels", "phenotypes", "allele_activity", "activity_thresholds",
+)
+
+logger = logging.getLogger(__name__)
+
+BEST_ALLELE_CACHE_MAX = 4096
+
+
+class HaplotypeIndex:
+    """
+    One gene's allele definitions compiled to bitmasks over its sites (bit i =
+    site i carries its alt allele), so matching a chromosome copy against a
+    definition is one AND however many alleles the gene has.
+    """
+
+    def __init__(self, definitions: Mapping[str, Tuple[str, ...]]):
+        bits: Dict[str, int] = {}
+        for sites in definitions.values():
+            for rsid in sites:
+                bits.setdefault(rsid, 1 << len(bits))
+        self.bits = MappingProxyType(bits)
+
+        self.masks = MappingProxyType({star: _mask(bits[r] for r in sites) for star, sites in definitions.items()})
+        # Most specific first (stable, so table order breaks ties)
+        self._alleles = sorted(
+            ((star, mask, len(definitions[star])) for star, mask in self.masks.items()),
+            key=lambda a: -a[2],
+        )
+        self._best: Dict[int, Tuple[str, int, int]] = {}
+
+    def best_allele(self, haplotype: int) -> Tuple[str, int, int]:
+        """(star, unexplained alt sites, sites matched) for the alt sites on one copy."""
+        best = self._best.get(haplotype)
+        if best is None:
+            sites = bin(haplotype).count("1")
+            best = ("*1", sites, 0)
+            for star, mask, size in self._alleles:
+                if mask & ~haplotype == 0:
+                    best = (star, sites - size, size)
+                    break
+            if len(self._best) < BEST_ALLELE_CACHE_MAX:
+                self._best[haplotype] = best
+        return best
+
+
+def _mask(bits: Iterable[int]) -> int:
+    mask = 0
+    for bit in bits:
+        mask |= bit
+    return mask
+
+
+class KnowledgeBase:
+    """
+    One knowledge-base version compiled into lookup tables. Tables are
+    read-only mappings and tuples; nothing is mutated after construction.
+    """
+
+    def __init__(self, data: Dict, source: Optional[str] = None):
+        _validate(data)
+        self._data = data
+        self.version = str(data["version"])
+        self.fingerprint = hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+        self.source = source
+        self.loaded_at = datetime.utcnow().isoformat() + "Z"
+
+        self.drug_genes = _frozen(data["drugs"])
+        self.risk_rules = MappingProxyType({
+            (r["drug"], r["phenotype"]): _frozen({k: v for k, v in r.items() if k not in ("drug", "phenotype")})
+            for r in data["risk_rules"]
+        })
+
+        # gene → star → defining sites, single-site alleles first (table order)
+        multi = data.get("multi_site_alleles", {})
+        self.allele_definitions = _frozen({
+            gene: {
+                **{star: (rsid,) for rsid, star in alleles.items()},
+                **{star: tuple(sites) for star, sites in multi.get(gene, {}).items()},
+            }
+            for gene, alleles in data["star_alleles"].items()
+        })
+        self.haplotype_index = MappingProxyType({
+            gene: HaplotypeIndex(defs) for gene, defs in self.allele_definitions.items()
+        })
+        # rsID → (gene, star); star is None for sites only multi-site alleles use
+        rsid_index = {}
+        for gene, defs in self.allele_definitions.items():
+            for star, sites in defs.items():
+                for rsid in sites:
+                    if len(sites) == 1 or rsid not in rsid_index:
+                        rsid_index[rsid] = (gene, star if len(sites) == 1 else None)
+        self.rsid_index = MappingProxyType(rsid_index)
+        self.target_genes = frozenset(self.allele_definitions) | frozenset(self.drug_genes.values())
+
+        # (chrom, pos, ref, alt) → (gene, rsid) per build, plus "any" = union
+        positions: Dict[str, Dict[tuple, tuple]] = {"any": {}}
+        for rsid, (gene, _) in rsid_index.items():
+            for build, site in data["allele_sites"].get(rsid, {}).items():
+                chrom, pos, ref, alt = site
+                positions.setdefault(build, {})[(chrom, pos, ref, alt)] = (gene, rsid)
+                positions["any"][(chrom, pos, ref, alt)] = (gene, rsid)
+        self.position_index = _frozen(positions)
+        # (chrom, pos) as raw bytes, so the parser pre-filter can test a row
+        # without decoding it
+        self.site_keys = MappingProxyType({
+            build: frozenset((chrom.encode(), str(pos).encode()) for chrom, pos, _, _ in sites)
+            for build, sites in positions.items()
+        })
+        self.gene_regions = _frozen(data["gene_regions"])
+
+        self.phenotype_labels = _frozen(data["phenotype_labels"])
+        # (gene, sorted allele pair) → infer_phenotype result; the first
+        # listing of an unordered pair wins
+        table = {}
+        for gene, entries in data["phenotypes"].items():
+            for e in entries:
+                table.setdefault((gene, tuple(sorted(e["alleles"]))), MappingProxyType({
+                    "phenotype_code":  e["phenotype"],
+                    "phenotype_label": self.phenotype_labels.get(e["phenotype"], "Unknown"),
+                    "activity_score":  e.get("activity_score"),
+                    "confidence":      e["confidence"],
+                }))
+        self.phenotype_table = MappingProxyType(table)
+        self.phenotype_pairs = _frozen({
+            gene: [tuple(e["alleles"]) for e in entries] for gene, entries in data["phenotypes"].items()
+        })
+        self.allele_activity = _frozen(data["allele_activity"])
+        # Inclusive upper bounds; null = no bound
+        self.activity_thresholds = MappingProxyType({
+            gene: tuple((float("inf") if bound is None else bound, code) for bound, code in t)
+            for gene, t in data["activity_thresholds"].items()
+        })
+        self.reported_activity_genes = frozenset(data.get("reported_activity_genes", ()))
+
+    def info(self) -> Dict:
+        return {
+            "version":     self.version,
+            "fingerprint": self.fingerprint,
+            "source":      self.source,
+            "loaded_at":   self.loaded_at,
+            "drugs":       len(self.drug_genes),
+            "risk_rules":  len(self.risk_rules),
+        }
+
+    def __reduce__(self):
+        # Worker processes get the source data and compile it once per version
+        return _restore, (self._data, self.source, self.fingerprint)
+
+
+def _frozen(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _frozen(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_frozen(v) for v in value)
+    return value
+
+
+def _validate(data: Dict) -> None:
+    if data.get("format") != KB_FORMAT:
+        raise ValueError(f"Unsupported knowledge base format: {data.get('format')}")
+    missing = [k for k in REQUIRED_KEYS if k not in data]
+    if missing:
+        raise ValueError(f"Knowledge base is missing {missing}")
+
+    seen = set()
+    for rule in data["risk_rules"]:
+        key = (rule.get("drug"), rule.get("phenotype"))
+        if key in seen:
+            raise ValueError(f"Duplicate risk rule for {key}")
+        seen.add(key)
+        if rule.get("drug") not in data["drugs"]:
+            raise ValueError(f"Risk rule for unknown drug {rule.get('drug')!r}")
+
+    for gene, alleles in data.get("multi_site_alleles", {}).items():
+        for star, sites in alleles.items():
+            if len(sites) < 2:
+                raise ValueError(f"Multi-site allele {gene} {star} lists fewer than two sites")
+    for gene, thresholds in data["activity_thresholds"].items():
+        if not thresholds or thresholds[-1][0] is not None:
+            raise ValueError(f"Activity thresholds for {gene} must end with an unbounded (null) entry")
+
+
+_active: Optional[KnowledgeBase] = None
+# Worker processes: the last version unpickled (only the newest is kept, so
+# repeated hot reloads do not pile up snapshots)
+_restored: Optional[KnowledgeBase] = None
+_load_lock = threading.Lock()
+_last_error: Optional[str] = None
+_watcher: Optional[threading.Thread] = None
+
+
+def load(path: str) -> KnowledgeBase:
+    """Read and compile a knowledge-base file, without activating it."""
+    with open(path, encoding="utf-8") as f:
+        return KnowledgeBase(json.load(f), source=path)
+
+
+def current() -> KnowledgeBase:
+    """The active knowledge base; take it once per request and pass it along."""
+    kb = _active
+    if kb is None:
+        kb = reload()
+    return kb
+
+
+def reload(path: Optional[str] = None) -> KnowledgeBase:
+    """
+    Load `path` (default KB_PATH) and make it the active knowledge base.
+    Raises on a missing or invalid file, keeping the previous version.
+    """
+    global _active, _last_error
+    with _load_lock:
+        try:
+            kb = load(path or KB_PATH)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            _last_error = f"{type(e).__name__}: {e}"
+            raise
+        _active = kb
+        _last_error = None
+    return kb
+
+
+def info() -> Dict:
+    kb = current()
+    return {**kb.info(), "watching": _watcher is not None, "last_reload_error": _last_error}
+
+
+def watch(interval: float = KB_WATCH_SECONDS) -> None:
+    """Reload whenever KB_PATH changes, checked every `interval` seconds in a daemon thread."""
+    global _watcher
+    if _watcher is not None or interval <= 0:
+        return
+    _watcher = threading.Thread(target=_watch, args=(interval,), name="knowledge-base-watch", daemon=True)
+    _watcher.start()
+
+
+def _watch(interval: float) -> None:
+    stamp = _stamp(KB_PATH)
+    stop = threading.Event()
+    while not stop.wait(interval):
+        latest = _stamp(KB_PATH)
+        if latest == stamp or latest is None:
+            continue
+        stamp = latest
+        try:
+            kb = reload()
+            logger.info("Knowledge base reloaded: version %s", kb.version)
+        except Exception as e:
+            logger.warning("Knowledge base reload failed, keeping version %s: %s", _active and _active.version, e)
+
+
+def _stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _restore(data: Dict, source: Optional[str], fingerprint: str) -> KnowledgeBase:
+    global _restored
+    if _active is not None and _active.fingerprint == fingerprint:
+        return _active
+    kb = _restored
+    if kb is None or kb.fingerprint != fingerprint:
+        kb = _restored = KnowledgeBase(data, source)
+    return kb
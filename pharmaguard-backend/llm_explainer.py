@@ -1,8 +1,22 @@
+import asyncio
+import functools
 import os
-from typing import List, Dict
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import explanation_bundle
+import explanation_cache
+import metrics
+
+# Seconds to wait for the LLM before serving the rule-based fallback
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "15"))
+# Concurrent blocking Groq calls allowed per worker process
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "8"))
 
 # ── Lazy client — initialized on first API call, not at import time ──────────
 _client = None
+_executor = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix="llm")
 
 def _get_client():
     global _client
@@ -13,7 +27,7 @@ def _get_client():
         api_key = os.getenv("GROQ_API_KEY")
         if not api_key:
             return None
-        _client = Groq(api_key=api_key)
+        _client = Groq(api_key=api_key, timeout=LLM_TIMEOUT_SECONDS)
         return _client
     except ImportError:
         return None
@@ -31,6 +45,59 @@ def generate_explanation(
     LLM acts as explainer ONLY — it explains what the deterministic
     engine already found. It never makes clinical decisions.
     """
+    bundled = explanation_bundle.lookup(drug, gene, diplotype, phenotype, risk_label, variants)
+    if bundled is not None:
+        metrics.EXPLANATIONS.inc(source="bundle")
+        return _with_citations(bundled, variants)
+
+    key = explanation_cache.make_key(drug, gene, diplotype, phenotype, risk_label, variants)
+    cached = explanation_cache.cache.get(key)
+    if cached is not None:
+        metrics.EXPLANATIONS.inc(source="cache")
+        return _with_citations(cached, variants)
+    return _served(_generate_uncached(key, drug, gene, diplotype, phenotype, risk_label, variants))
+
+
+def _generate_uncached(
+    key: explanation_cache.CacheKey,
+    drug: str,
+    gene: str,
+    diplotype: str,
+    phenotype: str,
+    risk_label: str,
+    variants: List[Dict],
+) -> Tuple[Dict, str]:
+    """LLM explanation (cached) or the rule-based fallback, plus which it was."""
+    try:
+        explanation = explain_with_llm(drug, gene, diplotype, phenotype, risk_label, variants)
+    except Exception as e:
+        return _fallback_explanation(drug, gene, diplotype, phenotype, variants, str(e)), "fallback"
+
+    explanation_cache.cache.put(key, {"summary": explanation["summary"], "mechanism": explanation["mechanism"]})
+    return explanation, "llm"
+
+
+def _served(result: Tuple[Dict, str]) -> Dict:
+    """Count an explanation from _generate_uncached as served."""
+    explanation, source = result
+    metrics.EXPLANATIONS.inc(source=source)
+    if source == "fallback":
+        metrics.LLM_FALLBACKS.inc(reason="error")
+    return explanation
+
+
+def explain_with_llm(
+    drug: str,
+    gene: str,
+    diplotype: str,
+    phenotype: str,
+    risk_label: str,
+    variants: List[Dict],
+) -> Dict:
+    """
+    Ask the LLM directly — no cache, no fallback. Raises if no client is
+    configured or the call fails (used by offline precomputation).
+    """
     variant_list = ", ".join([v["rsid"] for v in variants]) if variants else "none detected"
 
     prompt = f"""You are a clinical pharmacogenomics assistant providing explanations for clinicians.
@@ -56,26 +123,77 @@ Rules:
 - Write for a clinical audience"""
 
     client = _get_client()
-    if client:
-        try:
-            response = client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=500,
-                temperature=0.1,
-            )
-            text = response.choices[0].message.content.strip()
-            lines = text.split("\n")
-            summary = " ".join(lines[:2]) if len(lines) >= 2 else text[:300]
-            return {
-                "summary":           summary,
-                "mechanism":         text,
-                "variant_citations": [v["rsid"] for v in variants],
-            }
-        except Exception as e:
-            return _fallback_explanation(drug, gene, diplotype, phenotype, variants, str(e))
-    else:
-        return _fallback_explanation(drug, gene, diplotype, phenotype, variants, "No GROQ_API_KEY configured")
+    if not client:
+        raise RuntimeError("No GROQ_API_KEY configured")
+
+    start = time.perf_counter()
+    try:
+        response = client.chat.completions.create(
+            model="llama-3.3-70b-versatile",
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=500,
+            temperature=0.1,
+        )
+    except Exception:
+        metrics.LLM_CALLS.inc(outcome="error")
+        raise
+    finally:
+        metrics.LLM_CALL_SECONDS.observe(time.perf_counter() - start)
+    metrics.LLM_CALLS.inc(outcome="ok")
+    text = response.choices[0].message.content.strip()
+    lines = text.split("\n")
+    summary = " ".join(lines[:2]) if len(lines) >= 2 else text[:300]
+    return {
+        "summary":           summary,
+        "mechanism":         text,
+        "variant_citations": [v["rsid"] for v in variants],
+    }
+
+
+async def generate_explanation_async(
+    drug: str,
+    gene: str,
+    diplotype: str,
+    phenotype: str,
+    risk_label: str,
+    variants: List[Dict],
+) -> Dict:
+    """
+    Non-blocking generate_explanation for async handlers: the Groq call runs
+    on a bounded thread pool, and the fallback is served if it does not
+    finish within LLM_TIMEOUT_SECONDS. Precomputed-bundle and cache hits
+    skip the pool entirely.
+    """
+    bundled = explanation_bundle.lookup(drug, gene, diplotype, phenotype, risk_label, variants)
+    if bundled is not None:
+        metrics.EXPLANATIONS.inc(source="bundle")
+        return _with_citations(bundled, variants)
+
+    key = explanation_cache.make_key(drug, gene, diplotype, phenotype, risk_label, variants)
+    cached = explanation_cache.cache.get(key)
+    if cached is not None:
+        metrics.EXPLANATIONS.inc(source="cache")
+        return _with_citations(cached, variants)
+
+    loop = asyncio.get_running_loop()
+    call = functools.partial(
+        _generate_uncached, key, drug, gene, diplotype, phenotype, risk_label, variants,
+    )
+    try:
+        return _served(await asyncio.wait_for(
+            loop.run_in_executor(_executor, call), timeout=LLM_TIMEOUT_SECONDS,
+        ))
+    except asyncio.TimeoutError:
+        metrics.LLM_FALLBACKS.inc(reason="timeout")
+        metrics.EXPLANATIONS.inc(source="fallback")
+        return _fallback_explanation(
+            drug, gene, diplotype, phenotype, variants,
+            f"LLM timed out after {LLM_TIMEOUT_SECONDS:g}s",
+        )
+
+
+def _with_citations(cached: Dict, variants: List[Dict]) -> Dict:
+    return {**cached, "variant_citations": [v["rsid"] for v in variants]}
 
 
 def _fallback_explanation(
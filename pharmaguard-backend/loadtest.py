@@ -0,0 +1,398 @@
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import knowledge_base
+import synthetic_vcf
+
+# ── Load testing ──────────────────────────────────────────────────────────────
+# Drives a running API at a fixed concurrency with a weighted mix of request
+# kinds, against a local stand-in for Groq's chat-completions API whose
+# latency and error rate are tunable, so LLM effects can be studied offline.
+# Per-stage latencies come from the server's Server-Timing header
+# (SERVER_TIMING=1); client-side latency and throughput from the driver.
+
+LLM_STUB_PATH = "/openai/v1/chat/completions"
+REQUEST_KINDS = ("analyze", "deferred", "batch", "panel")
+DEFAULT_MIX = "analyze=8,deferred=1,batch=1"
+BATCH_DRUGS = 3
+SERVER_START_TIMEOUT = 60.0
+PERCENTILES = (50, 95, 99)
+# Server counters reported as before/after differences
+METRIC_PREFIXES = (
+    "pharmaguard_llm_calls", "pharmaguard_llm_fallbacks", "pharmaguard_explanations",
+    "pharmaguard_parse_pool_rejected", "pharmaguard_cache_hits", "pharmaguard_cache_misses",
+)
+
+_STUB_TEXT = (
+    "This genotype alters enzyme activity for the drug in question.\n"
+    "Clinical guidance follows the deterministic risk assessment.\n"
+    "Mechanism: the detected variants change metabolic capacity."
+)
+
+
+def run(
+    url: Optional[str] = None,
+    concurrency: int = 50,
+    duration: Optional[float] = 30.0,
+    requests: Optional[int] = None,
+    mix: str = DEFAULT_MIX,
+    vcfs: Optional[List[bytes]] = None,
+    llm_latency: float = 0.5,
+    llm_jitter: float = 0.2,
+    llm_error_rate: float = 0.0,
+    llm_error_status: int = 500,
+    llm_cache: bool = False,
+    server_workers: int = 1,
+    seed: int = 0,
+    log: Callable[[str], None] = lambda msg: None,
+) -> Dict:
+    """
+    Load-test `url`, or by default a fresh local server (uvicorn) whose LLM
+    calls go to a StubLLM. The explanation cache is disabled on the local
+    server unless `llm_cache`, so every analysis reaches the stub.
+    """
+    import httpx
+
+    weights = parse_mix(mix)
+    vcfs = vcfs or synthetic_vcfs(count=8, records=20_000, seed=seed)
+    drugs = list(knowledge_base.current().drug_genes)
+    stub = None
+
+    with ExitStack() as stack:
+        if url is None:
+            stub = StubLLM(llm_latency, llm_jitter, llm_error_rate, llm_error_status, seed=seed)
+            stack.callback(stub.stop)
+            env = {"GROQ_API_KEY": "stub", "GROQ_BASE_URL": stub.start(), "SERVER_TIMING": "1"}
+            if not llm_cache:
+                env["EXPLANATION_CACHE_TTL_SECONDS"] = "0"
+            log(f"starting API server ({server_workers} worker(s)), LLM stub at {env['GROQ_BASE_URL']}")
+            url = stack.enter_context(serve(env, server_workers))
+
+        before = counters(httpx.get(url + "/metrics", timeout=10).text, METRIC_PREFIXES)
+        log(f"driving {url}: concurrency {concurrency}, mix {weights}")
+        samples, elapsed = asyncio.run(_drive_url(url, vcfs, weights, drugs, concurrency, duration, requests, seed))
+        after = counters(httpx.get(url + "/metrics", timeout=10).text, METRIC_PREFIXES)
+
+    result = report(samples, elapsed)
+    result["server_metrics"] = {k: v - before.get(k, 0.0) for k, v in after.items() if v != before.get(k, 0.0)}
+    result["llm_stub"] = stub.stats() if stub is not None else None
+    result["config"] = {
+        "url":            url,
+        "concurrency":    concurrency,
+        "duration_s":     duration,
+        "requests":       requests,
+        "mix":            weights,
+        "vcfs":           len(vcfs),
+        "llm_latency_s":  llm_latency if stub else None,
+        "llm_jitter_s":   llm_jitter if stub else None,
+        "llm_error_rate": llm_error_rate if stub else None,
+        "server_workers": server_workers if stub else None,
+    }
+    return result
+
+
+async def _drive_url(url: str, vcfs, mix, drugs, concurrency, duration, requests, seed):
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=300) as client:
+        return await drive(client, vcfs, mix, drugs, concurrency, duration, requests, seed)
+
+
+class StubLLM:
+    """
+    Local HTTP server answering Groq chat-completion calls after a random
+    delay of latency ± jitter seconds; `error_rate` of calls fail with
+    `error_status` instead. Each call runs on its own thread.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        jitter: float = 0.2,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.calls = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if self.path != LLM_STUB_PATH:
+                    return self._reply(404, {"error": {"message": f"unknown path {self.path}"}})
+                delay, fail = stub._next_call()
+                time.sleep(delay)
+                if fail:
+                    return self._reply(stub.error_status, {"error": {"message": "stub error", "type": "stub"}})
+                self._reply(200, _completion())
+
+            def _reply(self, status: int, body: Dict) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = _StubServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="llm-stub", daemon=True).start()
+        return self.base_url
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def stats(self) -> Dict:
+        return {"calls": self.calls, "errors": self.errors}
+
+    def _next_call(self) -> Tuple[float, bool]:
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self._rng.uniform(self.latency - self.jitter, self.latency + self.jitter))
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return delay, fail
+
+
+class _StubServer(ThreadingHTTPServer):
+    # Hundreds of concurrent LLM calls may arrive at once
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def _completion() -> Dict:
+    return {
+        "id":      "stub-completion",
+        "object":  "chat.completion",
+        "created": int(time.time()),
+        "model":   "llama-3.3-70b-versatile",
+        "choices": [{
+            "index":         0,
+            "message":       {"role": "assistant", "content": _STUB_TEXT},
+            "finish_reason": "stop",
+        }],
+        "usage":   {"prompt_tokens": 200, "completion_tokens": 60, "total_tokens": 260},
+    }
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """'analyze=8,batch=1' → {kind: weight}; raises ValueError on unknown kinds."""
+    mix = {}
+    for part in value.split(","):
+        if not part.strip():
+            continue
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in REQUEST_KINDS:
+            raise ValueError(f"unknown request kind {kind!r}; expected one of {REQUEST_KINDS}")
+        mix[kind] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("request mix is empty")
+    return mix
+
+
+async def drive(
+    client,
+    vcfs: List[bytes],
+    mix: Dict[str, float],
+    drugs: List[str],
+    concurrency: int,
+    duration: Optional[float] = None,
+    requests: Optional[int] = None,
+    seed: int = 0,
+) -> Tuple[List[Dict], float]:
+    """
+    Closed-loop load: `concurrency` clients each send their next request as
+    soon as the previous one returns, until `duration` seconds have passed
+    or `requests` have been sent. `client` is an httpx.AsyncClient bound to
+    the API. Returns (one sample per request, elapsed seconds).
+    """
+    rng = random.Random(seed)
+    kinds, weights = list(mix), list(mix.values())
+    samples: List[Dict] = []
+    sent = 0
+    start = time.perf_counter()
+    deadline = start + duration if duration else None
+
+    def more() -> bool:
+        if requests is not None and sent >= requests:
+            return False
+        return deadline is None or time.perf_counter() < deadline
+
+    async def worker():
+        nonlocal sent
+        while more():
+            sent += 1
+            kind = rng.choices(kinds, weights)[0]
+            path, data = _request(kind, rng, drugs)
+            files = {"file": ("load.vcf", rng.choice(vcfs))}
+            t0 = time.perf_counter()
+            try:
+                r = await client.post(path, files=files, data=data)
+                status, timing = r.status_code, r.headers.get("server-timing")
+            except Exception as e:
+                status, timing = type(e).__name__, None
+            samples.append({
+                "kind":      kind,
+                "status":    status,
+                "latency_s": time.perf_counter() - t0,
+                "stages":    parse_server_timing(timing),
+            })
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - start
+
+
+def _request(kind: str, rng: random.Random, drugs: List[str]) -> Tuple[str, Dict]:
+    if kind == "analyze":
+        return "/analyze", {"drug": rng.choice(drugs)}
+    if kind == "deferred":
+        return "/analyze", {"drug": rng.choice(drugs), "defer_explanation": "true"}
+    if kind == "batch":
+        return "/analyze/batch", {"drugs": ",".join(rng.sample(drugs, min(BATCH_DRUGS, len(drugs))))}
+    return "/analyze/panel", {}
+
+
+def parse_server_timing(header: Optional[str]) -> List[Tuple[str, float]]:
+    """'parse;dur=1.2, total;dur=3' → [(stage, ms)], in header order."""
+    stages = []
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                stages.append((name, float(value)))
+    return stages
+
+
+def report(samples: List[Dict], elapsed: float) -> Dict:
+    """Throughput, status counts, and p50/p95/p99 per request kind and per stage."""
+    statuses: Dict[str, int] = {}
+    for s in samples:
+        statuses[str(s["status"])] = statuses.get(str(s["status"]), 0) + 1
+    ok = [s for s in samples if s["status"] == 200]
+
+    by_kind: Dict[str, List[float]] = {"all": [s["latency_s"] * 1000 for s in ok]}
+    for s in ok:
+        by_kind.setdefault(s["kind"], []).append(s["latency_s"] * 1000)
+    by_stage: Dict[str, List[float]] = {}
+    for s in ok:
+        for stage, ms in s["stages"]:
+            by_stage.setdefault(stage, []).append(ms)
+
+    return {
+        "requests":       len(samples),
+        "elapsed_s":      round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "status":         statuses,
+        "latency_ms":     {kind: _summary(values) for kind, values in by_kind.items()},
+        "stages_ms":      {stage: _summary(values) for stage, values in by_stage.items()},
+    }
+
+
+def _summary(values: List[float]) -> Dict:
+    values = sorted(values)
+    summary = {"count": len(values)}
+    for p in PERCENTILES:
+        summary[f"p{p}"] = round(_percentile(values, p), 3) if values else None
+    summary["max"] = round(values[-1], 3) if values else None
+    return summary
+
+
+def _percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+def synthetic_vcfs(count: int, records: int, samples: int = 1, seed: int = 0) -> List[bytes]:
+    """`count` distinct synthetic VCFs; fewer means more parsed-VCF cache hits."""
+    kb = knowledge_base.current()
+    return [
+        synthetic_vcf.generate_bytes("none", records=records, samples=samples, seed=seed + i, kb=kb)
+        for i in range(count)
+    ]
+
+
+def counters(metrics_text: str, prefixes: Tuple[str, ...]) -> Dict[str, float]:
+    """Samples of a /metrics scrape whose names start with one of `prefixes`."""
+    values = {}
+    for line in metrics_text.splitlines():
+        if line.startswith(prefixes) and "_bucket" not in line:
+            name, _, value = line.rpartition(" ")
+            values[name] = float(value)
+    return values
+
+
+@contextmanager
+def serve(env: Dict[str, str], workers: int = 1) -> Iterator[str]:
+    """Run `uvicorn main:app` on a free local port with `env` added; yields its URL."""
+    import httpx
+
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env={**os.environ, **env},
+    )
+    try:
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"API server exited with status {proc.returncode}")
+            try:
+                if httpx.get(url + "/", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"API server did not start within {SERVER_START_TIMEOUT:g}s")
+            time.sleep(0.2)
+        yield url
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
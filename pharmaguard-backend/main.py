@@ -1,18 +1,42 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
 import uuid
+from contextlib import contextmanager
+from typing import BinaryIO, List, Optional, Tuple
 from dotenv import load_dotenv
 import pathlib
 # Load .env from the same directory as this file — works regardless of where uvicorn is launched from
 load_dotenv(dotenv_path=pathlib.Path(__file__).parent / ".env")
 from datetime import datetime
 
-from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi import FastAPI, File, Form, HTTPException, Query, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+import explanation_bundle
+import explanation_cache
+import explanation_jobs
+import knowledge_base
+import metrics
+import parse_pool
+import profiling
+import vcf_cache
+
+from cohort_engine import analyze_genotype_matrix
+from cohort_parallel import analyze_vcf_parallel
+from confidence import compute_confidence
 from diplotype_engine import resolve_diplotype
-from drug_risk_engine import DRUG_GENE_MAP, assess_drug_risk
-from llm_explainer import generate_explanation
+from drug_risk_engine import assess_drug_risk
+from genotype_matrix import GenotypeMatrixParser
+from knowledge_base import KnowledgeBase
+from llm_explainer import generate_explanation_async
 from phenotype_engine import infer_phenotype
-from vcf_parser import get_gene_coverage, parse_vcf, validate_vcf_content
+from vcf_index import parse_indexed_vcf, read_index
+from vcf_parser import VCFSizeError, VCFStreamParser, VCFValidationError, get_gene_coverage
 
 app = FastAPI(
     title="PharmaGuard API",
@@ -27,67 +51,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-MAX_FILE_SIZE = 5 * 1024 * 1024  # 5 MB
-
-
-# ── Confidence Calculator ──────────────────────────────────────────────────────
-
-CLINSIG_SCORES = {
-    "pathogenic":              1.00,
-    "likely_pathogenic":       0.85,
-    "risk_factor":             0.65,
-    "uncertain_significance":  0.40,
-    "likely_benign":           0.20,
-    "benign":                  0.10,
-}
-
-def compute_confidence(variants: list) -> float:
-    """
-    Dynamically compute confidence score (0.0–0.95) from VCF variant signals.
-    Replaces the hardcoded 0.90 value.
-
-    Weights:
-      QUAL score          25%
-      Read depth (DP)     25%
-      Genotype quality    20%  (falls back to QUAL if GQ absent)
-      FILTER = PASS       15%
-      Clinical sig tier   10%
-      AF penalty           soft penalty if AF < 0.10
-    """
-    if not variants:
-        return 0.0
-
-    scores = []
-    for v in variants:
-        qual  = float(v.get("qual") or 0)
-        depth = int(v.get("depth") or 0)
-        filt  = str(v.get("filter") or "UNKNOWN").split(",")[0].strip().upper()
-        clinsig = str(v.get("clinical_significance") or "").lower().replace(" ", "_")
-        af    = v.get("allele_freq")
+# Limit on decompressed VCF text; parsing is streamed, so this bounds work, not memory
+MAX_FILE_SIZE = int(os.getenv("MAX_VCF_MB", "1024")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024    # 64 KB per read — bounds per-request buffering
+# Directory that `vcf_path` requests may read from; unset disables server-side mode
+LOCAL_VCF_ROOT = os.getenv("LOCAL_VCF_ROOT")
+# Report each request's pipeline stage timings in a Server-Timing header
+SERVER_TIMING = os.getenv("SERVER_TIMING", "").lower() in ("1", "true", "yes")
 
-        qual_score   = min(qual, 99) / 99
-        depth_score  = min(depth, 200) / 200
-        gq_score     = qual_score          # GQ not stored by vcf_parser; fall back to QUAL
-        filter_score = 1.0 if filt == "PASS" else 0.0
-        clinsig_score = CLINSIG_SCORES.get(clinsig, 0.30)
+# Compile the knowledge base before the first request; reload it when the file changes
+knowledge_base.current()
+knowledge_base.watch()
 
-        raw = (
-            qual_score    * 0.25 +
-            depth_score   * 0.25 +
-            gq_score      * 0.20 +
-            filter_score  * 0.15 +
-            clinsig_score * 0.10
-        )  # max possible = 0.95 (evidence weight removed since not in VCF parser output)
 
-        # Soft penalty: very low AF calls are less reliable
-        if af is not None and af < 0.10:
-            raw -= (0.10 - af) * 0.5
+async def _server_timing(request: Request, call_next):
+    with metrics.trace_stages() as stages:
+        start = time.perf_counter()
+        response = await call_next(request)
+        total_ms = (time.perf_counter() - start) * 1000
+    response.headers["Server-Timing"] = metrics.server_timing(stages, total_ms)
+    return response
 
-        scores.append(max(0.0, raw))
 
-    # Average across all matched variants, cap at 0.95
-    avg = sum(scores) / len(scores)
-    return round(min(0.95, max(0.05, avg)), 2)
+if SERVER_TIMING:
+    app.middleware("http")(_server_timing)
 
 
 @app.get("/")
@@ -108,64 +95,611 @@ def debug_env():
 
 @app.get("/supported-drugs")
 def supported_drugs():
-    return {"drugs": list(DRUG_GENE_MAP.keys())}
+    return {"drugs": list(knowledge_base.current().drug_genes.keys())}
+
+
+@app.get("/knowledge-base")
+def knowledge_base_info():
+    return knowledge_base.info()
+
+
+@app.post("/knowledge-base/reload")
+def reload_knowledge_base():
+    """
+    Re-read the knowledge-base file and swap it in. In-flight requests finish
+    on the version they started with; an invalid file leaves it active.
+    """
+    try:
+        knowledge_base.reload()
+    except Exception as e:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Knowledge base reload failed, still serving version {knowledge_base.current().version}: {e}",
+        )
+    return knowledge_base.info()
 
 
 @app.post("/analyze")
 async def analyze(
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
     drug: str = Form(...),
+    index: Optional[UploadFile] = File(None),
+    vcf_path: Optional[str] = Form(None),
+    defer_explanation: bool = Form(False),
+    vcf_id: Optional[str] = Form(None),
+    profile: bool = Form(False),
 ):
-    # ── 1. Read file ───────────────────────────────────────────────────
-    content_bytes = await file.read()
+    # One knowledge-base version for the whole request
+    kb = knowledge_base.current()
 
-    if len(content_bytes) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="File exceeds 5MB limit.")
+    if profile:
+        drug_upper, gene = _drug_gene(drug, kb)
+        return await _analyze_profiled(file, index, vcf_path, vcf_id, drug_upper, gene, kb)
 
-    try:
-        content = content_bytes.decode("utf-8")
-    except UnicodeDecodeError:
-        content = content_bytes.decode("latin-1")
+    # ── 1–3. Read, validate and parse VCF (or reuse a stored parse) ───
+    variants = await _ingest_vcf(file, index, vcf_path, vcf_id=vcf_id, kb=kb)
+
+    # ── 4. Validate drug ──────────────────────────────────────────────
+    drug_upper, gene = _drug_gene(drug, kb)
 
-    # ── 2. Validate VCF ───────────────────────────────────────────────
-    is_valid, error_msg = validate_vcf_content(content)
-    if not is_valid:
-        raise HTTPException(status_code=400, detail=f"Invalid VCF file: {error_msg}")
+    return await _analyze_drug(drug_upper, gene, variants, kb, defer_explanation=defer_explanation)
 
-    # ── 3. Parse VCF ──────────────────────────────────────────────────
-    try:
-        variants = parse_vcf(content)
-    except Exception as e:
-        raise HTTPException(status_code=422, detail=f"VCF parsing failed: {str(e)}")
 
-    # ── 4. Validate drug ──────────────────────────────────────────────
-    drug_upper = drug.strip().upper()
-    gene = DRUG_GENE_MAP.get(drug_upper)
+def _drug_gene(drug: str, kb: KnowledgeBase) -> Tuple[str, str]:
+    with metrics.timed("drug_lookup"):
+        drug_upper = drug.strip().upper()
+        gene = kb.drug_genes.get(drug_upper)
+
+    if not gene:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Drug '{drug}' not supported. Supported: {list(kb.drug_genes.keys())}",
+        )
+    return drug_upper, gene
+
+
+async def _analyze_profiled(
+    file: Optional[UploadFile],
+    index: Optional[UploadFile],
+    vcf_path: Optional[str],
+    vcf_id: Optional[str],
+    drug_upper: str,
+    gene: str,
+    kb: KnowledgeBase,
+) -> dict:
+    """
+    /analyze with profile=1: parse through risk assessment on one parse-pool
+    thread under cProfile. The upload is parsed fresh (no VCF cache) so the
+    parse shows up in the profile. The explanation is never deferred; it is
+    awaited after the pool job, so the LLM round-trip does not hold a parse
+    slot, and is reported as a stage with wall time only.
+    """
+    if not profiling.PROFILING_ENABLED:
+        raise HTTPException(status_code=403, detail="Request profiling is disabled.")
+
+    with _vcf_errors():
+        if vcf_path:
+            parse, args = _ingest_local_vcf, (_local_vcf_path(vcf_path), VCFStreamParser, kb)
+        elif vcf_id and file is None:
+            parse, args = _stored_variants, (vcf_id, kb)
+        elif file is None:
+            raise HTTPException(status_code=400, detail="No VCF file uploaded.")
+        else:
+            index_bytes = await index.read() if index is not None else None
+            parse, args = _parse_vcf_file, (file.file, index_bytes, VCFStreamParser, kb)
+        result, explanation_args, report = await parse_pool.pool.run(
+            _run_profiled, parse, args, drug_upper, gene, kb,
+        )
+
+    if explanation_args is not None:
+        start = time.perf_counter()
+        result["llm_generated_explanation"] = await _explain(explanation_args)
+        report["stages"].append({
+            "stage":   "explanation",
+            "wall_ms": round((time.perf_counter() - start) * 1000, 3),
+            "cpu_ms":  None,
+        })
+    return {**result, "profile": report}
+
+
+def _run_profiled(
+    parse, args: tuple, drug_upper: str, gene: str, kb: KnowledgeBase,
+) -> Tuple[dict, Optional[dict], dict]:
+    with profiling.RequestProfile() as profile:
+        variants = parse(*args)
+        result, explanation_args = _assess_drug(drug_upper, gene, variants, kb)
+    return result, explanation_args, profile.report()
+
+
+@app.post("/analyze/batch")
+async def analyze_batch(
+    file: Optional[UploadFile] = File(None),
+    drugs: List[str] = Form(...),
+    index: Optional[UploadFile] = File(None),
+    vcf_path: Optional[str] = Form(None),
+    defer_explanation: bool = Form(False),
+    vcf_id: Optional[str] = Form(None),
+):
+    """
+    Multi-drug analysis: the VCF is uploaded and parsed once, then the
+    deterministic pipeline runs per drug. Accepts repeated `drugs` fields
+    and/or comma-separated values.
+    """
+    kb = knowledge_base.current()
+
+    # Validate drugs first — no point parsing a file we will reject
+    with metrics.timed("drug_lookup"):
+        requested = _requested_drugs(drugs, kb)
+    if not requested:
+        raise HTTPException(status_code=400, detail="No drugs specified.")
+
+    variants = await _ingest_vcf(file, index, vcf_path, vcf_id=vcf_id, kb=kb)
+    patient_id = _new_patient_id()
+
+    # Per-drug explanations are awaited concurrently
+    results = await asyncio.gather(*(
+        _analyze_drug(drug_upper, kb.drug_genes[drug_upper], variants, kb, patient_id, defer_explanation)
+        for drug_upper in requested
+    ))
+    return {"results": list(results)}
+
+
+@app.post("/analyze/panel")
+async def analyze_panel(
+    file: Optional[UploadFile] = File(None),
+    drugs: List[str] = Form([]),
+    index: Optional[UploadFile] = File(None),
+    vcf_path: Optional[str] = Form(None),
+    parallel: bool = Form(False),
+):
+    """
+    Cohort mode for multi-sample VCFs: every sample × drug (all supported
+    drugs by default) in one pass, deterministic stages only. Returns a
+    compact matrix: matrix[sample][drug] = [diplotype, phenotype,
+    risk_label, severity, confidence_score].
+
+    parallel=true fans a full-file scan out over the cohort process pool.
+    """
+    kb = knowledge_base.current()
+    requested = _requested_drugs(drugs, kb) or list(kb.drug_genes.keys())
+    if parallel and index is None:
+        return await _analyze_panel_parallel(file, vcf_path, requested, kb)
+
+    # Genotypes go straight into an int8 sites × samples matrix — no
+    # per-sample variant dicts for large joint-called cohorts
+    matrix = await _ingest_vcf(file, index, vcf_path, parser_cls=GenotypeMatrixParser, kb=kb)
+    with metrics.timed("cohort"):
+        return analyze_genotype_matrix(matrix, requested, kb)
+
+
+async def _analyze_panel_parallel(
+    file: Optional[UploadFile],
+    vcf_path: Optional[str],
+    drugs: List[str],
+    kb: KnowledgeBase,
+) -> dict:
+    with _vcf_errors():
+        if vcf_path:
+            path = _local_vcf_path(vcf_path)
+            return await parse_pool.pool.run(_scan_cohort, str(path), drugs, kb)
+
+        if file is None:
+            raise HTTPException(status_code=400, detail="No VCF file uploaded.")
+
+        # Workers need random access, so the upload is spooled to disk first
+        with tempfile.NamedTemporaryFile(suffix=".vcf") as tmp:
+            received = 0
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                received += len(chunk)
+                if received > MAX_FILE_SIZE:
+                    raise VCFSizeError(f"VCF exceeds {MAX_FILE_SIZE} byte limit")
+                tmp.write(chunk)
+            tmp.flush()
+            return await parse_pool.pool.run(_scan_cohort, tmp.name, drugs, kb)
+
+
+def _scan_cohort(path: str, drugs: List[str], kb: KnowledgeBase) -> dict:
+    with metrics.timed("cohort_scan"):
+        return analyze_vcf_parallel(path, drugs, None, MAX_FILE_SIZE, kb)
+
+
+def _requested_drugs(drugs: List[str], kb: KnowledgeBase) -> List[str]:
+    """Normalize repeated and/or comma-separated drug fields; 400 on unsupported."""
+    requested = []
+    for entry in drugs:
+        for name in entry.split(","):
+            name = name.strip().upper()
+            if name and name not in requested:
+                requested.append(name)
+
+    unsupported = [d for d in requested if d not in kb.drug_genes]
+    if unsupported:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Drug(s) {unsupported} not supported. Supported: {list(kb.drug_genes.keys())}",
+        )
+    return requested
+
+
+@app.post("/vcf")
+async def register_vcf(
+    file: Optional[UploadFile] = File(None),
+    index: Optional[UploadFile] = File(None),
+    vcf_path: Optional[str] = Form(None),
+):
+    """
+    Upload and parse a VCF once; returns a `vcf_id` to analyze drugs against
+    without re-uploading. For uploads the ID is the SHA-256 of the file.
+    Entries expire after VCF_CACHE_TTL_SECONDS.
+    """
+    variants, vcf_id = await _ingest_vcf_keyed(file, index, vcf_path, kb=knowledge_base.current())
+    if vcf_id is None:
+        vcf_id = uuid.uuid4().hex
+        vcf_cache.cache.put(vcf_id, variants)
+    return _vcf_summary(vcf_id, variants)
+
+
+@app.head("/vcf/{vcf_id}")
+@app.get("/vcf/{vcf_id}")
+def get_vcf(vcf_id: str):
+    """
+    Whether a parsed VCF is stored under this ID (the SHA-256 of an uploaded
+    file, or an ID from POST /vcf). On a hit, /analyze accepts `vcf_id` in
+    place of the upload.
+    """
+    return _vcf_summary(vcf_id.lower(), _stored_variants(vcf_id, knowledge_base.current()))
+
 
+@app.delete("/vcf/{vcf_id}", status_code=204)
+def delete_vcf(vcf_id: str):
+    if not vcf_cache.cache.delete(vcf_id.lower()):
+        raise HTTPException(status_code=404, detail="VCF not stored.")
+
+
+@app.get("/vcf/{vcf_id}/analyze")
+async def analyze_stored(vcf_id: str, drug: str, defer_explanation: bool = False):
+    """Same as POST /analyze, against a stored VCF."""
+    kb = knowledge_base.current()
+    variants = _stored_variants(vcf_id, kb)
+    drug_upper = drug.strip().upper()
+    gene = kb.drug_genes.get(drug_upper)
     if not gene:
         raise HTTPException(
             status_code=400,
-            detail=f"Drug '{drug}' not supported. Supported: {list(DRUG_GENE_MAP.keys())}",
+            detail=f"Drug '{drug}' not supported. Supported: {list(kb.drug_genes.keys())}",
+        )
+    return await _analyze_drug(drug_upper, gene, variants, kb, defer_explanation=defer_explanation)
+
+
+@app.get("/vcf/{vcf_id}/analyze/batch")
+async def analyze_stored_batch(vcf_id: str, drugs: List[str] = Query(...), defer_explanation: bool = False):
+    """Same as POST /analyze/batch, against a stored VCF (`drugs` repeated and/or comma-separated)."""
+    kb = knowledge_base.current()
+    requested = _requested_drugs(drugs, kb)
+    if not requested:
+        raise HTTPException(status_code=400, detail="No drugs specified.")
+
+    variants = _stored_variants(vcf_id, kb)
+    patient_id = _new_patient_id()
+    results = await asyncio.gather(*(
+        _analyze_drug(drug_upper, kb.drug_genes[drug_upper], variants, kb, patient_id, defer_explanation)
+        for drug_upper in requested
+    ))
+    return {"results": list(results)}
+
+
+def _stored_variants(vcf_id: str, kb: KnowledgeBase) -> list:
+    """
+    A stored parse, if `kb` selected its rows. Stored IDs cannot be parsed
+    again, so one from another knowledge base is dropped with 410.
+    """
+    key = vcf_id.lower()
+    variants = vcf_cache.cache.get(key)
+    if variants is None:
+        raise HTTPException(status_code=404, detail="VCF not stored or expired; upload it again.")
+    if variants.knowledge_base_fingerprint != kb.fingerprint:
+        vcf_cache.cache.delete(key)
+        raise HTTPException(
+            status_code=410,
+            detail="VCF was parsed against a different knowledge base; upload it again.",
+        )
+    return variants
+
+
+def _vcf_summary(vcf_id: str, variants: list) -> dict:
+    return {
+        "vcf_id":                 vcf_id,
+        "samples":                variants.samples,
+        "build":                  variants.build,
+        "variants_detected":      len(variants),
+        "gene_coverage":          get_gene_coverage(variants),
+        "expires_in":             vcf_cache.VCF_CACHE_TTL_SECONDS,
+        # Version whose allele sites selected the stored rows
+        "knowledge_base_version": variants.knowledge_base_version,
+    }
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "parsed_vcfs":        vcf_cache.cache.stats(),
+        "explanations":       explanation_cache.cache.stats(),
+        "explanation_bundle": explanation_bundle.info(),
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Pipeline, cache and parse-pool metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def _cache_stats() -> dict:
+    return {"parsed_vcfs": vcf_cache.cache.stats(), "explanations": explanation_cache.cache.stats()}
+
+
+metrics.Collected(
+    "pharmaguard_cache_hits_total", "counter", "Cache lookups that found an entry.", ("cache",),
+    lambda: [((name,), s["hits"]) for name, s in _cache_stats().items()],
+)
+metrics.Collected(
+    "pharmaguard_cache_misses_total", "counter", "Cache lookups that found no entry.", ("cache",),
+    lambda: [((name,), s["misses"]) for name, s in _cache_stats().items()],
+)
+metrics.Collected(
+    "pharmaguard_cache_entries", "gauge", "Entries held in memory.", ("cache",),
+    lambda: [((name,), s["entries"]) for name, s in _cache_stats().items()],
+)
+metrics.Collected(
+    "pharmaguard_parse_pool_parses", "gauge", "Parses on the parse pool, by state (running, queued).", ("state",),
+    lambda: [((state,), parse_pool.pool.stats()[state]) for state in ("running", "queued")],
+)
+metrics.Collected(
+    "pharmaguard_parse_pool_rejected_total", "counter", "Parses refused with 503 because the queue was full.", (),
+    lambda: [((), parse_pool.pool.rejected)],
+)
+
+
+@app.get("/parse-pool")
+async def parse_pool_stats():
+    """Parse workers, queued parses and requests refused with 503."""
+    return parse_pool.pool.stats()
+
+
+@app.get("/explanations/{explanation_id}")
+def get_explanation(explanation_id: str):
+    job = explanation_jobs.get(explanation_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired explanation ID.")
+    return job
+
+
+@app.get("/explanations/{explanation_id}/stream")
+async def stream_explanation(explanation_id: str):
+    """Server-sent events: current status, then the explanation when ready."""
+    job = explanation_jobs.get(explanation_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired explanation ID.")
+
+    async def events():
+        yield f"event: status\ndata: {job['status']}\n\n"
+        finished = await explanation_jobs.wait(explanation_id)
+        if finished is not None:
+            yield f"event: explanation\ndata: {json.dumps(finished['llm_generated_explanation'])}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+async def _ingest_vcf(
+    file: Optional[UploadFile],
+    index: Optional[UploadFile] = None,
+    vcf_path: Optional[str] = None,
+    parser_cls: type = VCFStreamParser,
+    vcf_id: Optional[str] = None,
+    kb: Optional[KnowledgeBase] = None,
+) -> list:
+    variants, _ = await _ingest_vcf_keyed(file, index, vcf_path, parser_cls, vcf_id, kb)
+    return variants
+
+
+async def _ingest_vcf_keyed(
+    file: Optional[UploadFile],
+    index: Optional[UploadFile] = None,
+    vcf_path: Optional[str] = None,
+    parser_cls: type = VCFStreamParser,
+    vcf_id: Optional[str] = None,
+    kb: Optional[KnowledgeBase] = None,
+) -> Tuple[list, Optional[str]]:
+    """Parsed variants plus the VCF-store key they are stored under (None if not stored)."""
+    kb = kb or knowledge_base.current()
+    with _vcf_errors():
+        # Server-side mode: read a VCF (and its index, if present) from disk
+        if vcf_path:
+            path = _local_vcf_path(vcf_path)
+            return await parse_pool.pool.run(_ingest_local_vcf, path, parser_cls, kb), None
+
+        # Previously uploaded file: no upload, no parse
+        if vcf_id and file is None:
+            return _stored_variants(vcf_id, kb), vcf_id.lower()
+
+        if file is None:
+            raise HTTPException(status_code=400, detail="No VCF file uploaded.")
+
+        # ── 1–3. Read, validate and parse on the parse pool, off the event loop
+        index_bytes = await index.read() if index is not None else None
+        if parser_cls is not VCFStreamParser:
+            return await parse_pool.pool.run(_parse_vcf_file, file.file, index_bytes, parser_cls, kb), None
+        return await parse_pool.pool.run(_parse_vcf_cached, file.file, index_bytes, kb)
+
+
+def _parse_vcf_cached(vcf: BinaryIO, index_bytes: Optional[bytes], kb: KnowledgeBase) -> Tuple[list, str]:
+    """
+    Parse pool job: hash the upload, then parse it unless the parsed-VCF
+    cache has it. Hashing runs here too, so large uploads are admitted (or
+    refused) by the pool before they cost any CPU.
+    """
+    # Parsed variants are cached by the hash of the raw upload; hashing
+    # the spooled upload is far cheaper than parsing it again
+    with metrics.timed("upload_hash"):
+        digest = _upload_hash(vcf)
+    cached = vcf_cache.cache.get(digest)
+    # A parse against other knowledge-base data may have kept different
+    # sites; the fingerprint changes even when the version is not bumped
+    if cached is not None and cached.knowledge_base_fingerprint == kb.fingerprint:
+        return cached, digest
+
+    variants = _parse_vcf_file(vcf, index_bytes, VCFStreamParser, kb)
+    vcf_cache.cache.put(digest, variants)
+    return variants, digest
+
+
+def _upload_hash(upload: BinaryIO) -> str:
+    """SHA-256 of the uploaded bytes, read in chunks; rewinds the upload."""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: upload.read(UPLOAD_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def _parse_vcf_file(
+    vcf: BinaryIO,
+    index_bytes: Optional[bytes],
+    parser_cls: type,
+    kb: KnowledgeBase,
+) -> list:
+    """
+    Blocking read + parse of an open VCF (plain, gzip or BGZF); the header
+    is validated from the first chunk. With a .tbi/.csi index only the
+    pharmacogene loci are read.
+    """
+    with metrics.timed("parse"):
+        if index_bytes is not None:
+            return parse_indexed_vcf(
+                vcf, read_index(index_bytes), max_bytes=MAX_FILE_SIZE, parser_cls=parser_cls, kb=kb,
+            )
+
+        parser = parser_cls(max_bytes=MAX_FILE_SIZE, kb=kb)
+        for chunk in iter(lambda: vcf.read(UPLOAD_CHUNK_SIZE), b""):
+            parser.feed(chunk)
+        return parser.close()
+
+
+def _ingest_local_vcf(path: pathlib.Path, parser_cls: type, kb: KnowledgeBase) -> list:
+    index_bytes = None
+    for suffix in (".tbi", ".csi"):
+        index_path = path.with_name(path.name + suffix)
+        if index_path.is_file():
+            index_bytes = index_path.read_bytes()
+            break
+
+    with open(path, "rb") as f:
+        return _parse_vcf_file(f, index_bytes, parser_cls, kb)
+
+
+def _local_vcf_path(vcf_path: str) -> pathlib.Path:
+    if not LOCAL_VCF_ROOT:
+        raise HTTPException(status_code=403, detail="Server-side VCF paths are disabled.")
+
+    root = pathlib.Path(LOCAL_VCF_ROOT).resolve()
+    path = (root / vcf_path).resolve()
+    if root not in path.parents:
+        raise HTTPException(status_code=400, detail="VCF path must be inside LOCAL_VCF_ROOT.")
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail=f"VCF file '{vcf_path}' not found.")
+    return path
+
+
+@contextmanager
+def _vcf_errors():
+    """Map parser exceptions onto the API's HTTP error contract."""
+    try:
+        yield
+    except HTTPException:
+        raise
+    except parse_pool.PoolBusy as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy parsing other VCFs; retry shortly.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except VCFSizeError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File exceeds {MAX_FILE_SIZE // (1024 * 1024)}MB limit (uncompressed).",
         )
+    except VCFValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid VCF file: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"VCF parsing failed: {str(e)}")
+
+
+def _new_patient_id() -> str:
+    return f"PATIENT_{uuid.uuid4().hex[:6].upper()}"
+
+
+async def _analyze_drug(
+    drug_upper: str,
+    gene: str,
+    variants: list,
+    kb: KnowledgeBase,
+    patient_id: Optional[str] = None,
+    defer_explanation: bool = False,
+) -> dict:
+    result, explanation_args = _assess_drug(drug_upper, gene, variants, kb, patient_id)
+    if explanation_args is not None:
+        result["llm_generated_explanation"] = await _explain(explanation_args, defer_explanation)
+    return result
+
+
+async def _explain(explanation_args: dict, defer: bool = False) -> dict:
+    # ── 9. LLM explanation (LAST — purely explanatory) ────────────────
+    if defer:
+        # Return the actionable result now; text arrives via /explanations/{id}
+        job_id = explanation_jobs.submit(**explanation_args)
+        return explanation_jobs.pending_explanation(job_id, explanation_args["variants"])
+    with metrics.timed("explanation"):
+        return await generate_explanation_async(**explanation_args)
+
+
+def _assess_drug(
+    drug_upper: str,
+    gene: str,
+    variants: list,
+    kb: KnowledgeBase,
+    patient_id: Optional[str] = None,
+) -> Tuple[dict, Optional[dict]]:
+    """
+    The deterministic part of an analysis: the response, still missing its
+    explanation, plus the arguments to explain it with (None when the gene
+    has no call and the response is already complete).
+    """
+    patient_id = patient_id or _new_patient_id()
 
     # ── 5. Resolve diplotype ──────────────────────────────────────────
-    diplotype_result = resolve_diplotype(variants, gene)
+    with metrics.timed("diplotype"):
+        diplotype_result = resolve_diplotype(variants, gene, kb)
 
     if diplotype_result is None:
-        return _build_unknown_response(drug_upper, gene, variants)
+        return _build_unknown_response(drug_upper, gene, variants, patient_id, kb), None
 
     # ── 6. Infer phenotype ────────────────────────────────────────────
-    phenotype = infer_phenotype(gene, diplotype_result["star_alleles"])
+    with metrics.timed("phenotype"):
+        phenotype = infer_phenotype(gene, diplotype_result["star_alleles"], kb)
 
     # ── 7. Compute dynamic confidence from matched variant signals ────
     matched = diplotype_result["matched_variants"]
-    confidence = compute_confidence(matched)
+    with metrics.timed("confidence"):
+        confidence = compute_confidence(matched)
 
     # ── 8. Assess drug risk ───────────────────────────────────────────
-    risk = assess_drug_risk(drug_upper, phenotype["phenotype_code"], confidence)
+    with metrics.timed("risk"):
+        risk = assess_drug_risk(drug_upper, phenotype["phenotype_code"], confidence, kb)
 
-    # ── 9. LLM explanation (LAST — purely explanatory) ────────────────
-    explanation = generate_explanation(
+    explanation_args = dict(
         drug=drug_upper,
         gene=gene,
         diplotype=diplotype_result["diplotype"],
@@ -175,7 +709,7 @@ async def analyze(
     )
 
     return {
-        "patient_id": f"PATIENT_{uuid.uuid4().hex[:6].upper()}",
+        "patient_id": patient_id,
         "drug":        drug_upper,
         "timestamp":   datetime.utcnow().isoformat() + "Z",
         "risk_assessment": {
@@ -205,19 +739,20 @@ async def analyze(
             "monitoring":        risk.get("monitoring"),
             "cpic_guideline":    risk.get("cpic_guideline"),
         },
-        "llm_generated_explanation": explanation,
+        "llm_generated_explanation": None,  # filled in by _explain
         "quality_metrics": {
             "vcf_parsing_success": True,
             "variants_detected":   len(variants),
             "gene_coverage":       get_gene_coverage(variants),
             "confidence_basis":    "Dynamic: QUAL + DP + FILTER + CLINSIG weighted scoring",
         },
-    }
+        "knowledge_base_version": kb.version,
+    }, explanation_args
 
 
-def _build_unknown_response(drug: str, gene: str, variants: list) -> dict:
+def _build_unknown_response(drug: str, gene: str, variants: list, patient_id: str, kb: KnowledgeBase) -> dict:
     return {
-        "patient_id": f"PATIENT_{uuid.uuid4().hex[:6].upper()}",
+        "patient_id": patient_id,
         "drug":        drug,
         "timestamp":   datetime.utcnow().isoformat() + "Z",
         "risk_assessment": {
@@ -249,4 +784,5 @@ def _build_unknown_response(drug: str, gene: str, variants: list) -> dict:
             "gene_coverage":       get_gene_coverage(variants),
             "confidence_basis":    f"No {gene} variants detected in VCF",
         },
+        "knowledge_base_version": kb.version,
     }
\ No newline at end of file
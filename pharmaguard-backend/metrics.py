@@ -0,0 +1,213 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# ── Metrics ───────────────────────────────────────────────────────────────────
+# In-process counters and histograms rendered in the Prometheus text format
+# by GET /metrics. Recording is a lock, a dict lookup and an add — cheap
+# enough for every stage of every request. Values are per worker process: with
+# several uvicorn workers each scrape reads whichever worker answers it, so
+# the counts cover that worker only.
+
+# Seconds; spans sub-millisecond lookups up to multi-second parses and LLM calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+_registry: List["_Metric"] = []
+# Per-request stage log, set while a request is profiled or timed for Server-Timing
+_stage_trace: ContextVar[Optional[List[Dict]]] = ContextVar("stage_trace", default=None)
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[n]) for n in self.labels)
+
+    @abstractmethod
+    def samples(self) -> Iterator[Tuple[str, LabelValues, Tuple[str, ...], float]]:
+        """(name suffix, label values, extra label pairs, value) per sample."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield "", key, (), value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # label values → [per-bucket counts (last = +Inf), sum]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                yield "_bucket", key, ("le", _format_value(bound)), cumulative
+            yield "_sum", key, (), total
+            yield "_count", key, (), cumulative
+
+
+class Collected(_Metric):
+    """Values read from elsewhere (cache stats, pool occupancy) at scrape time."""
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        help: str,
+        labels: Tuple[str, ...],
+        collect: Callable[[], Iterable[Tuple[LabelValues, float]]],
+    ):
+        super().__init__(name, help, labels)
+        self.kind = kind
+        self._collect = collect
+
+    def samples(self):
+        for key, value in self._collect():
+            yield "", tuple(str(v) for v in key), (), value
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """
+    Observe the block's wall time under STAGE_SECONDS{stage}; inside
+    trace_stages() also log its wall and thread CPU time.
+    """
+    trace = _stage_trace.get()
+    start = time.perf_counter()
+    cpu = time.thread_time() if trace is not None else 0.0
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - start
+        STAGE_SECONDS.observe(wall, stage=stage)
+        if trace is not None:
+            trace.append({
+                "stage":   stage,
+                "wall_ms": round(wall * 1000, 3),
+                "cpu_ms":  round((time.thread_time() - cpu) * 1000, 3),
+            })
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record a stage timed elsewhere (e.g. a queue wait) as timed() would, without CPU time."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _stage_trace.get()
+    if trace is not None:
+        trace.append({"stage": stage, "wall_ms": round(seconds * 1000, 3), "cpu_ms": None})
+
+
+@contextmanager
+def trace_stages() -> Iterator[List[Dict]]:
+    """Log every timed() stage run in this context (and tasks it starts) into the yielded list."""
+    trace: List[Dict] = []
+    token = _stage_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _stage_trace.reset(token)
+
+
+def server_timing(stages: List[Dict], total_ms: float) -> str:
+    """Server-Timing header value: one entry per stage run (batches repeat stages), then the total."""
+    entries = [f"{entry['stage']};dur={entry['wall_ms']:.3f}" for entry in stages]
+    entries.append(f"total;dur={total_ms:.3f}")
+    return ", ".join(entries)
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for suffix, key, extra, value in metric.samples():
+            pairs = list(zip(metric.labels, key))
+            if extra:
+                pairs.append(extra)
+            labels = ",".join(f'{n}="{_escape(v)}"' for n, v in pairs)
+            lines.append(f"{metric.name}{suffix}{{{labels}}} {_format_value(value)}" if labels
+                         else f"{metric.name}{suffix} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+# ── Pipeline metrics ──────────────────────────────────────────────────────────
+
+STAGE_SECONDS = Histogram(
+    "pharmaguard_stage_seconds",
+    "Wall time of each analysis pipeline stage.",
+    ("stage",),
+)
+VCF_PARSES = Counter("pharmaguard_vcf_parses_total", "VCF parses completed.")
+VCF_BYTES_RECEIVED = Counter("pharmaguard_vcf_bytes_received_total", "VCF bytes received, as uploaded (possibly compressed).")
+VCF_BYTES_DECOMPRESSED = Counter("pharmaguard_vcf_bytes_decompressed_total", "VCF text bytes read after decompression.")
+VCF_RECORDS_PARSED = Counter("pharmaguard_vcf_records_parsed_total", "VCF data rows read.")
+VCF_RECORDS_KEPT = Counter("pharmaguard_vcf_records_kept_total", "VCF data rows kept as pharmacogene variants.")
+
+EXPLANATIONS = Counter(
+    "pharmaguard_explanations_total",
+    "Explanations served, by source (bundle, cache, llm, fallback).",
+    ("source",),
+)
+LLM_CALLS = Counter("pharmaguard_llm_calls_total", "LLM API calls, by outcome (ok, error).", ("outcome",))
+LLM_CALL_SECONDS = Histogram("pharmaguard_llm_call_seconds", "Wall time of LLM API calls.")
+LLM_FALLBACKS = Counter(
+    "pharmaguard_llm_fallbacks_total",
+    "Rule-based explanations served instead of the LLM, by reason (error, timeout).",
+    ("reason",),
+)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 
 class DetectedVariant(BaseModel):
@@ -35,6 +35,8 @@ class LLMExplanation(BaseModel):
     summary: str
     mechanism: str
     variant_citations: List[str]
+    status: Optional[str] = None          # "pending" when deferred
+    explanation_id: Optional[str] = None  # poll /explanations/{id}
 
 
 class QualityMetrics(BaseModel):
@@ -53,3 +55,5 @@ class AnalysisResponse(BaseModel):
     clinical_recommendation: ClinicalRecommendation
     llm_generated_explanation: LLMExplanation
     quality_metrics: QualityMetrics
+    knowledge_base_version: str
+    profile: Optional[Dict] = None  # profile=1 requests only
@@ -0,0 +1,99 @@
+import asyncio
+import contextvars
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Tuple, TypeVar
+
+import metrics
+
+# ── Parse pool ────────────────────────────────────────────────────────────────
+# VCF reading, validation and parsing are CPU-bound and run here rather than
+# on the event loop, so a large upload never stalls other requests. At most
+# PARSE_WORKERS parses run at once and PARSE_QUEUE_DEPTH more may wait; past
+# that, requests are refused with PoolBusy (503 + Retry-After) so latency
+# stays bounded instead of growing with the backlog.
+
+# Parses running at once per worker process
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "2"))
+# Parses allowed to wait for a free worker before new ones are refused
+PARSE_QUEUE_DEPTH = int(os.getenv("PARSE_QUEUE_DEPTH", "8"))
+# Weight of the newest parse in the running average used for Retry-After
+DURATION_SMOOTHING = 0.2
+
+T = TypeVar("T")
+
+
+class PoolBusy(Exception):
+    """Every worker and queue slot is taken; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Parse queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class ParsePool:
+    """
+    Thread pool with admission control. Admission is counted on the event
+    loop; a slot is released when the job itself finishes, not when its
+    caller stops waiting, so abandoned requests still count until their
+    parse is done.
+    """
+
+    def __init__(self, workers: int = PARSE_WORKERS, queue_depth: int = PARSE_QUEUE_DEPTH):
+        self.workers = max(1, workers)
+        self.queue_depth = max(0, queue_depth)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="vcf-parse")
+        self._admitted = 0
+        self._avg_seconds = 1.0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """fn(*args) on a pool thread; raises PoolBusy when the queue is full."""
+        if self._admitted >= self.workers + self.queue_depth:
+            self.rejected += 1
+            raise PoolBusy(self.retry_after())
+
+        loop = asyncio.get_running_loop()
+        self._admitted += 1
+        # Carry the request's context (stage trace) onto the pool thread
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, _timed, time.perf_counter(), fn, *args)
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._release, f))
+        result, _ = await asyncio.wrap_future(future)
+        return result
+
+    def retry_after(self) -> int:
+        """Seconds until a queue slot should free up, from recent parse times."""
+        waves = self._admitted / self.workers
+        return max(1, math.ceil(self._avg_seconds * waves))
+
+    def stats(self) -> Dict:
+        return {
+            "workers":     self.workers,
+            "queue_depth": self.queue_depth,
+            "running":     min(self._admitted, self.workers),
+            "queued":      max(0, self._admitted - self.workers),
+            "completed":   self.completed,
+            "rejected":    self.rejected,
+            "avg_seconds": round(self._avg_seconds, 3),
+        }
+
+    def _release(self, future) -> None:
+        self._admitted -= 1
+        self.completed += 1
+        if future.exception() is None:
+            _, seconds = future.result()
+            self._avg_seconds += DURATION_SMOOTHING * (seconds - self._avg_seconds)
+
+
+def _timed(submitted: float, fn: Callable[..., T], *args) -> Tuple[T, float]:
+    start = time.perf_counter()
+    metrics.observe_stage("parse_queue", start - submitted)
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+pool = ParsePool()
@@ -1,94 +1,52 @@
-from typing import List, Dict
+from typing import Dict, List, Optional
 
-# CPIC phenotype assignments: (allele1, allele2) → (phenotype_code, activity_score, confidence)
-PHENOTYPE_MAP = {
-    "CYP2C9": {
-        ("*1",  "*1"):  ("NM", 2.0, 0.95),
-        ("*1",  "*2"):  ("IM", 1.5, 0.90),
-        ("*1",  "*3"):  ("IM", 1.0, 0.90),
-        ("*2",  "*2"):  ("PM", 1.0, 0.95),
-        ("*2",  "*3"):  ("PM", 0.5, 0.85),
-        ("*3",  "*3"):  ("PM", 0.0, 0.95),
-        ("*1",  "*5"):  ("IM", 1.0, 0.85),
-        ("*1",  "*6"):  ("IM", 1.0, 0.85),
-    },
-    "CYP2D6": {
-        ("*1",  "*1"):  ("NM",  2.0, 0.95),
-        ("*1",  "*2"):  ("NM",  2.0, 0.90),
-        ("*2",  "*2"):  ("URM", 3.0, 0.85),
-        ("*1",  "*4"):  ("IM",  1.0, 0.90),
-        ("*4",  "*4"):  ("PM",  0.0, 0.95),
-        ("*1",  "*10"): ("IM",  1.25, 0.85),
-        ("*1",  "*3"):  ("IM",  1.0, 0.85),
-        ("*1",  "*6"):  ("IM",  1.0, 0.85),
-    },
-    "CYP2C19": {
-        ("*1",  "*1"):  ("NM",  2.0, 0.95),
-        ("*1",  "*2"):  ("IM",  1.0, 0.90),
-        ("*2",  "*2"):  ("PM",  0.0, 0.95),
-        ("*1",  "*3"):  ("IM",  1.0, 0.90),
-        ("*2",  "*3"):  ("PM",  0.0, 0.95),
-        ("*1",  "*17"): ("RM",  2.5, 0.85),
-        ("*17", "*17"): ("URM", 3.0, 0.90),
-        ("*2",  "*17"): ("IM",  1.5, 0.80),
-    },
-    "SLCO1B1": {
-        ("*1",   "*1"):  ("NM", None, 0.95),
-        ("*1",   "*5"):  ("IM", None, 0.90),
-        ("*5",   "*5"):  ("PM", None, 0.95),
-        ("*1",   "*1b"): ("NM", None, 0.85),
-    },
-    "TPMT": {
-        ("*1",  "*1"):  ("NM", None, 0.95),
-        ("*1",  "*2"):  ("IM", None, 0.90),
-        ("*1",  "*3B"): ("IM", None, 0.90),
-        ("*1",  "*3C"): ("IM", None, 0.90),
-        ("*3B", "*3C"): ("PM", None, 0.95),
-        ("*3C", "*3C"): ("PM", None, 0.95),
-    },
-    "DPYD": {
-        ("*1",    "*1"):       ("NM", None, 0.95),
-        ("*1",    "*2A"):      ("IM", None, 0.90),
-        ("*2A",   "*2A"):      ("PM", None, 0.95),
-        ("*1",    "*13"):      ("IM", None, 0.90),
-        ("*1",    "c.2846A>T"):("IM", None, 0.85),
-        ("*1",    "HapB3"):    ("IM", None, 0.85),
-    },
-}
+import knowledge_base
+from knowledge_base import KnowledgeBase
+
+# Phenotype tables, per-allele activity values and CPIC thresholds are
+# knowledge-base data (see knowledge_base.json).
+
+# ── Activity scores ───────────────────────────────────────────────────────────
+# Diplotypes not listed in the phenotype table are resolved from per-allele
+# values summed over both alleles. CYP2D6, CYP2C9 and DPYD use CPIC activity
+# values; CYP2C19, SLCO1B1 and TPMT, which CPIC classifies by allele function,
+# use normal = 1, no/decreased function = 0 and increased (CYP2C19*17) = 1.5.
 
-PHENOTYPE_LABELS = {
-    "PM":  "Poor Metabolizer",
-    "IM":  "Intermediate Metabolizer",
-    "NM":  "Normal Metabolizer",
-    "RM":  "Rapid Metabolizer",
-    "URM": "Ultrarapid Metabolizer",
+# Score-derived calls are less certain than curated table entries
+ACTIVITY_CONFIDENCE = 0.75
+
+UNKNOWN_PHENOTYPE = {
+    "phenotype_code":  "Unknown",
+    "phenotype_label": "Unknown Metabolizer Status",
+    "activity_score":  None,
+    "confidence":      0.5,
 }
 
 
-def infer_phenotype(gene: str, star_alleles: List[str]) -> Dict:
+def infer_phenotype(gene: str, star_alleles: List[str], kb: Optional[KnowledgeBase] = None) -> Dict:
     """
-    Map diplotype star alleles to CPIC phenotype.
-    Tries both orderings of the allele pair.
+    Map diplotype star alleles to CPIC phenotype: the explicit table first
+    (one lookup on the order-independent allele pair), else the summed
+    activity score. Returned dicts may be shared; don't mutate.
     """
-    gene_map = PHENOTYPE_MAP.get(gene, {})
-
-    key_forward = tuple(star_alleles)
-    key_reverse = tuple(reversed(star_alleles))
+    kb = kb or knowledge_base.current()
+    result = kb.phenotype_table.get((gene, tuple(sorted(star_alleles))))
+    if result is not None:
+        return result
+    return _phenotype_from_activity(gene, star_alleles, kb)
 
-    result = gene_map.get(key_forward) or gene_map.get(key_reverse)
 
-    if result:
-        phenotype_code, activity_score, confidence = result
-        return {
-            "phenotype_code":  phenotype_code,
-            "phenotype_label": PHENOTYPE_LABELS.get(phenotype_code, "Unknown"),
-            "activity_score":  activity_score,
-            "confidence":      confidence,
-        }
+def _phenotype_from_activity(gene: str, star_alleles: List[str], kb: KnowledgeBase) -> Dict:
+    activity = kb.allele_activity.get(gene)
+    thresholds = kb.activity_thresholds.get(gene)
+    if not activity or not thresholds or any(a not in activity for a in star_alleles):
+        return UNKNOWN_PHENOTYPE
 
+    score = sum(activity[a] for a in star_alleles)
+    phenotype_code = next(code for bound, code in thresholds if score <= bound)
     return {
-        "phenotype_code":  "Unknown",
-        "phenotype_label": "Unknown Metabolizer Status",
-        "activity_score":  None,
-        "confidence":      0.5,
+        "phenotype_code":  phenotype_code,
+        "phenotype_label": kb.phenotype_labels.get(phenotype_code, "Unknown"),
+        "activity_score":  score if gene in kb.reported_activity_genes else None,
+        "confidence":      ACTIVITY_CONFIDENCE,
     }
@@ -0,0 +1,82 @@
+import cProfile
+import os
+import pstats
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import metrics
+
+# ── Request profiling ─────────────────────────────────────────────────────────
+# Debug mode for one slow request: /analyze with profile=1 runs the whole
+# pipeline on a single thread under cProfile and returns the hottest functions
+# plus per-stage wall and CPU times. Off unless PROFILING_ENABLED is set —
+# profiling costs several times the normal CPU.
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+# Functions listed in the response, by self time
+PROFILE_TOP_FUNCTIONS = int(os.getenv("PROFILE_TOP_FUNCTIONS", "25"))
+# Directory for full .pstats dumps (open with snakeviz / pstats); unset = none
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+
+
+class RequestProfile:
+    """
+    Context manager that profiles the current thread and logs metrics.timed()
+    stages. Use it on a thread that runs nothing but the profiled request.
+    """
+
+    def __init__(self, top: int = PROFILE_TOP_FUNCTIONS):
+        self.top = top
+        self.stages: List[Dict] = []
+        self.wall_ms = 0.0
+        self.cpu_ms = 0.0
+        self.profile_file: Optional[str] = None
+        self._profiler = cProfile.Profile()
+
+    def __enter__(self) -> "RequestProfile":
+        self._trace = metrics.trace_stages()
+        self.stages = self._trace.__enter__()
+        self._start = time.perf_counter()
+        self._cpu = time.thread_time()
+        self._profiler.enable()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._profiler.disable()
+        self.wall_ms = round((time.perf_counter() - self._start) * 1000, 3)
+        self.cpu_ms = round((time.thread_time() - self._cpu) * 1000, 3)
+        self._trace.__exit__(*exc)
+        if PROFILE_DIR:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            self.profile_file = os.path.join(PROFILE_DIR, f"{uuid.uuid4().hex}.pstats")
+            self._profiler.dump_stats(self.profile_file)
+
+    def report(self) -> Dict:
+        return {
+            "wall_ms":       self.wall_ms,
+            "cpu_ms":        self.cpu_ms,
+            "stages":        self.stages,
+            "top_functions": self.top_functions(),
+            "profile_file":  self.profile_file,
+        }
+
+    def top_functions(self) -> List[Dict]:
+        """The `top` functions by self time, with call counts and cumulative time."""
+        stats = pstats.Stats(self._profiler).stats
+        hottest = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:self.top]
+        return [
+            {
+                "function":      _label(filename, line, name),
+                "calls":         calls,
+                "self_ms":       round(self_time * 1000, 3),
+                "cumulative_ms": round(cumulative * 1000, 3),
+            }
+            for (filename, line, name), (_, calls, self_time, cumulative, _) in hottest
+        ]
+
+
+def _label(filename: str, line: int, name: str) -> str:
+    if filename == "~":
+        return name  # built-in, e.g. "<method 'split' of 'bytes' objects>"
+    return f"{name} ({os.path.basename(filename)}:{line})"
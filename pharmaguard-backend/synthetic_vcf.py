@@ -0,0 +1,150 @@
+import gzip
+import random
+import struct
+import zlib
+from typing import Iterator, List, Optional, Tuple
+
+import knowledge_base
+from knowledge_base import KnowledgeBase
+
+# ── Synthetic VCFs ────────────────────────────────────────────────────────────
+# Reproducible test inputs for benchmarks and load tests. Pharmacogene rows
+# are the knowledge base's allele-defining sites (annotated with GENE and the
+# rsID) followed, if more are asked for, by unannotated-ID rows inside the
+# gene regions; everything else is off-target filler on chr1–22. Rows are
+# sorted by position, so a bgzip output can be tabix-indexed.
+
+COMPRESSIONS = ("none", "gzip", "bgzip")
+# chr1 length identifies the build in ##contig (see vcf_parser.detect_build)
+CHR1_LENGTH = {"GRCh38": 248956422, "GRCh37": 249250621}
+# Off-target positions are drawn below this, on every autosome
+FILLER_MAX_POS = 45_000_000
+CLINSIG = ("pathogenic", "likely_pathogenic", "risk_factor", "uncertain_significance", "benign")
+BASES = "ACGT"
+
+# Uncompressed bytes per BGZF block (bgzip's own block size)
+BGZF_BLOCK_SIZE = 0xff00
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def generate(
+    records: int,
+    pgx_fraction: float = 0.01,
+    samples: int = 1,
+    phased: bool = False,
+    build: str = "GRCh38",
+    missing_rate: float = 0.01,
+    seed: int = 0,
+    kb: Optional[KnowledgeBase] = None,
+) -> Iterator[str]:
+    """VCF lines (newline-terminated): `records` data rows, ~pgx_fraction of them on pharmacogenes."""
+    kb = kb or knowledge_base.current()
+    rng = random.Random(seed)
+    n_pgx = min(records, round(records * pgx_fraction))
+
+    rows = _pgx_rows(n_pgx, build, rng, kb)
+    taken = {(chrom, pos) for chrom, pos, *_ in rows}
+    while len(rows) < records:
+        chrom, pos = str(rng.randint(1, 22)), rng.randint(1, FILLER_MAX_POS)
+        if (chrom, pos) in taken:
+            continue
+        taken.add((chrom, pos))
+        ref, alt = rng.sample(BASES, 2)
+        rows.append((chrom, pos, ".", ref, alt, None))
+    rows.sort(key=lambda r: (int(r[0]), r[1]))
+
+    yield from _header(samples, build)
+    for chrom, pos, rsid, ref, alt, gene in rows:
+        af = rng.uniform(0.01, 0.5)
+        info = f"DP={rng.randint(10, 200)};AF={af:.3f}"
+        if gene is not None:
+            info = f"GENE={gene};{info};CLINSIG={rng.choice(CLINSIG)}"
+        calls = "\t".join(_call(rng, af, phased, missing_rate) for _ in range(samples))
+        filt = "PASS" if rng.random() > 0.05 else "LowQual"
+        yield f"{chrom}\t{pos}\t{rsid}\t{ref}\t{alt}\t{rng.randint(20, 99)}\t{filt}\t{info}\tGT:DP:GQ\t{calls}\n"
+
+
+def generate_bytes(compression: str = "none", **params) -> bytes:
+    """generate() as one encoded file: plain, gzip or BGZF (bgzip)."""
+    data = "".join(generate(**params)).encode()
+    return compress(data, compression)
+
+
+def compress(data: bytes, compression: str) -> bytes:
+    if compression == "none":
+        return data
+    if compression == "gzip":
+        return gzip.compress(data, mtime=0)
+    if compression == "bgzip":
+        return b"".join(_bgzf_blocks(data))
+    raise ValueError(f"Unknown compression {compression!r}; expected one of {COMPRESSIONS}")
+
+
+def write(path: str, compression: str = "none", **params) -> int:
+    """Write a synthetic VCF to `path`; returns its size in bytes."""
+    data = generate_bytes(compression, **params)
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+def _pgx_rows(n: int, build: str, rng: random.Random, kb: KnowledgeBase) -> List[Tuple]:
+    """Allele-defining sites first, then novel rows inside the gene regions."""
+    rows = []
+    for (chrom, pos, ref, alt), (gene, rsid) in kb.position_index.get(build, {}).items():
+        if len(rows) == n:
+            return rows
+        rows.append((chrom, pos, rsid, ref, alt, gene))
+
+    regions = [(gene, region) for gene, region in kb.gene_regions.get(build, {}).items()]
+    if not regions:
+        return rows
+    taken = {(chrom, pos) for chrom, pos, *_ in rows}
+    while len(rows) < n:
+        gene, (chrom, start, end) = rng.choice(regions)
+        pos = rng.randint(start, end)
+        if (chrom, pos) in taken:
+            continue
+        taken.add((chrom, pos))
+        ref, alt = rng.sample(BASES, 2)
+        rows.append((chrom, pos, ".", ref, alt, gene))
+    return rows
+
+
+def _header(samples: int, build: str) -> List[str]:
+    names = "\t".join(f"SAMPLE{i + 1}" for i in range(samples))
+    return [
+        "##fileformat=VCFv4.2\n",
+        "##source=PharmaGuard_synthetic\n",
+        f"##reference={build}\n",
+        f"##contig=<ID=1,length={CHR1_LENGTH.get(build, CHR1_LENGTH['GRCh38'])}>\n",
+        '##INFO=<ID=GENE,Number=1,Type=String,Description="Gene Name">\n',
+        '##INFO=<ID=DP,Number=1,Type=Integer,Description="Total Depth">\n',
+        '##INFO=<ID=AF,Number=A,Type=Float,Description="Allele Frequency">\n',
+        '##INFO=<ID=CLINSIG,Number=1,Type=String,Description="Clinical Significance">\n',
+        '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n',
+        '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Read Depth">\n',
+        '##FORMAT=<ID=GQ,Number=1,Type=Integer,Description="Genotype Quality">\n',
+        f"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{names}\n",
+    ]
+
+
+def _call(rng: random.Random, af: float, phased: bool, missing_rate: float) -> str:
+    if rng.random() < missing_rate:
+        gt = ".|." if phased else "./."
+    else:
+        a, b = int(rng.random() < af), int(rng.random() < af)
+        gt = f"{a}|{b}" if phased else f"{min(a, b)}/{max(a, b)}"
+    return f"{gt}:{rng.randint(5, 80)}:{rng.randint(10, 99)}"
+
+
+def _bgzf_blocks(data: bytes) -> Iterator[bytes]:
+    """BGZF: gzip members of at most BGZF_BLOCK_SIZE input bytes, each recording its size, then EOF."""
+    for i in range(0, len(data), BGZF_BLOCK_SIZE):
+        block = data[i:i + BGZF_BLOCK_SIZE]
+        deflate = zlib.compressobj(6, zlib.DEFLATED, -15)
+        payload = deflate.compress(block) + deflate.flush()
+        # ID1 ID2 CM FLG MTIME XFL OS XLEN | "BC" SLEN BSIZE (total size - 1)
+        header = struct.pack("<4BI2BH2BHH", 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, 18 + len(payload) + 8 - 1)
+        yield header + payload + struct.pack("<II", zlib.crc32(block), len(block))
+    yield BGZF_EOF
@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import batch_runner
+
+SAMPLE_VCF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_test.vcf")
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return {
+        "good":       str(tmp_path / "good.vcf"),
+        "late":       str(tmp_path / "late.vcf"),
+        "out":        str(tmp_path / "results.jsonl"),
+        "checkpoint": str(tmp_path / "results.jsonl.checkpoint"),
+    }
+
+
+def _run(paths, resume=False):
+    return batch_runner.run([paths["good"], paths["late"]], ["WARFARIN"], paths["out"], paths["checkpoint"], resume=resume)
+
+
+def _lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_failed_file_is_retried_on_resume(paths):
+    shutil.copy(SAMPLE_VCF, paths["good"])
+    # "late" is not there yet: an error record, checkpointed as failed
+    assert _run(paths) == (2, 2)
+    assert "error" in _lines(paths["out"])[-1]
+
+    shutil.copy(SAMPLE_VCF, paths["late"])
+    assert _run(paths, resume=True) == (1, 1)
+    # The stale error line is gone, not left beside the new result
+    records = _lines(paths["out"])
+    assert [r["file"] for r in records] == [paths["good"], paths["late"]]
+    assert not any("error" in r for r in records)
+
+    # Now finished; a further resume has nothing to do
+    assert _run(paths, resume=True) == (0, 0)
+    assert len(_lines(paths["out"])) == 2
+
+
+def test_resume_discards_output_past_the_checkpoint(paths):
+    shutil.copy(SAMPLE_VCF, paths["good"])
+    shutil.copy(SAMPLE_VCF, paths["late"])
+    _run(paths)
+    with open(paths["checkpoint"], encoding="utf-8") as f:
+        first = f.readline()
+    with open(paths["checkpoint"], "w", encoding="utf-8") as f:
+        f.write(first)
+    with open(paths["out"], "a", encoding="utf-8") as f:
+        f.write('{"partial": ')
+
+    assert _run(paths, resume=True) == (1, 1)
+    assert [r["file"] for r in _lines(paths["out"])] == [paths["good"], paths["late"]]
+
+
+def test_resume_refuses_a_checkpoint_ahead_of_the_output(paths):
+    shutil.copy(SAMPLE_VCF, paths["good"])
+    shutil.copy(SAMPLE_VCF, paths["late"])
+    _run(paths)
+    with open(paths["out"], "r+b") as f:
+        f.truncate(10)
+
+    with pytest.raises(ValueError, match="rerun without --resume"):
+        _run(paths, resume=True)
+    with open(paths["out"], "rb") as f:
+        assert b"\0" not in f.read()
+
+
+def test_every_result_line_has_the_readme_fields(paths):
+    # Without its CYP2D6 row the sample gets the Unknown record for codeine
+    with open(SAMPLE_VCF, encoding="utf-8") as src, open(paths["good"], "w", encoding="utf-8") as dst:
+        dst.writelines(line for line in src if "GENE=CYP2D6" not in line)
+    batch_runner.run([paths["good"]], ["WARFARIN", "CODEINE"], paths["out"])
+    fields = {"file", "sample", "drug", "gene", "diplotype", "phenotype", "risk_label",
+              "severity", "confidence_score", "action", "variants"}
+    records = _lines(paths["out"])
+    assert [r["diplotype"] == "Unknown" for r in records] == [False, True]
+    assert all(fields <= r.keys() for r in records)
+
+
+def test_unexpected_error_is_recorded_per_file(paths, monkeypatch):
+    shutil.copy(SAMPLE_VCF, paths["good"])
+    shutil.copy(SAMPLE_VCF, paths["late"])
+    original = batch_runner._result
+
+    def fail_on_late(path, *args):
+        if path == paths["late"]:
+            raise KeyError("malformed")
+        return original(path, *args)
+
+    monkeypatch.setattr(batch_runner, "_result", fail_on_late)
+    assert _run(paths) == (2, 2)
+    assert _lines(paths["out"])[-1] == {"file": paths["late"], "error": "KeyError: 'malformed'"}
@@ -0,0 +1,30 @@
+import pytest
+
+import knowledge_base
+import synthetic_vcf
+from cohort_engine import analyze_cohort, analyze_genotype_matrix
+from genotype_matrix import GenotypeMatrixParser
+from vcf_parser import VCFStreamParser
+
+
+def _parse(parser, data: bytes):
+    parser.feed(data)
+    return parser.close()
+
+
+@pytest.mark.parametrize("phased", [False, True])
+def test_matrix_mode_matches_per_sample_mode(phased):
+    kb = knowledge_base.current()
+    data = synthetic_vcf.generate_bytes(
+        records=2000, pgx_fraction=0.05, samples=200, phased=phased, missing_rate=0.05, seed=7, kb=kb,
+    )
+    drugs = list(kb.drug_genes)
+
+    variants = _parse(VCFStreamParser(kb=kb), data)
+    matrix = _parse(GenotypeMatrixParser(kb=kb), data)
+
+    expected = analyze_cohort(variants, drugs, variants.samples, kb)
+    assert analyze_genotype_matrix(matrix, drugs, kb) == expected
+    # The cohort reaches the multi-site alleles, not just single-site calls
+    diplotypes = {cell[0] for row in expected["matrix"] for cell in row}
+    assert {"*1/*3A", "*1/*15"} <= diplotypes
@@ -0,0 +1,37 @@
+import gzip
+
+import pytest
+
+import knowledge_base
+import synthetic_vcf
+from cohort_parallel import _parse_range, _range_limits, parse_matrix_parallel
+from vcf_parser import VCFSizeError
+
+
+@pytest.fixture
+def gzip_vcf(tmp_path):
+    data = synthetic_vcf.generate_bytes("none", records=20000, samples=4)
+    path = tmp_path / "cohort.vcf.gz"
+    path.write_bytes(gzip.compress(data))
+    return str(path), len(data)
+
+
+def test_gzip_range_stops_at_the_limit(gzip_vcf):
+    path, size = gzip_vcf
+    with pytest.raises(VCFSizeError):
+        _parse_range(path, b"", ("gzip", 0, 0, None), knowledge_base.current(), max_bytes=size // 4)
+
+
+def test_gzip_under_the_limit_parses(gzip_vcf):
+    path, size = gzip_vcf
+    matrix = parse_matrix_parallel(path, workers=1, max_bytes=size)
+    assert matrix.samples == ["SAMPLE1", "SAMPLE2", "SAMPLE3", "SAMPLE4"]
+    with pytest.raises(VCFSizeError):
+        parse_matrix_parallel(path, workers=1, max_bytes=size - 1)
+
+
+def test_range_limits_share_by_compressed_size():
+    ranges = [("bgzf", 0, 300, None), ("bgzf", 300, 1000, 200)]
+    assert _range_limits(ranges, 100) == [30, 70]
+    assert _range_limits(ranges[:1], 100) == [100]
+    assert _range_limits(ranges, None) == [None, None]
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+import diplotype_engine
+import knowledge_base
+from diplotype_engine import genotype_code, resolve_diplotype, resolve_haplotypes
+from knowledge_base import HaplotypeIndex, KnowledgeBase
+
+# TPMT: *3B = rs1800460, *3C = rs1142345, *3A = both in cis
+TPMT_3B, TPMT_3C, TPMT_4 = "rs1800460", "rs1142345", "rs1800584"
+# SLCO1B1: *1b = rs2306283, *5 = rs4149056, *15 = both in cis
+SLCO1B1_1B, SLCO1B1_5 = "rs2306283", "rs4149056"
+
+
+def _resolve(gene, genotypes):
+    return resolve_haplotypes(gene, [(rsid, genotype_code(gt)) for rsid, gt in genotypes])
+
+
+@pytest.mark.parametrize("genotypes, expected", [
+    # phased, cis
+    ([(TPMT_3B, "1|0"), (TPMT_3C, "1|0")], ["*1", "*3A"]),
+    ([(TPMT_3B, "0|1"), (TPMT_3C, "0|1")], ["*1", "*3A"]),
+    # phased, trans
+    ([(TPMT_3B, "1|0"), (TPMT_3C, "0|1")], ["*3B", "*3C"]),
+    # unphased: *1/*3A explains both sites with fewer non-reference copies
+    ([(TPMT_3B, "0/1"), (TPMT_3C, "0/1")], ["*1", "*3A"]),
+    # hom + het
+    ([(TPMT_3B, "1/1"), (TPMT_3C, "0/1")], ["*3A", "*3B"]),
+    ([(TPMT_3B, "0/1"), (TPMT_3C, "1/1")], ["*3A", "*3C"]),
+    ([(TPMT_3B, "1/1"), (TPMT_3C, "1/1")], ["*3A", "*3A"]),
+    # single sites
+    ([(TPMT_3C, "0/1")], ["*1", "*3C"]),
+    ([(TPMT_3B, "0/0"), (TPMT_3C, "0/0")], ["*1", "*1"]),
+])
+def test_tpmt(genotypes, expected):
+    assert _resolve("TPMT", genotypes) == expected
+
+
+@pytest.mark.parametrize("genotypes, expected", [
+    ([(SLCO1B1_1B, "1|0"), (SLCO1B1_5, "1|0")], ["*1", "*15"]),
+    ([(SLCO1B1_1B, "1|0"), (SLCO1B1_5, "0|1")], ["*1b", "*5"]),
+    ([(SLCO1B1_1B, "0/1"), (SLCO1B1_5, "0/1")], ["*1", "*15"]),
+    # pair order follows the row where each allele's sites start
+    ([(SLCO1B1_1B, "0/1"), (SLCO1B1_5, "1/1")], ["*15", "*5"]),
+    ([(SLCO1B1_5, "0/1")], ["*1", "*5"]),
+])
+def test_slco1b1_star15(genotypes, expected):
+    assert _resolve("SLCO1B1", genotypes) == expected
+
+
+def test_resolve_diplotype_from_variant_dicts():
+    variants = [
+        {"gene": "TPMT", "rsid": TPMT_3B, "genotype": "0|1"},
+        {"gene": "TPMT", "rsid": TPMT_3C, "genotype": "1|0"},
+        {"gene": "TPMT", "rsid": "rs_unlisted", "genotype": "0/1"},
+    ]
+    result = resolve_diplotype(variants, "TPMT")
+    assert result["diplotype"] == "*3B/*3C"
+    assert [v["rsid"] for v in result["matched_variants"]] == [TPMT_3B, TPMT_3C]
+    assert result["total_variants"] == 3
+    assert resolve_diplotype(variants, "CYP2D6") is None
+
+
+@pytest.fixture
+def best_allele_calls(monkeypatch):
+    calls = []
+    original = HaplotypeIndex.best_allele
+
+    def counting(self, haplotype):
+        calls.append(haplotype)
+        return original(self, haplotype)
+
+    monkeypatch.setattr(HaplotypeIndex, "best_allele", counting)
+    return calls
+
+
+def test_unphased_sites_beyond_the_cap_stay_on_the_first_copy(monkeypatch, best_allele_calls):
+    genotypes = [(TPMT_3B, "0/1"), (TPMT_3C, "0/1"), (TPMT_4, "0/1")]
+    assert _resolve("TPMT", genotypes) == ["*3A", "*4"]
+
+    # *3B seeds the first copy; only *3C is left to phase, *4 joins the first copy
+    monkeypatch.setattr(diplotype_engine, "MAX_UNPHASED_SITES", 1)
+    best_allele_calls.clear()
+    assert _resolve("TPMT", genotypes) == ["*1", "*3A"]
+    assert len(best_allele_calls) == 2 * 2 ** 1
+
+
+def test_phasings_tried_are_capped(best_allele_calls):
+    with open(knowledge_base.KB_PATH, encoding="utf-8") as f:
+        data = json.load(f)
+    sites = [f"rs9000{i:02d}" for i in range(20)]
+    data["star_alleles"]["TESTG"] = {rsid: f"*{i + 2}" for i, rsid in enumerate(sites)}
+    kb = KnowledgeBase(data)
+
+    resolve_haplotypes("TESTG", [(rsid, genotype_code("0/1")) for rsid in sites], kb)
+    assert len(best_allele_calls) == 2 * 2 ** diplotype_engine.MAX_UNPHASED_SITES
@@ -0,0 +1,42 @@
+import json
+
+import explanation_bundle
+
+ENTRY = {
+    "drug": "CLOPIDOGREL", "gene": "CYP2C19", "diplotype": "*1/*2",
+    "phenotype": "Intermediate Metabolizer", "risk_label": "Adjust Dosage", "variants": ["rs4244285"],
+}
+QUERY = ("CLOPIDOGREL", "CYP2C19", "*2/*1", "Intermediate Metabolizer", "Adjust Dosage",
+         [{"rsid": "rs4244285", "genotype": "0/1"}])
+
+
+def test_multiallelic_carrier_counts_the_matched_alt():
+    variants = [
+        {"rsid": "rs4244285", "genotype": "0/2", "alt_index": 2},
+        {"rsid": "rs12248560", "genotype": "0/1", "alt_index": 2},
+        {"rsid": "rs4986893", "genotype": "1|0"},
+    ]
+    assert explanation_bundle._carried_rsids(variants) == ["rs4244285", "rs4986893"]
+
+
+def _bundle(tmp_path, monkeypatch, rules_hash):
+    monkeypatch.setattr(explanation_bundle, "_entries", {})
+    monkeypatch.setattr(explanation_bundle, "_meta", {})
+    path = tmp_path / "bundle.json"
+    path.write_text(json.dumps({
+        "format":     explanation_bundle.BUNDLE_FORMAT,
+        "rules_hash": rules_hash,
+        "entries":    [{**ENTRY, "summary": "s", "mechanism": "m"}],
+    }))
+    explanation_bundle.load(str(path))
+
+
+def test_current_bundle_is_served(tmp_path, monkeypatch):
+    _bundle(tmp_path, monkeypatch, explanation_bundle.rules_hash())
+    assert explanation_bundle.lookup(*QUERY) == {"summary": "s", "mechanism": "m"}
+
+
+def test_stale_bundle_is_bypassed(tmp_path, monkeypatch):
+    _bundle(tmp_path, monkeypatch, "an older knowledge base")
+    assert explanation_bundle.info()["stale"]
+    assert explanation_bundle.lookup(*QUERY) is None
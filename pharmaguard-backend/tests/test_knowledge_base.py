@@ -0,0 +1,25 @@
+import json
+import pickle
+
+import knowledge_base
+from knowledge_base import KnowledgeBase
+
+
+def _version(label: str) -> KnowledgeBase:
+    with open(knowledge_base.KB_PATH, encoding="utf-8") as f:
+        data = json.load(f)
+    data["version"] = label
+    return KnowledgeBase(data)
+
+
+def test_worker_keeps_only_the_latest_restored_version(monkeypatch):
+    monkeypatch.setattr(knowledge_base, "_restored", None)
+    first, second = _version("reload-1"), _version("reload-2")
+
+    restored = pickle.loads(pickle.dumps(first))
+    assert restored.fingerprint == first.fingerprint
+    # Same version again: the compiled snapshot is reused
+    assert pickle.loads(pickle.dumps(first)) is restored
+
+    pickle.loads(pickle.dumps(second))
+    assert knowledge_base._restored.fingerprint == second.fingerprint
@@ -0,0 +1,17 @@
+import pytest
+
+from phenotype_engine import infer_phenotype
+
+
+@pytest.mark.parametrize("alleles, code, score", [
+    (["*2", "*5"], "IM", 1.0),
+    (["*5", "*5"], "IM", 1.0),
+    (["*3", "*5"], "PM", 0.5),
+])
+def test_cyp2c9_star5_is_decreased_function(alleles, code, score):
+    result = infer_phenotype("CYP2C9", alleles)
+    assert (result["phenotype_code"], result["activity_score"]) == (code, score)
+
+
+def test_curated_pair_overrides_scoring():
+    assert infer_phenotype("CYP2C9", ["*1", "*5"])["phenotype_code"] == "IM"
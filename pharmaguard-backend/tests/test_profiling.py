@@ -0,0 +1,38 @@
+import os
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import profiling
+
+SAMPLE_VCF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_test.vcf")
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    with TestClient(main.app) as client:
+        yield client
+
+
+def test_profiled_explanation_runs_outside_the_parse_pool(client, monkeypatch):
+    threads = []
+
+    async def explain(**kwargs):
+        threads.append(threading.current_thread().name)
+        return {"summary": "s", "mechanism": "m", "variant_citations": []}
+
+    monkeypatch.setattr(main, "generate_explanation_async", explain)
+    with open(SAMPLE_VCF, "rb") as f:
+        r = client.post("/analyze", files={"file": ("sample.vcf", f.read())}, data={"drug": "WARFARIN", "profile": "true"})
+
+    assert r.status_code == 200
+    body = r.json()
+    assert body["llm_generated_explanation"]["summary"] == "s"
+    assert threads and not threads[0].startswith("vcf-parse")
+    stages = {s["stage"]: s for s in body["profile"]["stages"]}
+    assert {"parse", "diplotype", "risk", "explanation"} <= stages.keys()
+    assert stages["explanation"]["cpu_ms"] is None
+    assert body["profile"]["top_functions"]
@@ -0,0 +1,40 @@
+from cohort_engine import analyze_genotype_matrix
+from diplotype_engine import resolve_diplotype
+from genotype_matrix import GenotypeMatrixParser
+from vcf_parser import parse_vcf
+
+# GRCh38 rs4244285 (CYP2C19*2) is G>A; the row also carries an unrelated C
+HEADER = (
+    "##fileformat=VCFv4.2\n"
+    "##reference=GRCh38\n"
+    "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tCARRIES_C\tCARRIES_A\n"
+)
+
+
+def _vcf(row_id: str, info: str) -> str:
+    return HEADER + f"chr10\t94781859\t{row_id}\tG\tC,A\t50\tPASS\t{info}\tGT\t0/1\t0/2\n"
+
+
+def _diplotypes(content: str):
+    variants = parse_vcf(content)
+    return {
+        sample: resolve_diplotype([v for v in variants if v["sample"] == sample], "CYP2C19")["diplotype"]
+        for sample in ("CARRIES_C", "CARRIES_A")
+    }
+
+
+def test_multiallelic_row_counts_the_matching_alt():
+    # Unannotated row: matched by coordinate only
+    assert _diplotypes(_vcf(".", "DP=30")) == {"CARRIES_C": "*1/*1", "CARRIES_A": "*1/*2"}
+
+
+def test_annotated_multiallelic_row_counts_the_matching_alt():
+    # GENE tag and known rsID, which alone would skip the coordinate lookup
+    assert _diplotypes(_vcf("rs4244285", "GENE=CYP2C19;DP=30")) == {"CARRIES_C": "*1/*1", "CARRIES_A": "*1/*2"}
+
+
+def test_genotype_matrix_counts_the_matching_alt():
+    parser = GenotypeMatrixParser()
+    parser.feed(_vcf(".", "DP=30").encode())
+    panel = analyze_genotype_matrix(parser.close(), ["CLOPIDOGREL"])
+    assert [cells[0][0] for cells in panel["matrix"]] == ["*1/*1", "*1/*2"]
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import knowledge_base
+import main
+import vcf_cache
+from knowledge_base import KnowledgeBase
+
+SAMPLE_VCF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_test.vcf")
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def sample_vcf() -> bytes:
+    with open(SAMPLE_VCF, "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def edit_kb(monkeypatch):
+    """Activates an edited copy of the knowledge base that keeps its version string."""
+    def edit() -> KnowledgeBase:
+        with open(knowledge_base.KB_PATH, encoding="utf-8") as f:
+            data = json.load(f)
+        data["phenotype_labels"] = {**data["phenotype_labels"], "XX": "Edited"}
+        edited = KnowledgeBase(data)
+        assert edited.version == knowledge_base.current().version
+        monkeypatch.setattr(knowledge_base, "_active", edited)
+        return edited
+    return edit
+
+
+def test_stored_vcf_is_gone_after_knowledge_base_edit(client, sample_vcf, edit_kb):
+    vcf_id = client.post("/vcf", files={"file": ("sample.vcf", sample_vcf)}).json()["vcf_id"]
+    edit_kb()
+
+    r = client.get(f"/vcf/{vcf_id}/analyze", params={"drug": "WARFARIN", "defer_explanation": "true"})
+    assert r.status_code == 410
+    # Dropped, so the client's retry sees it as expired and uploads again
+    assert client.get(f"/vcf/{vcf_id}").status_code == 404
+
+
+def test_upload_is_reparsed_after_knowledge_base_edit(client, sample_vcf, edit_kb):
+    client.post("/vcf", files={"file": ("sample.vcf", sample_vcf)})
+    edited = edit_kb()
+
+    r = client.post(
+        "/analyze",
+        files={"file": ("sample.vcf", sample_vcf)},
+        data={"drug": "WARFARIN", "defer_explanation": "true"},
+    )
+    assert r.status_code == 200
+    cached = vcf_cache.cache.get(hashlib.sha256(sample_vcf).hexdigest())
+    assert cached.knowledge_base_fingerprint == edited.fingerprint
+
+
+def test_upload_is_hashed_on_the_parse_pool(client, sample_vcf, monkeypatch):
+    threads = []
+    upload_hash = main._upload_hash
+
+    def recording(upload):
+        threads.append(threading.current_thread().name)
+        return upload_hash(upload)
+
+    monkeypatch.setattr(main, "_upload_hash", recording)
+    for _ in range(2):  # a parse, then a cache hit
+        r = client.post("/vcf", files={"file": ("sample.vcf", sample_vcf)})
+        assert r.status_code == 200
+    assert len(threads) == 2 and all(name.startswith("vcf-parse") for name in threads)
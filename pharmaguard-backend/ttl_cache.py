@@ -0,0 +1,110 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# ── LRU + TTL cache ───────────────────────────────────────────────────────────
+# Shared by the explanation and parsed-VCF caches: an in-memory LRU with a
+# TTL, optionally backed by an SQLite table so entries survive restarts.
+# Subclasses set TABLE and, for non-JSON values, encode/decode.
+
+
+class TTLCache:
+    TABLE = "entries"
+
+    def __init__(self, max_entries: int, ttl_seconds: float, db_path: Optional[str] = None):
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.TABLE} ("
+                " key TEXT PRIMARY KEY, created REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] <= self._ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+
+            value = self._db_get(key, now)
+            if value is not None:
+                self._store(key, value, now)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        now = time.time()
+        with self._lock:
+            self._store(key, value, now)
+            if self._db is not None:
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO {self.TABLE} (key, created, value) VALUES (?, ?, ?)",
+                    (json.dumps(key), now, self.encode(value)),
+                )
+                self._db.commit()
+
+    def delete(self, key: Hashable) -> bool:
+        """Drop an entry from both tiers; True if it was present."""
+        with self._lock:
+            found = self._entries.pop(key, None) is not None
+            if self._db is not None:
+                cur = self._db.execute(f"DELETE FROM {self.TABLE} WHERE key = ?", (json.dumps(key),))
+                self._db.commit()
+                found = found or cur.rowcount > 0
+            return found
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries":    len(self._entries),
+                "max_entries": self._max_entries,
+                "hits":       self.hits,
+                "misses":     self.misses,
+                "disk_hits":  self.disk_hits,
+                "hit_rate":   round(self.hits / lookups, 4) if lookups else 0.0,
+                "persistent": self._db is not None,
+            }
+
+    def encode(self, value: Any) -> str:
+        return json.dumps(value)
+
+    def decode(self, text: str) -> Any:
+        return json.loads(text)
+
+    def _store(self, key: Hashable, value: Any, now: float) -> None:
+        self._entries[key] = (now, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def _db_get(self, key: Hashable, now: float) -> Optional[Any]:
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            f"SELECT created, value FROM {self.TABLE} WHERE key = ?", (json.dumps(key),)
+        ).fetchone()
+        if row is None or now - row[0] > self._ttl:
+            return None
+        return self.decode(row[1])
@@ -0,0 +1,41 @@
+import json
+import os
+
+from ttl_cache import TTLCache
+from vcf_parser import VariantList
+
+# ── Parsed-VCF cache ──────────────────────────────────────────────────────────
+# Clinicians re-upload the same file once per drug and again on revisits, so
+# the parsed pharmacogene variants are cached by the SHA-256 of the uploaded
+# bytes. A hit skips parsing; GET/HEAD /vcf/{hash} lets a client skip the
+# upload too. The disk tier is opt-in since entries hold patient genotypes.
+
+VCF_CACHE_SIZE = int(os.getenv("VCF_CACHE_SIZE", "256"))
+VCF_CACHE_TTL_SECONDS = float(os.getenv("VCF_CACHE_TTL_SECONDS", "3600"))
+# Path of an SQLite file for the persistent tier; unset = memory only
+VCF_CACHE_DB = os.getenv("VCF_CACHE_DB")
+
+
+class VCFCache(TTLCache):
+    TABLE = "parsed_vcfs"
+
+    def encode(self, value: VariantList) -> str:
+        return json.dumps({
+            "samples":                value.samples,
+            "build":                  value.build,
+            "knowledge_base_version": value.knowledge_base_version,
+            "knowledge_base_fingerprint": value.knowledge_base_fingerprint,
+            "variants":               list(value),
+        })
+
+    def decode(self, text: str) -> VariantList:
+        data = json.loads(text)
+        variants = VariantList(data["variants"])
+        variants.samples = data["samples"]
+        variants.build = data["build"]
+        variants.knowledge_base_version = data.get("knowledge_base_version")
+        variants.knowledge_base_fingerprint = data.get("knowledge_base_fingerprint")
+        return variants
+
+
+cache = VCFCache(VCF_CACHE_SIZE, VCF_CACHE_TTL_SECONDS, VCF_CACHE_DB)
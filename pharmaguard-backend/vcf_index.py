@@ -0,0 +1,341 @@
+import struct
+import zlib
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import knowledge_base
+from knowledge_base import KnowledgeBase
+from vcf_parser import VCFStreamParser, detect_build
+
+# Region-based random access for bgzip-compressed VCFs with a tabix (.tbi)
+# or CSI (.csi) index. Pure Python — only the BGZF blocks overlapping the
+# pharmacogene loci are read and inflated.
+
+TBI_MAGIC = b"TBI\x01"
+CSI_MAGIC = b"CSI\x01"
+BGZF_HEADER_SIZE = 18
+
+# Flank added on both sides of each gene span so upstream promoter alleles
+# (e.g. CYP2C19*17, -806C>T) fall inside the queried region
+GENE_REGION_PADDING = 5000
+
+# tabix indexes use a fixed binning scheme; CSI stores its own
+TBI_MIN_SHIFT = 14
+TBI_DEPTH = 5
+
+
+class VCFIndex:
+    """Parsed .tbi/.csi index: per-contig bins, chunks and linear offsets."""
+
+    def __init__(self, names: List[str], min_shift: int, depth: int):
+        self.names = names
+        self.min_shift = min_shift
+        self.depth = depth
+        self.bins: List[Dict[int, List[Tuple[int, int]]]] = []
+        # tabix: linear index of 16 kb windows; CSI: per-bin lowest offset
+        self.linear: List[List[int]] = []
+        self.loffsets: List[Dict[int, int]] = []
+
+    def ref_id(self, chrom: str) -> Optional[int]:
+        """Look up a contig with or without the "chr" prefix."""
+        bare = chrom[3:] if chrom.lower().startswith("chr") else chrom
+        for candidate in (chrom, bare, "chr" + bare):
+            if candidate in self.names:
+                return self.names.index(candidate)
+        return None
+
+    def chunks(self, chrom: str, start: int, end: int) -> List[Tuple[int, int]]:
+        """Virtual-offset chunks covering 1-based inclusive [start, end]."""
+        rid = self.ref_id(chrom)
+        if rid is None:
+            return []
+
+        beg = max(start - 1, 0)
+        bins = self.bins[rid]
+        min_off = self._min_offset(rid, beg)
+
+        found = []
+        for b in _reg2bins(beg, end, self.min_shift, self.depth):
+            for cnk_beg, cnk_end in bins.get(b, ()):
+                if cnk_end > min_off:
+                    found.append((max(cnk_beg, min_off), cnk_end))
+        return found
+
+    def _min_offset(self, rid: int, beg: int) -> int:
+        if self.linear[rid]:
+            ioff = self.linear[rid]
+            window = beg >> self.min_shift
+            return ioff[min(window, len(ioff) - 1)]
+
+        loffsets = self.loffsets[rid]
+        if not loffsets:
+            return 0
+        # Walk up from the leaf bin containing `beg` to the first bin present
+        b = _bin_first(self.depth) + (beg >> self.min_shift)
+        while b > 0 and b not in loffsets:
+            b = (b - 1) >> 3
+        return loffsets.get(b, 0)
+
+
+def read_index(data: bytes) -> VCFIndex:
+    """Parse a .tbi or .csi index (both are BGZF-compressed on disk)."""
+    raw = b"".join(_inflate_all_blocks(data))
+    magic = raw[:4]
+    if magic == TBI_MAGIC:
+        return _read_tbi(raw)
+    if magic == CSI_MAGIC:
+        return _read_csi(raw)
+    raise ValueError("Not a tabix (.tbi) or CSI (.csi) index")
+
+
+def target_regions(build: Optional[str], kb: Optional[KnowledgeBase] = None) -> List[Tuple[str, int, int]]:
+    """
+    Padded pharmacogene regions for `build`; the union over all builds when
+    the build is unknown (costs a few extra blocks, never misses a locus).
+    """
+    gene_regions = (kb or knowledge_base.current()).gene_regions
+    builds = [build] if build in gene_regions else list(gene_regions)
+    regions = set()
+    for b in builds:
+        for chrom, start, end in gene_regions[b].values():
+            regions.add((chrom, max(start - GENE_REGION_PADDING, 1), end + GENE_REGION_PADDING))
+    return sorted(regions)
+
+
+def parse_indexed_vcf(
+    fileobj: BinaryIO,
+    index: VCFIndex,
+    build: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    parser_cls: type = VCFStreamParser,
+    kb: Optional[KnowledgeBase] = None,
+) -> List[Dict]:
+    """
+    Parse only the pharmacogene rows of a BGZF VCF by seeking to the
+    indexed regions. Output matches parse_vcf (or whatever `parser_cls`,
+    a VCFStreamParser subclass, returns from close()).
+    """
+    reader = BGZFReader(fileobj)
+    parser = parser_cls(max_bytes=max_bytes, kb=kb)
+
+    header = reader.read_header()
+    parser.feed(header)
+
+    build = build or detect_build(header.decode("latin-1"))
+    regions = target_regions(build, parser.kb)
+
+    chunks = []
+    for chrom, start, end in regions:
+        chunks.extend(index.chunks(chrom, start, end))
+
+    for line in reader.read_chunks(_merge_chunks(chunks)):
+        if _in_regions(line, regions, index):
+            parser.feed(line + b"\n")
+
+    return parser.close()
+
+
+class BGZFReader:
+    """Random access to a BGZF file through 64-bit virtual offsets."""
+
+    def __init__(self, fileobj: BinaryIO):
+        self._f = fileobj
+
+    def read_block(self, coffset: int) -> Tuple[bytes, int]:
+        """Inflate the block at compressed offset `coffset`; returns (data, next offset)."""
+        self._f.seek(coffset)
+        header = self._f.read(BGZF_HEADER_SIZE)
+        if len(header) < BGZF_HEADER_SIZE:
+            return b"", coffset
+        if header[:2] != b"\x1f\x8b" or not header[3] & 4:
+            raise ValueError("VCF is not BGZF-compressed (use bgzip, not gzip)")
+        block_size = _bgzf_block_size(header)
+        body = self._f.read(block_size - BGZF_HEADER_SIZE)
+        data = zlib.decompress(body[:-8], -15)
+        return data, coffset + block_size
+
+    def read_header(self) -> bytes:
+        """Read the leading `#` lines of the file."""
+        out = []
+        pending = b""
+        coffset = 0
+        while True:
+            data, next_offset = self.read_block(coffset)
+            if not data and next_offset == coffset:
+                break
+            coffset = next_offset
+            lines = (pending + data).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if not line.startswith(b"#"):
+                    return b"\n".join(out) + b"\n"
+                out.append(line)
+        if pending.startswith(b"#"):
+            out.append(pending)
+        return b"\n".join(out) + b"\n"
+
+    def read_chunks(self, chunks: List[Tuple[int, int]]) -> Iterator[bytes]:
+        """Yield every line that starts inside each virtual-offset chunk."""
+        for cnk_beg, cnk_end in chunks:
+            coffset, pos = cnk_beg >> 16, cnk_beg & 0xFFFF
+            end_coffset, end_uoffset = cnk_end >> 16, cnk_end & 0xFFFF
+            carry = b""
+
+            while True:
+                data, next_offset = self.read_block(coffset)
+                if next_offset == coffset:  # end of file
+                    if carry:
+                        yield carry
+                    break
+
+                # A line that started inside the chunk may run past its end
+                if carry:
+                    nl = data.find(b"\n", pos)
+                    if nl == -1:
+                        carry += data[pos:]
+                        coffset, pos = next_offset, 0
+                        continue
+                    yield carry + data[pos:nl]
+                    carry = b""
+                    pos = nl + 1
+
+                if coffset > end_coffset:
+                    break
+
+                limit = end_uoffset if coffset == end_coffset else len(data)
+                while pos < limit:
+                    nl = data.find(b"\n", pos)
+                    if nl == -1:
+                        carry = data[pos:]
+                        break
+                    yield data[pos:nl]
+                    pos = nl + 1
+
+                if coffset == end_coffset and not carry:
+                    break
+                coffset, pos = next_offset, 0
+
+
+def _read_tbi(raw: bytes) -> VCFIndex:
+    n_ref, = struct.unpack_from("<i", raw, 4)
+    # format, col_seq, col_beg, col_end, meta, skip, l_nm
+    l_nm, = struct.unpack_from("<i", raw, 32)
+    names = _split_names(raw[36:36 + l_nm])
+    index = VCFIndex(names, TBI_MIN_SHIFT, TBI_DEPTH)
+
+    pos = 36 + l_nm
+    for _ in range(n_ref):
+        bins, _, pos = _read_bins(raw, pos, with_loffset=False)
+        n_intv, = struct.unpack_from("<i", raw, pos)
+        pos += 4
+        ioff = list(struct.unpack_from(f"<{n_intv}Q", raw, pos))
+        pos += 8 * n_intv
+        index.bins.append(bins)
+        index.linear.append(ioff)
+        index.loffsets.append({})
+    return index
+
+
+def _read_csi(raw: bytes) -> VCFIndex:
+    min_shift, depth, l_aux = struct.unpack_from("<iii", raw, 4)
+    aux = raw[16:16 + l_aux]
+    names = []
+    if l_aux >= 28:
+        # Tabix-style meta block: format, col_seq, col_beg, col_end, meta, skip, l_nm
+        l_nm, = struct.unpack_from("<i", aux, 24)
+        names = _split_names(aux[28:28 + l_nm])
+    index = VCFIndex(names, min_shift, depth)
+
+    pos = 16 + l_aux
+    n_ref, = struct.unpack_from("<i", raw, pos)
+    pos += 4
+    for _ in range(n_ref):
+        bins, loffsets, pos = _read_bins(raw, pos, with_loffset=True)
+        index.bins.append(bins)
+        index.linear.append([])
+        index.loffsets.append(loffsets)
+    return index
+
+
+def _read_bins(raw: bytes, pos: int, with_loffset: bool):
+    n_bin, = struct.unpack_from("<i", raw, pos)
+    pos += 4
+    bins: Dict[int, List[Tuple[int, int]]] = {}
+    loffsets: Dict[int, int] = {}
+    for _ in range(n_bin):
+        bin_id, = struct.unpack_from("<I", raw, pos)
+        pos += 4
+        if with_loffset:
+            loffsets[bin_id], = struct.unpack_from("<Q", raw, pos)
+            pos += 8
+        n_chunk, = struct.unpack_from("<i", raw, pos)
+        pos += 4
+        flat = struct.unpack_from(f"<{2 * n_chunk}Q", raw, pos)
+        pos += 16 * n_chunk
+        bins[bin_id] = list(zip(flat[::2], flat[1::2]))
+    return bins, loffsets, pos
+
+
+def _split_names(blob: bytes) -> List[str]:
+    return [n.decode("latin-1") for n in blob.split(b"\x00") if n]
+
+
+def _bin_first(level: int) -> int:
+    return ((1 << (3 * level)) - 1) // 7
+
+
+def _reg2bins(beg: int, end: int, min_shift: int, depth: int) -> Iterator[int]:
+    """All bins overlapping 0-based half-open [beg, end) — as in htslib."""
+    end -= 1
+    shift = min_shift + 3 * depth
+    offset = 0
+    for level in range(depth + 1):
+        yield from range(offset + (beg >> shift), offset + (end >> shift) + 1)
+        shift -= 3
+        offset += 1 << (3 * level)
+
+
+def _merge_chunks(chunks: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: List[Tuple[int, int]] = []
+    for beg, end in sorted(chunks):
+        if merged and beg <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((beg, end))
+    return merged
+
+
+def _in_regions(line: bytes, regions: List[Tuple[str, int, int]], index: VCFIndex) -> bool:
+    if not line or line[:1] == b"#":
+        return False
+    fields = line.split(b"\t", 2)
+    if len(fields) < 2:
+        return False
+    chrom = fields[0].decode("latin-1")
+    bare = chrom[3:] if chrom.lower().startswith("chr") else chrom
+    try:
+        pos = int(fields[1])
+    except ValueError:
+        return False
+    return any(c == bare and start <= pos <= end for c, start, end in regions)
+
+
+def _bgzf_block_size(header: bytes) -> int:
+    xlen, = struct.unpack_from("<H", header, 10)
+    extra_end = 12 + xlen
+    pos = 12
+    # The BC subfield is normally first, but scan the whole extra block
+    while pos + 4 <= extra_end:
+        si1, si2, slen = header[pos], header[pos + 1], struct.unpack_from("<H", header, pos + 2)[0]
+        if si1 == 66 and si2 == 67 and pos + 6 <= len(header):
+            bsize, = struct.unpack_from("<H", header, pos + 4)
+            return bsize + 1
+        pos += 4 + slen
+    raise ValueError("Missing BGZF block size (BC) field")
+
+
+def _inflate_all_blocks(data: bytes) -> Iterator[bytes]:
+    while data:
+        decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        yield decomp.decompress(data)
+        data = decomp.unused_data
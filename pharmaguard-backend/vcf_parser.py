@@ -1,119 +1,521 @@
-import io
-import vcf as pyvcf  # PyVCF3 — pure Python, works on Windows/Mac/Linux
-from typing import List, Dict, Tuple
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
-TARGET_GENES = {"CYP2D6", "CYP2C19", "CYP2C9", "SLCO1B1", "TPMT", "DPYD"}
+import knowledge_base
+import metrics
+from knowledge_base import KnowledgeBase
+
+MISSING_GENOTYPES = {"./.", ".|."}
+
+# Header signature must appear within this many leading bytes (same window
+# validate_vcf_content has always used)
+HEADER_WINDOW = 500
+
+# Substrings of ##reference / ##assembly lines that identify the build
+BUILD_MARKERS = {
+    "GRCh38": ("grch38", "hg38", "hs38"),
+    "GRCh37": ("grch37", "hg19", "b37", "hs37", "g1k_v37"),
+}
+# chr1 length — present in ##contig lines under either naming style
+CHR1_LENGTH_BUILDS = {"248956422": "GRCh38", "249250621": "GRCh37"}
+
+GZIP_MAGIC = b"\x1f\x8b"
+# Upper bound on text produced per inflate step — keeps a highly compressible
+# upload from expanding into one huge buffer
+INFLATE_CHUNK_SIZE = 256 * 1024
+
+
+class VCFValidationError(ValueError):
+    """Upload is not a VCF at all (as opposed to a VCF we failed to parse)."""
+
+
+class VCFSizeError(ValueError):
+    """Decompressed VCF text exceeded the configured byte limit."""
+
+
+class VariantList(list):
+    """
+    Parsed variant dicts, plus file-level context the dicts do not carry:
+    every sample column (including samples with no called pharmacogene
+    variants), the reference build and the version and fingerprint of the
+    knowledge base whose sites selected the rows. `by_gene` buckets the same dicts by
+    gene so per-drug resolution never scans the whole list; add variants
+    with add() to keep it in step.
+    """
+
+    def __init__(self, variants: Iterable[Dict] = ()):
+        super().__init__()
+        self.samples: List[str] = []
+        self.build: Optional[str] = None
+        self.knowledge_base_version: Optional[str] = None
+        self.knowledge_base_fingerprint: Optional[str] = None
+        self.by_gene: Dict[str, List[Dict]] = {}
+        self.add(variants)
+
+    def add(self, variants: Iterable[Dict]) -> None:
+        for v in variants:
+            self.append(v)
+            self.by_gene.setdefault(v["gene"], []).append(v)
 
 
 def parse_vcf(content: str) -> List[Dict]:
     """
-    Industry-grade VCF parsing using PyVCF3.
-    Pure Python — works on Windows, Mac, Linux with no C dependencies.
+    Fast line-oriented VCF parsing — pure Python, no C dependencies.
     Handles VCF v4.1/4.2, multiallelic sites, missing fields gracefully.
     """
-    variants = []
+    return parse_vcf_lines(content.splitlines())
+
+
+def parse_vcf_lines(lines: Iterable[str]) -> List[Dict]:
+    parser = VCFStreamParser(validate=False)
+    for line in lines:
+        parser.feed_line(line)
+    return parser.close()
+
+
+class VCFStreamParser:
+    """
+    Incremental VCF parser: feed raw upload chunks, get variant dicts.
+
+    Only a partial trailing line is ever buffered, so memory is bounded by
+    the chunk size rather than the file size. Off-target rows are rejected
+    with a byte-level substring test and a single look at the INFO `GENE=`
+    token; only pharmacogene rows (and header lines) are decoded to str.
+
+    With validate=True the ##fileformat signature is checked as soon as the
+    first HEADER_WINDOW bytes have arrived, and #CHROM must precede the
+    first data row; failures raise VCFValidationError.
+
+    gzip and BGZF (bgzip) input is detected from the magic bytes and
+    inflated incrementally. `max_bytes` caps the decompressed text read so
+    far; `bytes_in` counts raw (possibly compressed) bytes received.
+
+    Rows without a usable GENE tag or rsID are still kept when their
+    (chrom, pos, ref, alt) is an allele-defining site of the knowledge base
+    (`kb`, default the active one) for the reference build (given, or
+    detected from the header; both builds are tried when unknown). "chr"
+    prefixes are ignored.
+    """
+
+    def __init__(
+        self,
+        validate: bool = True,
+        max_bytes: Optional[int] = None,
+        build: Optional[str] = None,
+        kb: Optional[KnowledgeBase] = None,
+    ):
+        self.kb = kb or knowledge_base.current()
+        self.variants = VariantList()
+        self.samples: Optional[List[str]] = None
+        self.build = build
+        self._positions = self.kb.position_index["any"]
+        self._site_keys = self.kb.site_keys["any"]
+        self.bytes_in = 0
+        self.bytes_read = 0
+        self.records_read = 0
+        self.records_kept = 0
+        self.compressed = False
+        self._validate = validate
+        self._max_bytes = max_bytes
+        self._inflater: Optional[_GzipInflater] = None
+        self._sniff = b""
+        self._head = b""
+        self._head_checked = not validate
+        self._pending = b""
+
+    def feed(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        self.bytes_in += len(chunk)
+
+        if self._sniff is not None:
+            # Need two bytes to tell gzip from plain text
+            chunk = self._sniff + chunk
+            if len(chunk) < len(GZIP_MAGIC):
+                self._sniff = chunk
+                return
+            self._sniff = None
+            if chunk.startswith(GZIP_MAGIC):
+                self.compressed = True
+                self._inflater = _GzipInflater()
+
+        if self._inflater is None:
+            self._feed_text(chunk)
+        else:
+            for piece in self._inflater.feed(chunk):
+                self._feed_text(piece)
+
+    def _feed_text(self, chunk: bytes) -> None:
+        self.bytes_read += len(chunk)
+        if self._max_bytes is not None and self.bytes_read > self._max_bytes:
+            raise VCFSizeError(f"VCF exceeds {self._max_bytes} byte limit")
+
+        if not self._head_checked:
+            self._head += chunk[:HEADER_WINDOW - len(self._head)]
+            if len(self._head) >= HEADER_WINDOW:
+                self._check_head()
+
+        if b"\r" in chunk:
+            # Windows / classic-Mac line endings; a \r\n split across two
+            # chunks just yields an empty line, which is skipped.
+            chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+        data = self._pending + chunk if self._pending else chunk
+        lines = data.split(b"\n")
+        self._pending = lines.pop()
+
+        for raw in lines:
+            self._feed_raw(raw)
+
+    def close(self) -> List[Dict]:
+        if self._sniff:
+            self._feed_text(self._sniff)
+        self._sniff = None
+        if self._inflater is not None:
+            self._inflater.close()
+
+        if self._pending:
+            self._feed_raw(self._pending)
+            self._pending = b""
+
+        if not self._head_checked:
+            self._check_head()
+
+        if self.samples is None:
+            if self._validate:
+                raise VCFValidationError("Missing #CHROM header line")
+            raise ValueError("VCF file has no sample data")
+
+        self.variants.samples = self.samples
+        self.variants.build = self.build
+        self.variants.knowledge_base_version = self.kb.version
+        self.variants.knowledge_base_fingerprint = self.kb.fingerprint
+        self._record_metrics()
+        return self.variants
+
+    def _record_metrics(self) -> None:
+        metrics.VCF_PARSES.inc()
+        metrics.VCF_BYTES_RECEIVED.inc(self.bytes_in)
+        metrics.VCF_BYTES_DECOMPRESSED.inc(self.bytes_read)
+        metrics.VCF_RECORDS_PARSED.inc(self.records_read)
+        metrics.VCF_RECORDS_KEPT.inc(self.records_kept)
+
+    def _feed_raw(self, raw: bytes) -> None:
+        if raw[:1] != b"#":
+            self.records_read += 1
+            # Cheap pre-filter: almost every row of a real VCF is off-target
+            if b"GENE=" not in raw and not self._site_hit(raw):
+                if raw.strip() and self.samples is None:
+                    self._missing_chrom()
+                return
+        self.feed_line(_decode(raw))
+
+    def _site_hit(self, raw: bytes) -> bool:
+        fields = raw.split(b"\t", 2)
+        if len(fields) < 3:
+            return False
+        chrom = fields[0]
+        if chrom[:3].lower() == b"chr":
+            chrom = chrom[3:]
+        return (chrom, fields[1]) in self._site_keys
+
+    def feed_line(self, line: str) -> None:
+        line = line.rstrip("\r\n")
+        if not line:
+            return
+
+        if line[0] == "#":
+            # Only #CHROM and the build-identifying meta-lines matter; other
+            # ## lines (including inline comment blocks) carry nothing we use.
+            if line.startswith("#CHROM"):
+                samples = line.split("\t")[9:]
+                if not samples:
+                    raise ValueError("VCF file has no sample data")
+                self.samples = samples
+                if self.build in self.kb.position_index:
+                    self._positions = self.kb.position_index[self.build]
+                    self._site_keys = self.kb.site_keys[self.build]
+            elif self.build is None and self.samples is None:
+                self.build = detect_build(line)
+            return
+
+        if self.samples is None:
+            self._missing_chrom()
+
+        if "GENE=" not in line and not self._site_hit(line.encode("utf-8", "replace")):
+            return
+
+        fields = line.split("\t", 8)
+        if len(fields) < 8:
+            return
 
-    # Normalize line endings (handles Windows \r\n)
-    content = content.replace("\r\n", "\n").replace("\r", "\n")
+        info = fields[7]
+        gene = _info_value(info, "GENE") if "GENE=" in info else None
 
-    # Remove inline ## comment lines that appear AFTER the #CHROM header.
-    # PyVCF3 only expects ## meta-lines before #CHROM; any ## lines after it
-    # are treated as malformed data rows and cause "list index out of range".
-    cleaned_lines = []
-    past_chrom_header = False
-    for line in content.splitlines():
-        if line.startswith("#CHROM"):
-            past_chrom_header = True
-        if past_chrom_header and line.startswith("##"):
-            continue  # drop inline block comments
-        cleaned_lines.append(line)
-    content = "\n".join(cleaned_lines)
+        # Fully annotated biallelic rows need no coordinate lookup; on a
+        # multi-allelic row it also tells which ALT the site's allele is
+        site = None
+        known = self.kb.rsid_index.get(fields[2])
+        if gene not in self.kb.target_genes or known is None or known[0] != gene or "," in fields[4]:
+            site = self._match_site(fields)
 
-    vcf_reader = pyvcf.Reader(fsock=io.StringIO(content))
+        if gene not in self.kb.target_genes:
+            if site is None:
+                return
+            gene = site[0]
 
-    if not vcf_reader.samples:
-        raise ValueError("VCF file has no sample data")
+        # Fill in the canonical rsID when the row's ID is missing or unknown
+        rsid = None
+        if site is not None and site[0] == gene and (known is None or known[0] != gene):
+            rsid = site[1]
+        alt_index = site[2] if site is not None and site[0] == gene else 1
 
-    for record in vcf_reader:
-        gene = _get_info_str(record, "GENE")
+        self.records_kept += 1
+        self._add_record(fields, info, gene, rsid, alt_index)
 
-        if gene not in TARGET_GENES:
+    def _add_record(self, fields: List[str], info: str, gene: str, rsid: Optional[str], alt_index: int = 1) -> None:
+        """Consume a kept pharmacogene row; subclasses may store it differently."""
+        self.variants.add(_decode_record(fields, info, gene, self.samples, rsid, self.kb, alt_index))
+
+    def _match_site(self, fields: List[str]) -> Optional[Tuple[str, str, int]]:
+        """
+        O(1) coordinate lookup of a row against the allele-site index:
+        (gene, rsid, GT number of the matching ALT).
+        """
+        chrom = fields[0]
+        if chrom[:3].lower() == "chr":
+            chrom = chrom[3:]
+        try:
+            pos = int(fields[1])
+        except ValueError:
+            return None
+        ref = fields[3]
+        for i, alt in enumerate(fields[4].split(","), 1):
+            site = self._positions.get((chrom, pos, ref, alt))
+            if site is not None:
+                return site + (i,)
+        return None
+
+    def _check_head(self) -> None:
+        self._head_checked = True
+        if not self._head.strip():
+            raise VCFValidationError("File is empty")
+        if b"##fileformat=VCF" not in self._head:
+            raise VCFValidationError("Not a valid VCF file (missing ##fileformat header)")
+
+    def _missing_chrom(self) -> None:
+        if not self._validate:
+            raise ValueError("VCF file has no sample data")
+        if not self._head_checked:
+            self._check_head()
+        raise VCFValidationError("Missing #CHROM header line")
+
+
+class _GzipInflater:
+    """
+    Incremental gzip decoder that also handles multi-member streams — BGZF
+    is a series of small gzip members, which zlib alone stops after the
+    first of.
+    """
+
+    def __init__(self):
+        self._decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._in_member = False
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        try:
+            while data:
+                self._in_member = True
+                out = self._decomp.decompress(data, INFLATE_CHUNK_SIZE)
+                if out:
+                    yield out
+                if self._decomp.eof:
+                    data = self._decomp.unused_data
+                    self._decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    self._in_member = False
+                    continue
+                data = self._decomp.unconsumed_tail
+                # Output capped at the limit may still have more pending
+                while not data and len(out) == INFLATE_CHUNK_SIZE:
+                    out = self._decomp.decompress(b"", INFLATE_CHUNK_SIZE)
+                    if out:
+                        yield out
+        except zlib.error as e:
+            raise ValueError(f"Corrupt gzip stream: {e}")
+
+    def close(self) -> None:
+        if self._in_member:
+            raise ValueError("Truncated gzip stream")
+
+
+def _decode(raw: bytes) -> str:
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("latin-1")
+
+
+def _decode_record(
+    fields: List[str],
+    info: str,
+    gene: str,
+    samples: List[str],
+    rsid_override: Optional[str] = None,
+    kb: Optional[KnowledgeBase] = None,
+    alt_index: int = 1,
+) -> List[Dict]:
+    """Decode a surviving row into one variant dict per called sample."""
+    if len(fields) < 9:
+        return []
+
+    format_and_samples = fields[8].split("\t")
+    gt_index = _gt_index(format_and_samples[0])
+    if gt_index is None:
+        return []
+
+    record = _row_record(fields, info, gene, rsid_override, kb, alt_index)
+
+    variants = []
+    for sample_name, sample_field in zip(samples, format_and_samples[1:]):
+        gt_str = _sample_gt(sample_field, gt_index)
+        if gt_str is None or gt_str in MISSING_GENOTYPES:
             continue
 
-        alt_alleles = [str(a) for a in record.ALT if a is not None]
-
-        for sample in record.samples:
-            gt_data = sample.data
-            gt_str = getattr(gt_data, "GT", None)
-            if gt_str is None or gt_str in ("./.", ".|."):
-                continue
-
-            phased = "|" in gt_str
-
-            variants.append({
-                "rsid":                  record.ID or ".",
-                "gene":                  gene,
-                "chrom":                 record.CHROM,
-                "pos":                   int(record.POS),
-                "ref":                   str(record.REF),
-                "alt":                   ",".join(alt_alleles),
-                "qual":                  float(record.QUAL) if record.QUAL is not None else None,
-                "filter":                _get_filter(record),
-                "genotype":              gt_str,
-                "phased":                phased,
-                "star_allele":           _get_info_str(record, "STAR"),
-                "clinical_significance": _get_info_str(record, "CLINSIG", "Unknown"),
-                "allele_freq":           _get_info_float(record, "AF"),
-                "depth":                 _get_info_int(record, "DP"),
-                "sample":                sample.sample,
-            })
+        variants.append({
+            **record,
+            "genotype": gt_str,
+            "phased":   "|" in gt_str,
+            "sample":   sample_name,
+        })
 
     return variants
 
 
-def _get_info_str(record, key: str, default=None):
-    try:
-        val = record.INFO.get(key)
-        if val is None:
+def _row_record(
+    fields: List[str],
+    info: str,
+    gene: str,
+    rsid_override: Optional[str] = None,
+    kb: Optional[KnowledgeBase] = None,
+    alt_index: int = 1,
+) -> Dict:
+    """
+    Site-level fields of a row, shared by every sample's variant dict.
+    `alt_index` is the GT number of the ALT that defines the star allele.
+    """
+    chrom, pos, rsid, ref, alt, qual, filt = fields[:7]
+    alt_alleles = [a for a in alt.split(",") if a != "."]
+
+    if rsid_override:
+        rsid = rsid_override
+
+    return {
+        "rsid":                  rsid if rsid and rsid != "." else ".",
+        "gene":                  gene,
+        "chrom":                 chrom,
+        "pos":                   int(pos),
+        "ref":                   ref,
+        "alt":                   ",".join(alt_alleles),
+        "qual":                  _to_float(qual, None),
+        "filter":                _get_filter(filt),
+        "star_allele":           _info_value(info, "STAR") or _known_star(rsid, gene, kb),
+        "clinical_significance": _info_value(info, "CLINSIG", "Unknown"),
+        "allele_freq":           _to_float(_info_value(info, "AF"), 0.0),
+        "depth":                 _to_int(_info_value(info, "DP"), 0),
+        "alt_index":             alt_index,
+    }
+
+
+def _known_star(rsid: str, gene: str, kb: Optional[KnowledgeBase] = None) -> Optional[str]:
+    known = (kb or knowledge_base.current()).rsid_index.get(rsid)
+    return known[1] if known is not None and known[0] == gene else None
+
+
+def _info_value(info: str, key: str, default=None) -> Optional[str]:
+    """
+    Pull the first value of `key` out of a raw INFO string without
+    building a dict of every entry.
+    """
+    token = key + "="
+    if info.startswith(token):
+        start = len(token)
+    else:
+        idx = info.find(";" + token)
+        if idx == -1:
             return default
-        if isinstance(val, list):
-            val = val[0]
-        return str(val).strip() if val is not None else default
-    except Exception:
+        start = idx + len(token) + 1
+
+    end = info.find(";", start)
+    value = info[start:] if end == -1 else info[start:end]
+    value = value.split(",", 1)[0].strip()
+    if not value or value == ".":
         return default
+    return value
 
 
-def _get_info_float(record, key: str, default: float = 0.0) -> float:
+def _gt_index(format_field: str) -> Optional[int]:
+    keys = format_field.split(":")
     try:
-        val = record.INFO.get(key)
-        if val is None:
-            return default
-        if isinstance(val, list):
-            val = val[0]
-        return float(val)
-    except (TypeError, ValueError):
-        return default
+        return keys.index("GT")
+    except ValueError:
+        return None
+
+
+def _sample_gt(sample_field: str, gt_index: int) -> Optional[str]:
+    if gt_index == 0:
+        gt = sample_field.split(":", 1)[0]
+    else:
+        parts = sample_field.split(":")
+        if gt_index >= len(parts):
+            return None
+        gt = parts[gt_index]
+    if not gt or gt == ".":
+        return None
+    return gt
 
 
-def _get_info_int(record, key: str, default: int = 0) -> int:
+def _to_float(value: Optional[str], default):
+    if value is None:
+        return default
     try:
-        val = record.INFO.get(key)
-        if val is None:
-            return default
-        if isinstance(val, list):
-            val = val[0]
-        return int(val)
-    except (TypeError, ValueError):
+        return float(value)
+    except ValueError:
         return default
 
 
-def _get_filter(record) -> str:
+def _to_int(value: Optional[str], default: int) -> int:
+    if value is None:
+        return default
     try:
-        if not record.FILTER:
-            return "PASS"
-        return ",".join(record.FILTER)
-    except Exception:
-        return "UNKNOWN"
+        return int(value)
+    except ValueError:
+        return default
+
+
+def _get_filter(filt: str) -> str:
+    if not filt or filt in (".", "PASS"):
+        return "PASS"
+    return ",".join(filt.split(";"))
+
+
+def detect_build(header: str) -> Optional[str]:
+    """
+    Best-effort reference build from VCF meta-lines (##reference / ##contig).
+    Returns "GRCh37", "GRCh38" or None when the header does not say.
+    """
+    for line in header.splitlines():
+        if not line.startswith("##"):
+            continue
+        lowered = line.lower()
+        if lowered.startswith(("##reference", "##assembly")):
+            for build, markers in BUILD_MARKERS.items():
+                if any(m in lowered for m in markers):
+                    return build
+        elif lowered.startswith("##contig=<id=chr1,") or lowered.startswith("##contig=<id=1,"):
+            for length, build in CHR1_LENGTH_BUILDS.items():
+                if f"length={length}" in lowered:
+                    return build
+    return None
 
 
 def get_gene_coverage(variants: List[Dict]) -> List[str]:
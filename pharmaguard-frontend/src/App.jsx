@@ -1,5 +1,5 @@
 import { useState } from 'react'
-import { analyzeVCF } from './api'
+import { analyzeStoredVCFBatch, registerVCF } from './api'
 import DrugInput from './components/DrugInput'
 import FileUpload from './components/FileUpload'
 import ResultCard from './components/ResultCard'
@@ -8,6 +8,7 @@ import { generateReport } from './utils/generateReport'
 
 export default function App() {
   const [file, setFile]           = useState(null)
+  const [vcfId, setVcfId]         = useState(null)
   const [drugs, setDrugs]         = useState([])
   const [results, setResults]     = useState([])
   const [activeIdx, setActiveIdx] = useState(0)
@@ -39,24 +40,18 @@ export default function App() {
     setResults([])
     setActiveIdx(0)
 
-    const settled = await Promise.allSettled(
-      drugs.map(drug => analyzeVCF(file, drug))
-    )
-
-    const successes = []
-    const failures  = []
-
-    settled.forEach((outcome, idx) => {
-      if (outcome.status === 'fulfilled') {
-        successes.push(outcome.value)
-      } else {
-        failures.push(`${drugs[idx]}: ${outcome.reason?.message || 'Failed'}`)
+    // The file is uploaded and parsed once; toggling drugs only re-queries it by ID
+    try {
+      let id = vcfId || await registerVCF(file)
+      let batch = await analyzeStoredVCFBatch(id, drugs)
+      if (batch === null) {
+        id = await registerVCF(file)
+        batch = await analyzeStoredVCFBatch(id, drugs)
       }
-    })
-
-    setResults(successes)
-    if (failures.length > 0) {
-      setError(`Some analyses failed:\n${failures.join('\n')}`)
+      setVcfId(id)
+      setResults(batch || [])
+    } catch (e) {
+      setError(`Analysis failed:\n${e.message}`)
     }
     setLoading(false)
   }
@@ -132,7 +127,7 @@ export default function App() {
         {/* Input Panel */}
         <div className="bg-gray-900 border border-gray-700 rounded-2xl p-6 mb-6">
           <div className="grid grid-cols-1 md:grid-cols-2 gap-6 mb-6">
-            <FileUpload onFileSelect={(f) => { setFile(f); setResults([]); setError(null) }} />
+            <FileUpload onFileSelect={(f) => { setFile(f); setVcfId(null); setResults([]); setError(null) }} />
             <DrugInput
               selected={drugs}
               onToggle={handleToggle}
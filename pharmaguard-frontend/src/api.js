@@ -1,21 +1,40 @@
 const BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
 
-export async function analyzeVCF(file, drug) {
+// Upload and parse a VCF once; later analyses refer to it by ID
+export async function registerVCF(file) {
   const formData = new FormData()
   formData.append('file', file)
-  formData.append('drug', drug)
 
-  const res = await fetch(`${BASE_URL}/analyze`, {
+  const res = await fetch(`${BASE_URL}/vcf`, {
     method: 'POST',
     body: formData,
   })
 
+  if (!res.ok) {
+    const err = await res.json().catch(() => ({ detail: 'Upload failed' }))
+    throw new Error(err.detail || 'Upload failed')
+  }
+
+  const data = await res.json()
+  return data.vcf_id
+}
+
+// Resolves to null when the stored VCF has expired or predates a knowledge-base
+// reload (re-register and retry)
+export async function analyzeStoredVCFBatch(vcfId, drugs) {
+  const params = new URLSearchParams()
+  drugs.forEach(drug => params.append('drugs', drug))
+
+  const res = await fetch(`${BASE_URL}/vcf/${vcfId}/analyze/batch?${params}`)
+
+  if (res.status === 404 || res.status === 410) return null
   if (!res.ok) {
     const err = await res.json().catch(() => ({ detail: 'Analysis failed' }))
     throw new Error(err.detail || 'Analysis failed')
   }
 
-  return res.json()
+  const data = await res.json()
+  return data.results || []
 }
 
 export async function getSupportedDrugs() {
@@ -8,8 +8,7 @@ export default function FileUpload({ onFileSelect }) {
 
   const validate = (file) => {
     if (!file) return 'No file selected.'
-    if (!file.name.endsWith('.vcf')) return 'Only .vcf files are accepted.'
-    if (file.size > 5 * 1024 * 1024) return 'File must be under 5MB.'
+    if (!/\.vcf(\.gz|\.bgz)?$/.test(file.name)) return 'Only .vcf or .vcf.gz files are accepted.'
     return null
   }
 
@@ -50,7 +49,7 @@ export default function FileUpload({ onFileSelect }) {
         <input
           ref={inputRef}
           type="file"
-          accept=".vcf"
+          accept=".vcf,.gz,.bgz"
           className="hidden"
           onChange={(e) => handleFile(e.target.files[0])}
         />
@@ -63,9 +62,9 @@ export default function FileUpload({ onFileSelect }) {
         ) : (
           <div>
             <div className="text-gray-500 text-3xl mb-3">📁</div>
-            <p className="text-gray-300">Drag & drop your .vcf file here</p>
+            <p className="text-gray-300">Drag & drop your .vcf / .vcf.gz file here</p>
             <p className="text-gray-500 text-sm mt-1">or click to browse</p>
-            <p className="text-gray-600 text-xs mt-3">VCF v4.2 • Max 5MB</p>
+            <p className="text-gray-600 text-xs mt-3">VCF v4.2 • plain or gzip/bgzip</p>
           </div>
         )}
       </div>